@@ -1,27 +1,178 @@
 import streamlit as st
 import os
-import boto3
-import json
-import base64
 import uuid
-from datetime import datetime
-from PIL import Image
-import io
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from utils.s3_handler import S3Handler
-from utils.report_generator import generate_pdf_report, generate_txt_report
-from utils.gemini_handler import GeminiHandler
-from utils.image_analyzer_fallback import ImageAnalyzerFallback
+from utils.report_generator import generate_pdf_report_file, generate_txt_report
 from utils.default_analysis import DEFAULT_ANALYSIS
+from utils.inspection_pipeline import analyze_batch_with_fallback, combine_with_fallback, InspectionMemo
+from utils.metrics import start_metrics_server
+from utils.circuit_breaker import gemini_breaker
+from utils import startup_profile
+
+startup_profile.mark("script_start")
 
 # Load environment variables
 load_dotenv()
 
-# Initialize handlers
-s3_handler = S3Handler()
-gemini_handler = GeminiHandler()
-fallback_analyzer = ImageAnalyzerFallback()
+# Start the Prometheus scrape endpoint (once per process)
+start_metrics_server()
+
+# Maximum number of images uploaded/analyzed at the same time
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "4"))
+
+@st.cache_resource
+def get_handlers():
+    """Create the handlers once per process, on first use.
+    
+    Streamlit re-executes the script on every interaction; the handlers
+    (clients, caches, locks) are shared by every rerun and session. They are
+    thread-safe, as sessions run in separate threads. boto3 and the Gemini
+    SDK are imported here, so the first page renders without them. The
+    storage backend is selected with STORAGE_BACKEND ("s3" or "local").
+    
+    Returns:
+        tuple: (S3Handler or LocalStorage, GeminiHandler, ImageAnalyzerFallback)
+    """
+    from utils.storage_backend import create_storage
+    from utils.gemini_handler import GeminiHandler
+    from utils.image_analyzer_fallback import ImageAnalyzerFallback
+    
+    handlers = create_storage(), GeminiHandler(), ImageAnalyzerFallback()
+    startup_profile.mark("handlers_ready")
+    return handlers
+
+
+@st.cache_resource
+def get_inspection_memo():
+    """Return the process-wide memo of inspection results."""
+    return InspectionMemo()
+
+
+@st.cache_resource
+def get_catalog():
+    """Return the process-wide inspection catalog."""
+    from utils.inspection_catalog import InspectionCatalog
+    
+    return InspectionCatalog()
+
+
+@st.cache_data(max_entries=256)
+def stored_rendition(object_key):
+    """Download a stored rendition once, e.g. the gallery of a reopened inspection."""
+    return get_handlers()[0].download_file(object_key)
+
+
+def record_catalog(record, *args):
+    """Record a stage of the inspection in the catalog.
+    
+    The catalog only serves listing and reopening, so a failure is reported
+    and the inspection goes on.
+    
+    Args:
+        record: InspectionCatalog method (e.g. catalog.record_images)
+        *args: Its arguments
+    """
+    try:
+        record(*args)
+    except Exception as e:
+        print(f"Error recording inspection in catalog: {e}")
+        st.warning(f"Não foi possível registrar a vistoria no histórico: {e}")
+
+
+def reopen_inspection(inspection_id):
+    """Load a past inspection from the catalog into the session, without re-running the analysis.
+    
+    Args:
+        inspection_id: Unique ID for the inspection
+    
+    Returns:
+        bool: True if the inspection was found
+    """
+    inspection = get_catalog().get_inspection(inspection_id)
+    if inspection is None:
+        return False
+    
+    s3_handler = get_handlers()[0]
+    st.session_state.inspection_id = inspection_id
+    # A new uploader widget, so the previous upload is not ingested again over the reopened inspection
+    st.session_state.uploader_key += 1
+    st.session_state.upload_ids = ()
+    st.session_state.analysis_results = inspection["combined_analysis"]
+    st.session_state.chat_history = []
+    st.session_state.chat_session = None
+    st.session_state.uploaded_images = []
+    st.session_state.reopened_images = [(image["filename"], image["renditions"].get("gallery"))
+                                        for image in inspection["images"]]
+    st.session_state.report_urls = {
+        'pdf': s3_handler.get_presigned_url(inspection["pdf_key"]) if inspection["pdf_key"] else None,
+        'txt': s3_handler.get_presigned_url(inspection["txt_key"]) if inspection["txt_key"] else None
+    }
+    return True
+
+
+def ingest_uploads(uploaded_files):
+    """Ingest the uploaded files, decoding each one once per session.
+    
+    Ingested images are kept in the session by upload file ID, so reruns
+    reuse them; files removed from the uploader are dropped.
+    
+    Args:
+        uploaded_files: Streamlit UploadedFile objects
+    
+    Returns:
+        list: IngestedImage objects, in upload order
+    """
+    # Imported here so PIL is only loaded once images are uploaded
+    from utils.image_ingest import IngestedImage, ingest_images, unique_names
+    
+    # Repeated file names (e.g. image.jpg from phones) are made unique, so storage keys do not collide
+    names = dict(zip((f.file_id for f in uploaded_files), unique_names([f.name for f in uploaded_files])))
+    ingested = st.session_state.ingested_images
+    new_files = [f for f in uploaded_files if f.file_id not in ingested]
+    for f, image in zip(new_files, ingest_images(((f.getvalue(), names[f.file_id]) for f in new_files),
+                                                 ANALYSIS_MAX_WORKERS)):
+        ingested[f.file_id] = image
+    for file_id, image in ingested.items():
+        if file_id in names and image.name != names[file_id]:
+            ingested[file_id] = IngestedImage(image, names[file_id], image.digest, image.size,
+                                              image.renditions, image.model_params)
+    
+    st.session_state.ingested_images = {f.file_id: ingested[f.file_id] for f in uploaded_files}
+    return [ingested[f.file_id] for f in uploaded_files]
+
+
+inspection_memo = get_inspection_memo()
+
+
+def process_batch(handlers, filenames, contents, inspection_id):
+    """Upload a batch of images and analyze them, falling back to the local analyzer.
+    
+    Runs in a worker thread, so it must not call any Streamlit functions.
+    
+    Args:
+        handlers: (storage, GeminiHandler, ImageAnalyzerFallback) from get_handlers
+        filenames: Names of the uploaded files
+        contents: The ingested images (see ingest_uploads)
+        inspection_id: Unique ID for the inspection
+    
+    Returns:
+        list: For each image, a dict with filename, analysis, structured analysis,
+            image digest (None when the fallback was used), the Gemini
+            error message (None on success) and whether the image was stored
+    """
+    from utils.image_ingest import store_image, wait_stored
+    
+    s3_handler, gemini_handler, fallback_analyzer = handlers
+    
+    # Upload the images and their renditions to S3 in the background, the analysis does not wait for it
+    uploads = [store_image(s3_handler, inspection_id, image) for image in contents]
+    
+    results = analyze_batch_with_fallback(gemini_handler, fallback_analyzer, contents)
+    for filename, upload, result in zip(filenames, uploads, results):
+        result["filename"] = filename
+        result["stored"] = wait_stored(upload)
+    return results
 
 # Set page configuration
 st.set_page_config(
@@ -90,14 +241,24 @@ st.markdown("""
 # Initialize session state
 if 'uploaded_images' not in st.session_state:
     st.session_state.uploaded_images = []
+if 'ingested_images' not in st.session_state:
+    st.session_state.ingested_images = {}
+if 'reopened_images' not in st.session_state:
+    st.session_state.reopened_images = []
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'chat_session' not in st.session_state:
+    st.session_state.chat_session = None
 if 'report_urls' not in st.session_state:
     st.session_state.report_urls = {'pdf': None, 'txt': None}
 if 'inspection_id' not in st.session_state:
     st.session_state.inspection_id = str(uuid.uuid4())
+if 'uploader_key' not in st.session_state:
+    st.session_state.uploader_key = 0
+if 'upload_ids' not in st.session_state:
+    st.session_state.upload_ids = ()
 
 # Sidebar
 with st.sidebar:
@@ -111,86 +272,248 @@ with st.sidebar:
     st.subheader("📸 Upload de Imagens")
     uploaded_files = st.file_uploader("Carregue as imagens do veículo", 
                                      type=["jpg", "jpeg", "png"], 
-                                     accept_multiple_files=True)
+                                     accept_multiple_files=True,
+                                     key=f"uploader_{st.session_state.uploader_key}")
     
     if uploaded_files:
-        st.session_state.uploaded_images = uploaded_files
+        # A new set of images is a new inspection; it never reuses the ID of a reopened one
+        upload_ids = tuple(f.file_id for f in uploaded_files)
+        if upload_ids != st.session_state.upload_ids:
+            st.session_state.upload_ids = upload_ids
+            st.session_state.inspection_id = str(uuid.uuid4())
+        st.session_state.uploaded_images = ingest_uploads(uploaded_files)
+        st.session_state.reopened_images = []
         st.success(f"{len(uploaded_files)} imagens carregadas com sucesso!")
     
+    # The consolidated report is merged locally unless a narrative report is requested
+    narrative_report = st.checkbox("Relatório narrativo (Gemini)", value=False,
+                                   help="Gera o laudo consolidado com o Gemini, em vez da consolidação local instantânea.")
+    
+    # Near-duplicate, blurry and badly exposed photos are not sent to the model
+    pre_triage = st.checkbox("Triagem prévia das imagens", value=True,
+                             help="Analisa uma imagem por grupo de fotos quase idênticas e ignora fotos desfocadas, "
+                                  "escuras ou superexpostas.")
+    
     # Analyze button
     if st.button("🔍 Analisar Imagens", disabled=len(st.session_state.uploaded_images) == 0):
         with st.spinner("Analisando imagens..."):
-            # Process each image
-            image_analyses = []
+            # Process images concurrently with a bounded worker pool.
+            # Streamlit elements can only be touched from the script thread,
+            # so workers just do the I/O and the status blocks are updated here.
+            handlers = get_handlers()
+            s3_handler, gemini_handler, fallback_analyzer = handlers
+            catalog = get_catalog()
+            images = st.session_state.uploaded_images
+            contents = [img_file.getvalue() for img_file in images]
             
-            for img_file in st.session_state.uploaded_images:
-                # Read image
-                img_bytes = img_file.getvalue()
+            # A tiered storage keeps the objects of the inspection in its cache while it runs
+            pinned_id = st.session_state.inspection_id if hasattr(s3_handler, "pin") else None
+            if pinned_id:
+                s3_handler.pin(pinned_id)
+            try:
+                # Re-running an inspection with the same images and options reuses its results
+                memo_key = InspectionMemo.key(st.session_state.inspection_id, contents,
+                                              filenames=tuple(img_file.name for img_file in images),
+                                              narrative=narrative_report, triage=pre_triage)
+                memoized = inspection_memo.get(memo_key)
+                
+                # Pre-flight triage: one image per group of near-duplicates, unusable photos skipped
+                selected = [] if memoized else list(range(len(images)))
+                triage = None
+                skipped_uploads = {}
+                if pre_triage and not memoized:
+                    from utils.image_ingest import store_image, wait_stored
+                    from utils.image_triage import triage_images, describe_issues
+                    
+                    triage = triage_images(contents)
+                    selected = triage.analyze
+                    for i, issues in triage.rejected.items():
+                        st.warning(f"Imagem {images[i].name} não analisada: {describe_issues(issues)}. "
+                                   "Envie uma nova foto.")
+                    if triage.duplicate_of:
+                        st.info("Imagens quase idênticas não analisadas: " +
+                                ", ".join(f"{images[i].name} (igual a {images[rep].name})"
+                                          for i, rep in sorted(triage.duplicate_of.items())))
+                    
+                    # Skipped images are still stored with the inspection
+                    for i in set(range(len(images))) - set(selected):
+                        skipped_uploads[i] = store_image(s3_handler, st.session_state.inspection_id, images[i])
+                
+                if not memoized:
+                    record_catalog(catalog.record_images, st.session_state.inspection_id, images, triage)
                 
-                # Upload to S3
-                img_key = f"uploads/{st.session_state.inspection_id}/{img_file.name}"
-                s3_handler.upload_file_object(img_bytes, img_key)
+                image_analyses = [None] * len(images)
+                errors = {}
+                unstored = []
+                statuses = {i: st.status(f"Analisando imagem {images[i].name}...") for i in selected}
                 
-                # Analyze image using Gemini with fallback
-                with st.status(f"Analisando imagem {img_file.name}..."):
-                    try:
-                        # Try with Gemini first
-                        analysis = gemini_handler.analyze_image(img_bytes)
-                        st.success(f"Análise da imagem {img_file.name} concluída com sucesso!")
-                    except Exception as e:
-                        # If Gemini fails, use fallback analyzer
-                        st.warning(f"API do Gemini indisponível: {str(e)}. Usando analisador local.")
-                        analysis = fallback_analyzer.analyze_image(img_bytes)
-                        st.success(f"Análise da imagem {img_file.name} concluída com analisador local!")
+                # Several images go in each Gemini request; batches run concurrently
+                batches = [[selected[j] for j in batch]
+                           for batch in gemini_handler.plan_batches([contents[i] for i in selected])] if selected else []
+                
+                with ThreadPoolExecutor(max_workers=ANALYSIS_MAX_WORKERS) as executor:
+                    futures = {
+                        executor.submit(process_batch, handlers,
+                                        [images[i].name for i in batch],
+                                        [contents[i] for i in batch],
+                                        st.session_state.inspection_id): batch
+                        for batch in batches
+                    }
                     
-                    # Add analysis to the list
-                    image_analyses.append({
-                        "filename": img_file.name,
-                        "analysis": analysis
-                    })
-            
-            # Generate combined analysis from all images
-            with st.status("Gerando análise combinada..."):
-                try:
-                    # Try with Gemini first
-                    combined_analysis = gemini_handler.generate_combined_analysis(image_analyses)
-                    st.success("Análise combinada gerada com sucesso!")
-                except Exception as e:
-                    # If Gemini fails, use fallback analyzer
-                    st.warning(f"API do Gemini indisponível: {str(e)}. Usando analisador local.")
-                    combined_analysis = fallback_analyzer.generate_combined_analysis(image_analyses)
-                    st.success("Análise combinada gerada com analisador local!")
+                    for future in as_completed(futures):
+                        for i, result in zip(futures[future], future.result()):
+                            status = statuses[i]
+                            with status:
+                                if result["error"]:
+                                    # Gemini failed, the local analyzer was used
+                                    st.warning(f"API do Gemini indisponível: {result['error']}. Usando analisador local.")
+                                    st.success(f"Análise da imagem {result['filename']} concluída com analisador local!")
+                                else:
+                                    st.success(f"Análise da imagem {result['filename']} concluída com sucesso!")
+                            status.update(label=f"Imagem {result['filename']} analisada", state="complete")
+                            
+                            # Keep upload order for a deterministic combined analysis
+                            image_analyses[i] = {
+                                "position": i,
+                                "filename": result["filename"],
+                                "analysis": result["analysis"],
+                                "structured": result["structured"],
+                                "digest": result["digest"]
+                            }
+                            errors[i] = result["error"]
+                            if not result["stored"]:
+                                unstored.append(i)
+                
+                unstored.extend(i for i, upload in skipped_uploads.items() if not wait_stored(upload))
+                if unstored:
+                    st.warning("Falha ao armazenar as imagens: " +
+                               ", ".join(images[i].name for i in sorted(unstored)) +
+                               ". Elas não poderão ser reabertas com a vistoria.")
+                    record_catalog(catalog.record_storage_failures, st.session_state.inspection_id, unstored)
+                
+                image_analyses = [analysis for analysis in image_analyses if analysis is not None]
+                if not memoized:
+                    record_catalog(catalog.record_analyses, st.session_state.inspection_id, image_analyses, errors)
+                
+                # Generate combined analysis from all analyzed images
+                if memoized:
+                    image_analyses, combined_analysis = memoized
+                    st.info("Imagens já analisadas nesta vistoria; reutilizando os resultados.")
+                else:
+                    with st.status("Gerando análise combinada..."):
+                        combined_analysis, error = combine_with_fallback(gemini_handler, fallback_analyzer, image_analyses,
+                                                                         narrative=narrative_report)
+                        if error:
+                            # Gemini failed, the local analyzer was used
+                            st.warning(f"API do Gemini indisponível: {error}. Usando analisador local.")
+                            st.success("Análise combinada gerada com analisador local!")
+                        else:
+                            st.success("Análise combinada gerada com sucesso!")
+                            # Fallback results are not memoized, so a retry can reach Gemini
+                            if all(analysis["digest"] for analysis in image_analyses):
+                                inspection_memo.put(memo_key, (image_analyses, combined_analysis))
+                    record_catalog(catalog.record_combined, st.session_state.inspection_id, combined_analysis,
+                                   image_analyses)
                 
                 # Store the analysis results
                 st.session_state.analysis_results = combined_analysis
-            
-            # Generate reports
-            pdf_content = generate_pdf_report(st.session_state.inspection_id, 
-                                             st.session_state.uploaded_images, 
-                                             combined_analysis)
-            txt_content = generate_txt_report(combined_analysis)
-            
-            # Upload reports to S3
-            pdf_key = f"reports/{st.session_state.inspection_id}/report.pdf"
-            txt_key = f"reports/{st.session_state.inspection_id}/report.txt"
-            
-            s3_handler.upload_file_object(pdf_content, pdf_key)
-            s3_handler.upload_file_object(txt_content.encode('utf-8'), txt_key)
-            
-            # Generate presigned URLs for reports
-            st.session_state.report_urls['pdf'] = s3_handler.get_presigned_url(pdf_key)
-            st.session_state.report_urls['txt'] = s3_handler.get_presigned_url(txt_key)
-            
-            # Show success message
-            st.success("Análise concluída com sucesso!")
+                
+                # Generate reports
+                pdf_path = generate_pdf_report_file(st.session_state.inspection_id, 
+                                                    st.session_state.uploaded_images, 
+                                                    combined_analysis)
+                txt_content = generate_txt_report(combined_analysis)
+                
+                # Upload reports to S3
+                pdf_key = f"reports/{st.session_state.inspection_id}/report.pdf"
+                txt_key = f"reports/{st.session_state.inspection_id}/report.txt"
+                
+                pdf_upload = s3_handler.upload_file_async(pdf_path, pdf_key)
+                txt_upload = s3_handler.upload_file_object_async(txt_content.encode('utf-8'), txt_key)
+                
+                # Generate presigned URLs for reports once they are stored
+                st.session_state.report_urls['pdf'] = s3_handler.get_presigned_url_when_uploaded(pdf_upload, pdf_key)
+                st.session_state.report_urls['txt'] = s3_handler.get_presigned_url_when_uploaded(txt_upload, txt_key)
+                record_catalog(catalog.record_reports, st.session_state.inspection_id, pdf_key, txt_key)
+                
+                # Show success message
+                st.success("Análise concluída com sucesso!")
+            finally:
+                if pinned_id:
+                    s3_handler.unpin(pinned_id)
     
     st.markdown("---")
     
+    # Past inspections, from the catalog
+    with st.expander("📂 Vistorias anteriores"):
+        past = get_catalog().list_inspections(limit=20, status="done")
+        if past:
+            labels = {item["inspection_id"]: f"{item['updated_at'].replace('T', ' ')} · "
+                                             f"{item['image_count']} imagens · {item['severity'] or 'sem danos'}"
+                      for item in past}
+            selected_id = st.selectbox("Vistoria", list(labels), format_func=labels.get)
+            if st.button("Reabrir vistoria"):
+                if reopen_inspection(selected_id):
+                    st.rerun()
+                st.error("Vistoria não encontrada no catálogo.")
+        else:
+            st.caption("Nenhuma vistoria concluída ainda.")
+    
     # Display report links if available
     if st.session_state.report_urls['pdf']:
         st.subheader("📄 Relatórios")
         st.markdown(f"[Baixar Relatório PDF]({st.session_state.report_urls['pdf']})")
         st.markdown(f"[Baixar Relatório TXT]({st.session_state.report_urls['txt']})")
+    
+    # Analysis metrics
+    if gemini_breaker.state != "closed":
+        st.warning("API do Gemini instável: usando o analisador local até a próxima verificação.")
+    
+    with st.expander("📈 Métricas"):
+        st.caption(f"Circuito do Gemini: {gemini_breaker.state}")
+        startup = startup_profile.startup_report()
+        st.caption("Inicialização: " + ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in startup.items()))
+        
+        # Only report handler statistics once they exist; creating them here would defeat the lazy start
+        if startup_profile.has_mark("handlers_ready"):
+            storage, gemini_handler = get_handlers()[:2]
+            if hasattr(storage, "stats"):
+                storage_stats = storage.stats()
+                st.caption(f"Cache do armazenamento: {storage_stats['hits']} acertos, "
+                           f"{storage_stats['revalidated']} revalidados, {storage_stats['misses']} falhas, "
+                           f"{storage_stats['size_bytes'] / (1024 * 1024):.1f} MB, "
+                           f"{storage_stats['pending_uploads']} envios pendentes")
+            cache_stats = gemini_handler.cache.stats()
+            st.caption(f"Cache de análises: {cache_stats['hits']} acertos, {cache_stats['misses']} falhas, "
+                       f"{cache_stats['size_bytes'] / (1024 * 1024):.1f} MB")
+            answer_stats = gemini_handler.answer_cache.stats()
+            st.caption(f"Cache de respostas do chat: {answer_stats['hits']} acertos "
+                       f"({answer_stats['near_hits']} por similaridade), {answer_stats['misses']} falhas")
+            for side, tier_stats in gemini_handler.resolution_stats().items():
+                st.caption(f"Resolução {side}px: {tier_stats['requests']} requisições, "
+                           f"{tier_stats['avg_bytes'] / 1024:.0f} KB/imagem, "
+                           f"{tier_stats['avg_latency_seconds']:.2f} s/imagem")
+
+def render_chat_message(role, content, container=st):
+    """Render a chat message bubble.
+    
+    Args:
+        role: "user" or "assistant"
+        content: Message text
+        container: Streamlit container or placeholder to render into
+    """
+    if role == "user":
+        container.markdown(f"""
+        <div class="chat-message user-message">
+            <div>👤 <b>Você:</b> {content}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        container.markdown(f"""
+        <div class="chat-message assistant-message">
+            <div>🤖 <b>Vistoriador:</b> {content}</div>
+        </div>
+        """, unsafe_allow_html=True)
 
 # Main content
 st.title("Sistema de Vistoria Veicular 🚗")
@@ -201,7 +524,18 @@ if st.session_state.uploaded_images:
     cols = st.columns(3)
     for i, img_file in enumerate(st.session_state.uploaded_images):
         with cols[i % 3]:
-            st.image(img_file, caption=img_file.name, use_column_width=True)
+            st.image(img_file.renditions["gallery"], caption=img_file.name, use_column_width=True)
+elif st.session_state.reopened_images:
+    # Reopened inspection: the stored gallery renditions stand in for the uploads
+    st.header("Imagens da Vistoria")
+    cols = st.columns(3)
+    for i, (filename, gallery_key) in enumerate(st.session_state.reopened_images):
+        gallery = stored_rendition(gallery_key) if gallery_key else None
+        with cols[i % 3]:
+            if gallery:
+                st.image(gallery, caption=filename, use_column_width=True)
+            else:
+                st.caption(f"{filename} (imagem indisponível)")
 
 # Display analysis results
 if st.session_state.analysis_results:
@@ -220,18 +554,7 @@ if st.session_state.analysis_results:
     
     # Display chat history
     for message in st.session_state.chat_history:
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <div>👤 <b>Você:</b> {message["content"]}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="chat-message assistant-message">
-                <div>🤖 <b>Vistoriador:</b> {message["content"]}</div>
-            </div>
-            """, unsafe_allow_html=True)
+        render_chat_message(message["role"], message["content"])
     
     # Chat input form
     with st.form(key="chat_form", clear_on_submit=True):
@@ -239,22 +562,35 @@ if st.session_state.analysis_results:
         submit_button = st.form_submit_button("Enviar")
         
         if submit_button and user_question:
-            # Add user message to chat history
-            st.session_state.chat_history.append({"role": "user", "content": user_question})
+            render_chat_message("user", user_question)
             
-            # Get response from VistoCarroAI
-            with st.spinner("Vistoriador está analisando..."):
-                # Ensure we have analysis results
-                analysis_text = st.session_state.analysis_results
-                if analysis_text is None:
-                    analysis_text = DEFAULT_ANALYSIS
-                    
-                response = gemini_handler.answer_question(user_question, analysis_text)
+            # Ensure we have analysis results
+            analysis_text = st.session_state.analysis_results
+            if analysis_text is None:
+                analysis_text = DEFAULT_ANALYSIS
+            
+            # One chat session per analysis, so the analysis is not re-sent every question
+            chat_session = st.session_state.chat_session
+            if chat_session is None or chat_session.analysis_text != analysis_text:
+                chat_session = get_handlers()[1].start_chat(analysis_text)
+                st.session_state.chat_session = chat_session
+            
+            # Render the answer incrementally as the model produces it
+            placeholder = st.empty()
+            render_chat_message("assistant", "Vistoriador está analisando...", placeholder)
+            response = ""
+            for chunk in chat_session.send_stream(user_question):
+                response += chunk
+                render_chat_message("assistant", response + " ▌", placeholder)
             
-            # Add assistant response to chat history
+            # Add both messages to chat history once the answer is complete
+            st.session_state.chat_history.append({"role": "user", "content": user_question})
             st.session_state.chat_history.append({"role": "assistant", "content": response})
             
             # Force a rerun to update the chat display
             st.rerun()
 else:
-    st.info("Carregue imagens e clique em 'Analisar Imagens' para iniciar a vistoria.")
\ No newline at end of file
+    st.info("Carregue imagens e clique em 'Analisar Imagens' para iniciar a vistoria.")
+
+# Time to the end of the first script run, i.e. the first rendered page
+startup_profile.mark("first_render")
@@ -0,0 +1,299 @@
+"""Headless batch processing of vehicle inspections.
+
+Processes a backlog of inspections without the Streamlit UI, fanning them
+out across a process pool. Each inspection is either a sub-directory of
+images or a line of a JSON-lines manifest:
+
+    {"inspection_id": "claim-123", "images": ["/data/claim-123/1.jpg", ...]}
+
+Results are appended to a JSON-lines status file; inspections already marked
+as done there are skipped, so an interrupted run can simply be restarted.
+
+Usage:
+    python batch_inspect.py /data/inspections --status status.jsonl
+    python batch_inspect.py manifest.jsonl --workers 4 --api-concurrency 2 --storage local
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from utils.storage_backend import STORAGE_BACKENDS, create_storage
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Handlers created once per worker process
+_worker = {}
+
+
+def load_inspections(source):
+    """Load inspections from a directory or a JSON-lines manifest.
+
+    Args:
+        source: Directory with one sub-directory per inspection, or manifest path
+
+    Returns:
+        list: Dictionaries with inspection_id and images (list of paths)
+    """
+    inspections = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            inspection_dir = os.path.join(source, name)
+            if not os.path.isdir(inspection_dir):
+                continue
+            images = [os.path.join(inspection_dir, f) for f in sorted(os.listdir(inspection_dir))
+                      if f.lower().endswith(IMAGE_EXTENSIONS)]
+            if images:
+                inspections.append({"inspection_id": name, "images": images})
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    inspections.append(json.loads(line))
+    return inspections
+
+
+def load_completed(status_path):
+    """Read the IDs of inspections already completed in a previous run.
+
+    Args:
+        status_path: Path of the JSON-lines status file
+
+    Returns:
+        set: Completed inspection IDs
+    """
+    completed = set()
+    if not os.path.exists(status_path):
+        return completed
+    with open(status_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial line from an interrupted run
+                continue
+            if record.get("status") == "done":
+                completed.add(record["inspection_id"])
+    return completed
+
+
+def record_catalog(record, *args):
+    """Record a stage of an inspection in the catalog; a failure does not fail the inspection.
+
+    Args:
+        record: InspectionCatalog method (e.g. catalog.record_images)
+        *args: Its arguments
+    """
+    try:
+        record(*args)
+    except Exception as e:
+        print(f"Error recording inspection in catalog: {e}", file=sys.stderr)
+
+
+def init_worker(storage_type, api_concurrency, narrative, triage):
+    """Create the handlers of a worker process.
+
+    Args:
+        storage_type: "s3" or "local"
+        api_concurrency: Maximum concurrent Gemini calls in this process
+        narrative: Whether the combined report is written by Gemini
+        triage: Whether near-duplicate and unusable images are skipped
+    """
+    load_dotenv()
+    from utils.gemini_handler import GeminiHandler
+    from utils.image_analyzer_fallback import ImageAnalyzerFallback
+    from utils.inspection_catalog import InspectionCatalog
+
+    _worker["storage"] = create_storage(storage_type)
+    _worker["gemini"] = GeminiHandler(max_concurrency=api_concurrency)
+    _worker["fallback"] = ImageAnalyzerFallback()
+    _worker["catalog"] = InspectionCatalog()
+    _worker["api_concurrency"] = api_concurrency
+    _worker["narrative"] = narrative
+    _worker["triage"] = triage
+
+
+def process_inspection(inspection):
+    """Run the full inspection pipeline in a worker process.
+
+    Args:
+        inspection: Dictionary with inspection_id and images
+
+    Returns:
+        dict: Status record for the inspection
+    """
+    from utils.inspection_pipeline import analyze_batch_with_fallback, combine_with_fallback
+    from utils.image_ingest import ingest_file, store_image, unique_names, wait_stored
+    from utils.image_triage import triage_images
+    from utils.report_generator import generate_pdf_report_file, generate_txt_report
+
+    inspection_id = inspection["inspection_id"]
+    storage = _worker["storage"]
+    gemini_handler = _worker["gemini"]
+    fallback_analyzer = _worker["fallback"]
+    catalog = _worker["catalog"]
+    start = time.perf_counter()
+
+    # A tiered storage keeps the objects of the inspection in its cache while it runs
+    pinned = hasattr(storage, "pin")
+    if pinned:
+        storage.pin(inspection_id)
+
+    try:
+        # Each image is decoded once; its renditions serve the model, the report and storage
+        names = unique_names([os.path.basename(path) for path in inspection["images"]])
+        all_images = [ingest_file(path, name) for path, name in zip(inspection["images"], names)]
+
+        # Only one image per group of near-duplicates, unusable photos skipped
+        triage = triage_images(all_images) if _worker["triage"] else None
+        selected = triage.analyze if triage else list(range(len(all_images)))
+        images = [all_images[i] for i in selected]
+        contents = images
+        # Skipped images are stored in the background too; checked once the analysis is done
+        skipped_uploads = {i: store_image(storage, inspection_id, all_images[i])
+                           for i in sorted(set(range(len(all_images))) - set(selected))}
+        record_catalog(catalog.record_images, inspection_id, all_images, triage)
+
+        def analyze(batch):
+            # The analysis does not wait for the uploads, only the results do
+            uploads = [store_image(storage, inspection_id, images[i]) for i in batch]
+            results = analyze_batch_with_fallback(gemini_handler, fallback_analyzer, [contents[i] for i in batch])
+            for result, upload in zip(results, uploads):
+                result["stored"] = wait_stored(upload)
+            return results
+
+        # Several images per API call; per-worker limit on concurrent calls
+        with ThreadPoolExecutor(max_workers=_worker["api_concurrency"]) as executor:
+            results = [result for batch_results in executor.map(analyze, gemini_handler.plan_batches(contents))
+                       for result in batch_results]
+        for img_file, result in zip(images, results):
+            result["filename"] = img_file.name
+
+        # Images that could not be stored are kept out of the catalog's storage keys
+        unstored = [i for i, upload in skipped_uploads.items() if not wait_stored(upload)]
+        unstored += [i for i, r in zip(selected, results) if not r["stored"]]
+        if unstored:
+            print(f"{inspection_id}: failed to store {len(unstored)} image(s)", file=sys.stderr)
+            record_catalog(catalog.record_storage_failures, inspection_id, unstored)
+
+        image_analyses = [{"position": i, "filename": r["filename"], "analysis": r["analysis"],
+                           "structured": r["structured"], "digest": r["digest"]}
+                          for i, r in zip(selected, results)]
+        record_catalog(catalog.record_analyses, inspection_id, image_analyses,
+                       {i: r["error"] for i, r in zip(selected, results)})
+        combined_analysis, combined_error = combine_with_fallback(gemini_handler, fallback_analyzer, image_analyses,
+                                                                  narrative=_worker["narrative"])
+        record_catalog(catalog.record_combined, inspection_id, combined_analysis, image_analyses)
+
+        pdf_path = generate_pdf_report_file(inspection_id, all_images, combined_analysis)
+        txt_content = generate_txt_report(combined_analysis)
+
+        pdf_key = f"reports/{inspection_id}/report.pdf"
+        txt_key = f"reports/{inspection_id}/report.txt"
+        with open(pdf_path, 'rb') as f:
+            pdf_ok = storage.upload_file_object(f.read(), pdf_key)
+        txt_ok = storage.upload_file_object(txt_content.encode('utf-8'), txt_key)
+        if not (pdf_ok and txt_ok):
+            raise RuntimeError("Falha ao armazenar os relatórios")
+        record_catalog(catalog.record_reports, inspection_id, pdf_key, txt_key)
+
+        return {
+            "inspection_id": inspection_id,
+            "status": "done",
+            "images": len(all_images),
+            "analyzed_images": len(images),
+            "duplicate_images": len(triage.duplicate_of) if triage else 0,
+            "rejected_images": len(triage.rejected) if triage else 0,
+            "fallback_images": sum(1 for r in results if r["error"]),
+            "unstored_images": len(unstored),
+            "combined_fallback": combined_error is not None,
+            "pdf_key": pdf_key,
+            "txt_key": txt_key,
+            "seconds": round(time.perf_counter() - start, 3),
+            "finished_at": datetime.now().isoformat()
+        }
+    except Exception as e:
+        return {
+            "inspection_id": inspection_id,
+            "status": "error",
+            "images": len(inspection.get("images", [])),
+            "error": str(e),
+            "seconds": round(time.perf_counter() - start, 3),
+            "finished_at": datetime.now().isoformat()
+        }
+    finally:
+        if pinned:
+            storage.unpin(inspection_id)
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Processa vistorias em lote, sem a interface Streamlit.")
+    parser.add_argument("source", help="Diretório com uma pasta por vistoria, ou manifesto JSON-lines")
+    parser.add_argument("--status", default="batch_status.jsonl", help="Arquivo JSON-lines de status (permite retomar)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Número de processos")
+    parser.add_argument("--api-concurrency", type=int, default=2, help="Chamadas simultâneas à API por processo")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default=os.getenv("STORAGE_BACKEND", "s3"),
+                        help="Destino das imagens e relatórios (padrão: STORAGE_BACKEND)")
+    parser.add_argument("--narrative", action="store_true", help="Gera o laudo consolidado com o Gemini")
+    parser.add_argument("--no-triage", action="store_true",
+                        help="Analisa todas as imagens, sem remover duplicatas nem fotos inutilizáveis")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the batch."""
+    args = parse_args(argv)
+
+    inspections = load_inspections(args.source)
+    completed = load_completed(args.status)
+    pending = [i for i in inspections if i["inspection_id"] not in completed]
+    print(f"{len(inspections)} vistorias, {len(completed)} já concluídas, {len(pending)} pendentes", file=sys.stderr)
+    if not pending:
+        return 0
+
+    start = time.perf_counter()
+    done_inspections = 0
+    done_images = 0
+    failures = 0
+
+    with open(args.status, 'a', encoding='utf-8') as status_file, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                initargs=(args.storage, args.api_concurrency, args.narrative, not args.no_triage)) as executor:
+        futures = [executor.submit(process_inspection, inspection) for inspection in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            status_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            status_file.flush()
+
+            if record["status"] == "done":
+                done_inspections += 1
+                done_images += record["images"]
+            else:
+                failures += 1
+
+            elapsed = time.perf_counter() - start
+            print(f"[{done_inspections + failures}/{len(pending)}] {record['inspection_id']}: {record['status']} "
+                  f"({done_images / elapsed:.2f} imagens/s, {done_inspections * 60 / elapsed:.1f} vistorias/min)",
+                  file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "status": "summary",
+        "inspections": done_inspections,
+        "failures": failures,
+        "images": done_images,
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(done_images / elapsed, 3),
+        "inspections_per_minute": round(done_inspections * 60 / elapsed, 3)
+    }
+    print(json.dumps(summary))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
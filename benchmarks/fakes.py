@@ -0,0 +1,238 @@
+"""Local stand-ins for the Gemini API and S3 used by the benchmark suite.
+
+The fakes reproduce the parts of the google-generativeai and boto3 interfaces
+used by GeminiHandler and S3Handler, with configurable latency and error
+rates, so the pipeline can be measured without network access or cost.
+"""
+import io
+import json
+import time
+import random
+import asyncio
+import threading
+import hashlib
+
+from botocore.exceptions import ClientError
+
+# Canned per-image analysis, in the same format as the local analyzers
+DEFAULT_IMAGE_RESPONSE = """# Análise de Veículo
+
+## Identificação do Veículo
+- Tipo: Hatchback
+- Marca: Volkswagen
+- Cor: prata
+
+## Danos Identificados
+- Para-choque dianteiro: amassado
+- Capô: arranhão
+
+## Severidade dos Danos
+A severidade geral dos danos é classificada como MODERADO.
+
+## Impacto Estrutural
+Possível comprometimento de componentes secundários, mas sem afetar a estrutura principal do veículo.
+
+## Peças Afetadas
+- Para-choque dianteiro
+- Capô
+"""
+
+# Canned structured analysis, returned when a JSON response is requested
+DEFAULT_STRUCTURED_RESPONSE = json.dumps({
+    "vehicle": {"type": "Hatchback", "brand": "Volkswagen", "model": "Gol", "color": "prata"},
+    "damages": [
+        {"part": "para-choque dianteiro", "type": "amassado", "severity": "moderado"},
+        {"part": "capô", "type": "arranhão", "severity": "leve"}
+    ],
+    "structural_impact": False,
+    "structural_notes": "Sem indícios de dano ao chassi.",
+    "confidence": 0.85
+}, ensure_ascii=False)
+
+
+class FakeResponse:
+    """generate_content response with a text attribute."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel with simulated latency and errors."""
+
+    def __init__(self, responses=None, latency=0.5, jitter=0.2, error_rate=0.0, seed=None):
+        """Initialize the fake model.
+
+        Args:
+            responses: Texts replayed in order (cycled), default canned analysis
+            latency: Mean latency of a call in seconds
+            jitter: Random latency added/removed, as a fraction of latency
+            error_rate: Probability that a call raises an exception
+            seed: Random seed for reproducible runs
+        """
+        self.responses = responses or [DEFAULT_IMAGE_RESPONSE]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _next(self):
+        """Pick the delay, failure and response of the next call."""
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+            delay = max(0.0, self.latency * (1 + self._random.uniform(-self.jitter, self.jitter)))
+            fail = self._random.random() < self.error_rate
+        return delay, fail, self.responses[index % len(self.responses)]
+
+    @staticmethod
+    def _wants_json(generation_config):
+        """Check whether the request asked for a JSON response."""
+        if generation_config is None:
+            return False
+        if isinstance(generation_config, dict):
+            return generation_config.get("response_mime_type") == "application/json"
+        return getattr(generation_config, "response_mime_type", None) == "application/json"
+
+    @staticmethod
+    def _batch_count(contents, generation_config):
+        """Number of images in a multi-image request, 0 for a single-image one."""
+        schema = generation_config.get("response_schema") if isinstance(generation_config, dict) \
+            else getattr(generation_config, "response_schema", None)
+        if not isinstance(schema, dict) or "analyses" not in schema.get("properties", {}):
+            return 0
+        return sum(1 for part in contents if isinstance(part, dict) and "data" in part)
+
+    def generate_content(self, contents, stream=False, generation_config=None, **kwargs):
+        delay, fail, text = self._next()
+        if self._wants_json(generation_config):
+            count = self._batch_count(contents, generation_config)
+            if count:
+                item = json.loads(DEFAULT_STRUCTURED_RESPONSE)
+                text = json.dumps({"analyses": [dict(item, image=n) for n in range(1, count + 1)]},
+                                  ensure_ascii=False)
+            else:
+                text = DEFAULT_STRUCTURED_RESPONSE
+        time.sleep(delay)
+        if fail:
+            raise RuntimeError("Fake Gemini error")
+        if stream:
+            return [FakeResponse(word + " ") for word in text.split(" ")]
+        return FakeResponse(text)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    async def generate_content_async(self, contents, **kwargs):
+        delay, fail, text = self._next()
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("Fake Gemini error")
+        return FakeResponse(text)
+
+
+class FakeChatSession:
+    """Stand-in for genai.ChatSession, answering through a FakeGenerativeModel."""
+
+    def __init__(self, model, history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream=False, **kwargs):
+        response = self.model.generate_content(self.history + [{"role": "user", "parts": [content]}],
+                                               stream=stream)
+        text = "".join(chunk.text for chunk in response) if stream else response.text
+        self.history += [{"role": "user", "parts": [content]}, {"role": "model", "parts": [text]}]
+        return response
+
+
+def load_recorded_responses(path):
+    """Load recorded model responses from a JSON list of texts.
+
+    Args:
+        path: Path of the JSON file
+
+    Returns:
+        list: Response texts
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class NullCache:
+    """AnalysisCache replacement that never hits, so every call reaches the model."""
+
+    def get(self, namespace, key):
+        return None
+
+    def put(self, namespace, key, value):
+        return True
+
+    def stats(self):
+        return {"hits": 0, "misses": 0, "evictions": 0, "hit_rate": 0.0, "size_bytes": 0}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client with simulated latency."""
+
+    def __init__(self, latency=0.05, bandwidth_mbps=100.0, error_rate=0.0, seed=None):
+        """Initialize the fake client.
+
+        Args:
+            latency: Fixed latency of each request in seconds
+            bandwidth_mbps: Simulated transfer rate in megabits per second
+            error_rate: Probability that a request raises an exception
+            seed: Random seed for reproducible runs
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth_mbps * 1024 * 1024 / 8
+        self.error_rate = error_rate
+        self.objects = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self, size=0):
+        """Simulate the cost of a request transferring size bytes."""
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency + size / self.bandwidth)
+        if fail:
+            raise RuntimeError("Fake S3 error")
+
+    def put_object(self, Body, Bucket, Key, **kwargs):
+        data = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        self._request(len(data))
+        self.objects[(Bucket, Key)] = data
+        return {"ETag": self._etag(data)}
+
+    @staticmethod
+    def _etag(data):
+        """ETag of a single-part upload: the quoted MD5 of the content."""
+        return f'"{hashlib.md5(data).hexdigest()}"'
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Fileobj, Bucket, Key)
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        with open(Filename, 'rb') as f:
+            self.put_object(f, Bucket, Key)
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+        data = self.objects[(Bucket, Key)]
+        if IfNoneMatch == self._etag(data):
+            self._request()
+            raise ClientError({"Error": {"Code": "304", "Message": "Not Modified"},
+                               "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+        self._request(len(data))
+        return {"Body": io.BytesIO(data), "ContentLength": len(data), "ETag": self._etag(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        data = self.objects[(Bucket, Key)]
+        self._request()
+        return {"ContentLength": len(data), "ETag": self._etag(data)}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600):
+        # Presigning is a local signature computation in boto3
+        return f"https://fake-s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
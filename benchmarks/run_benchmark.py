@@ -0,0 +1,280 @@
+"""End-to-end benchmark of the inspection pipeline against local stand-ins.
+
+Runs ingest -> triage -> upload -> batched image analysis -> combine -> PDF/TXT -> presign -> reopen for a
+number of synthetic inspections, using the fake Gemini model and S3 client
+from benchmarks/fakes.py. Reports p50/p95/p99 per stage and peak memory,
+and optionally compares against a stored baseline.
+
+Usage:
+    python -m benchmarks.run_benchmark --inspections 5 --images 10
+    python -m benchmarks.run_benchmark --storage-cache through
+    python -m benchmarks.run_benchmark --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+import io
+import sys
+import math
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from benchmarks.fakes import FakeGenerativeModel, FakeS3Client, NullCache, load_recorded_responses
+from utils.gemini_handler import GeminiHandler
+from utils.s3_handler import S3Handler
+from utils.image_analyzer_fallback import ImageAnalyzerFallback
+from utils.inspection_pipeline import analyze_batch_with_fallback, combine_with_fallback
+from utils.report_generator import generate_pdf_report_file, generate_txt_report
+from utils.image_ingest import ingest_image, store_image, load_rendition
+from utils.local_storage import LocalStorage
+from utils.tiered_storage import TieredStorage
+from utils.image_triage import triage_images
+
+STAGES = ["ingest", "triage", "upload", "analysis", "combine", "pdf", "txt", "presign", "reopen", "inspection"]
+
+
+class SyntheticImage:
+    """In-memory image with the interface of a Streamlit UploadedFile."""
+
+    def __init__(self, name, content):
+        self.name = name
+        self._content = content
+
+    def getvalue(self):
+        return self._content
+
+
+def make_images(count, width, height, seed, shots=1):
+    """Create synthetic JPEG photos.
+
+    Args:
+        count: Number of images
+        width: Image width in pixels
+        height: Image height in pixels
+        seed: Random seed
+        shots: Near-identical shots per scene (brightness varies slightly),
+            as in a burst of photos of the same damage
+
+    Returns:
+        list: SyntheticImage objects
+    """
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        if i % shots == 0:
+            scene = Image.effect_noise((width, height), rng.uniform(20, 80)).convert("RGB")
+            # Blocks of color, so scenes differ in the low frequencies the hashes look at
+            for _ in range(6):
+                x, y = rng.randrange(width), rng.randrange(height)
+                scene.paste(tuple(rng.randrange(256) for _ in range(3)),
+                            (x, y, min(width, x + width // 3), min(height, y + height // 3)))
+        img = scene.point(lambda value, gain=rng.uniform(0.95, 1.05): min(255, int(value * gain)))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append(SyntheticImage(f"foto_{i + 1}.jpg", buffer.getvalue()))
+    return images
+
+
+def percentile(values, pct):
+    """Return the pct percentile of values (nearest rank)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Timings:
+    """Collects durations per stage."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def measure(self, stage, func, *args):
+        """Run func and record its duration under stage."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+    def summary(self):
+        """Return count, p50, p95 and p99 (in ms) for each stage."""
+        return {
+            stage: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2)
+            }
+            for stage, values in self.samples.items()
+        }
+
+
+def build_handlers(args):
+    """Create the real handlers wired to the local stand-ins."""
+    responses = load_recorded_responses(args.responses) if args.responses else None
+
+    gemini_handler = GeminiHandler(cache=NullCache())
+    gemini_handler.vision_model = FakeGenerativeModel(responses, latency=args.model_latency,
+                                                      error_rate=args.model_error_rate, seed=args.seed)
+    gemini_handler.text_model = FakeGenerativeModel(responses, latency=args.model_latency * 2,
+                                                    error_rate=args.model_error_rate, seed=args.seed)
+
+    s3_handler = S3Handler()
+    s3_handler.bucket_name = "benchmark"
+    s3_handler.s3_client = FakeS3Client(latency=args.s3_latency, error_rate=args.s3_error_rate, seed=args.seed)
+    if args.storage_cache:
+        cache = LocalStorage(base_dir=tempfile.mkdtemp(prefix="vistocarro-cache-"))
+        s3_handler = TieredStorage(s3_handler, cache=cache, write_mode=args.storage_cache)
+
+    return gemini_handler, s3_handler, ImageAnalyzerFallback()
+
+
+def run_inspection(inspection_id, images, handlers, timings, workers, narrative, batch=True, triage=True,
+                   report_dir=None):
+    """Run one inspection through the full pipeline, as app.py does."""
+    gemini_handler, s3_handler, fallback_analyzer = handlers
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = list(executor.map(lambda img_file: timings.measure("ingest", ingest_image, img_file.getvalue(),
+                                                                   img_file.name), images))
+    if triage:
+        analyze_indices = timings.measure("triage", triage_images, images).analyze
+    else:
+        analyze_indices = list(range(len(images)))
+    contents = [images[i] for i in analyze_indices]
+
+    def analyze(indices):
+        results = timings.measure("analysis", analyze_batch_with_fallback,
+                                  gemini_handler, fallback_analyzer, [contents[i] for i in indices])
+        return [{"filename": contents[i].name, "analysis": result["analysis"],
+                 "structured": result["structured"], "digest": result["digest"]}
+                for i, result in zip(indices, results)]
+
+    batches = gemini_handler.plan_batches(contents) if batch else [[i] for i in range(len(contents))]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        uploads = [executor.submit(timings.measure, "upload", store_image, s3_handler, inspection_id, image,
+                                   False)
+                   for image in images]
+        image_analyses = [item for items in executor.map(analyze, batches) for item in items]
+        for upload in uploads:
+            upload.result()
+
+    combined, _ = timings.measure("combine", combine_with_fallback,
+                                  gemini_handler, fallback_analyzer, image_analyses, narrative)
+
+    pdf_path = timings.measure("pdf", generate_pdf_report_file, inspection_id, images, combined,
+                               report_dir)
+    txt_content = timings.measure("txt", generate_txt_report, combined)
+
+    pdf_key = f"reports/{inspection_id}/report.pdf"
+    txt_key = f"reports/{inspection_id}/report.txt"
+    pdf_upload = s3_handler.upload_file_async(pdf_path, pdf_key)
+    txt_upload = s3_handler.upload_file_object_async(txt_content.encode('utf-8'), txt_key)
+    timings.measure("presign", s3_handler.get_presigned_url_when_uploaded, pdf_upload, pdf_key)
+    timings.measure("presign", s3_handler.get_presigned_url_when_uploaded, txt_upload, txt_key)
+
+    # Reopening the inspection reads back the report renditions and the PDF
+    for image in images:
+        timings.measure("reopen", load_rendition, s3_handler, inspection_id, image.name, "report")
+    timings.measure("reopen", s3_handler.download_file, pdf_key)
+
+
+def compare(results, baseline, tolerance):
+    """Compare p95 latencies and peak memory against a baseline.
+
+    Args:
+        results: Current benchmark results
+        baseline: Stored baseline results
+        tolerance: Allowed relative increase (0.2 = 20%)
+
+    Returns:
+        list: Regression messages, empty if none
+    """
+    regressions = []
+    for stage, stats in results["stages"].items():
+        base = baseline["stages"].get(stage)
+        if not base or not base["p95_ms"]:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {stats['p95_ms']} ms > baseline {base['p95_ms']} ms")
+    if results["peak_memory_mb"] > baseline["peak_memory_mb"] * (1 + tolerance):
+        regressions.append(f"peak memory {results['peak_memory_mb']} MB > baseline {baseline['peak_memory_mb']} MB")
+    return regressions
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark of the inspection pipeline with local stand-ins.")
+    parser.add_argument("--inspections", type=int, default=5)
+    parser.add_argument("--images", type=int, default=10, help="Images per inspection")
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=1500)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent images per inspection")
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Mean fake model latency (s)")
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--s3-latency", type=float, default=0.02, help="Fake S3 request latency (s)")
+    parser.add_argument("--s3-error-rate", type=float, default=0.0)
+    parser.add_argument("--responses", help="JSON list of recorded model responses to replay")
+    parser.add_argument("--narrative", action="store_true", help="Combine with the model instead of locally")
+    parser.add_argument("--no-batch", dest="batch", action="store_false",
+                        help="One model request per image instead of multi-image requests")
+    parser.add_argument("--shots", type=int, default=1, help="Near-identical shots per scene")
+    parser.add_argument("--no-triage", dest="triage", action="store_false",
+                        help="Analyze every image, without near-duplicate and quality triage")
+    parser.add_argument("--storage-cache", choices=["through", "back"],
+                        help="Put a local disk cache tier in front of S3, with this write mode")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression vs. baseline")
+    parser.add_argument("--save-baseline", help="Write the results to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run the benchmark."""
+    args = parse_args(argv)
+    handlers = build_handlers(args)
+    timings = Timings()
+
+    tracemalloc.start()
+    # Rendered reports go to a throwaway directory, not the app's report cache
+    with tempfile.TemporaryDirectory(prefix="vistocarro-reports-") as report_dir:
+        for i in range(args.inspections):
+            images = make_images(args.images, args.width, args.height, args.seed + i, args.shots)
+            timings.measure("inspection", run_inspection, f"benchmark-{args.seed}-{i}-{time.time_ns()}",
+                            images, handlers, timings, args.workers, args.narrative, args.batch, args.triage,
+                            report_dir)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")},
+        "stages": timings.summary(),
+        "model_requests": handlers[0].vision_model.calls + handlers[0].text_model.calls,
+        "peak_memory_mb": round(peak / (1024 * 1024), 2)
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
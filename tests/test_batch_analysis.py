@@ -0,0 +1,87 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from benchmarks.fakes import DEFAULT_STRUCTURED_RESPONSE, FakeGenerativeModel, NullCache
+from utils import gemini_handler as gemini_module
+from utils.gemini_handler import GeminiHandler
+from utils.image_preprocessor import estimate_request_tokens
+from utils.structured_analysis import VehicleAnalysis, parse_batch_response
+
+
+def _jpeg(width=400, height=300):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (120, 80, 90)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _batch_item(image, **changes):
+    return dict(json.loads(DEFAULT_STRUCTURED_RESPONSE), image=image, **changes)
+
+
+@pytest.fixture
+def handler():
+    handler = GeminiHandler(cache=NullCache(), max_batch_size=3)
+    handler.vision_model = FakeGenerativeModel(latency=0)
+    return handler
+
+
+def test_plan_batches_splits_at_batch_size(handler):
+    assert handler.plan_batches([_jpeg()] * 7) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_plan_batches_splits_at_token_budget(handler, monkeypatch):
+    image = _jpeg()
+    monkeypatch.setattr(gemini_module, "GEMINI_BATCH_INPUT_TOKENS", 2 * estimate_request_tokens(image))
+    assert handler.plan_batches([image] * 5) == [[0, 1], [2, 3], [4]]
+
+
+def test_plan_batches_of_no_images(handler):
+    assert handler.plan_batches([]) == []
+
+
+def test_batch_size_halves_on_failure_and_grows_back(handler):
+    handler._adapt_batch_size(False)
+    assert handler.batch_size == 1
+    assert handler.plan_batches([_jpeg()] * 2) == [[0], [1]]
+
+    handler._adapt_batch_size(True)
+    handler._adapt_batch_size(True)
+    handler._adapt_batch_size(True)
+    assert handler.batch_size == 3
+
+
+def test_parse_batch_response_orders_items_by_image():
+    text = json.dumps({"analyses": [_batch_item(2, confidence=0.5), _batch_item(1, confidence=0.9)]})
+    first, second = parse_batch_response(text, 2)
+    assert isinstance(first, VehicleAnalysis)
+    assert first.confidence == 0.9
+    assert second.confidence == 0.5
+    assert first.damages[0].part == "para-choque dianteiro"
+
+
+def test_parse_batch_response_leaves_gaps_for_missing_and_invalid_items():
+    text = json.dumps({"analyses": [
+        _batch_item(1),
+        _batch_item(1, confidence=0.1),   # duplicate: the first one wins
+        _batch_item(7),                   # out of range
+        {"image": "x"},                   # invalid index
+        _batch_item(3)
+    ]})
+    analyses = parse_batch_response(text, 3)
+    assert analyses[0].confidence == 0.85
+    assert analyses[1] is None
+    assert analyses[2] is not None
+
+
+@pytest.mark.parametrize("text", ["", "not json", "[]", json.dumps({"analyses": None})])
+def test_parse_batch_response_of_unusable_text(text):
+    assert parse_batch_response(text, 2) == [None, None]
+
+
+def test_analyze_images_structured_sends_one_request(handler):
+    analyses = handler.analyze_images_structured([_jpeg()] * 3)
+    assert handler.vision_model.calls == 1
+    assert all(isinstance(analysis, VehicleAnalysis) for analysis in analyses)
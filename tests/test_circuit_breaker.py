@@ -0,0 +1,125 @@
+import io
+
+import pytest
+from PIL import Image
+
+from benchmarks.fakes import FakeGenerativeModel, FakeResponse, NullCache
+from utils import circuit_breaker, inspection_pipeline
+from utils.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from utils.gemini_handler import GeminiHandler
+from utils.image_analyzer_fallback import ImageAnalyzerFallback
+
+
+class FakeClock:
+    """Stand-in for the time module, advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_threshold=3, slow_call_seconds=5.0,
+                          window_seconds=60.0, reset_timeout=30.0)
+
+
+def test_opens_after_threshold_failures(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_failures_outside_window_are_forgotten(breaker, clock):
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now += 61
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_slow_call_counts_as_failure(breaker):
+    for _ in range(3):
+        breaker.record_success(duration=6.0)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_a_single_probe(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == HALF_OPEN
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_successful_probe_closes(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_success(duration=0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow_request()
+    # The failure window starts over
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    clock.now += 30
+    assert breaker.allow_request()
+
+
+def test_batch_retries_go_through_the_breaker(monkeypatch):
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    monkeypatch.setattr(inspection_pipeline, "gemini_breaker", breaker)
+    monkeypatch.setattr(inspection_pipeline, "ANALYSIS_MODE", "structured")
+
+    class FailingBatchModel(FakeGenerativeModel):
+        """Answers the batch without items while the API starts failing."""
+
+        def generate_content(self, contents, **kwargs):
+            self.calls += 1
+            breaker.record_failure()
+            return FakeResponse('{"analyses": []}')
+
+    gemini_handler = GeminiHandler(cache=NullCache())
+    gemini_handler.vision_model = FailingBatchModel(latency=0)
+
+    images = [_jpeg(i) for i in range(3)]
+    results = inspection_pipeline.analyze_batch_with_fallback(gemini_handler, ImageAnalyzerFallback(), images)
+
+    # The single-image retries were rejected by the open circuit, not sent
+    assert gemini_handler.vision_model.calls == 1
+    assert [r["error"] for r in results] == [inspection_pipeline.CIRCUIT_OPEN_MESSAGE] * 3
+
+
+def _jpeg(seed):
+    buffer = io.BytesIO()
+    Image.new("RGB", (200, 150), (seed * 60, 80, 90)).save(buffer, "JPEG")
+    return buffer.getvalue()
@@ -0,0 +1,149 @@
+import io
+import sqlite3
+
+import pytest
+from PIL import Image
+
+from utils import inspection_catalog
+from utils.image_ingest import ingest_image, unique_names
+from utils.image_triage import TriageResult
+from utils.inspection_catalog import InspectionCatalog, SCHEMA, SCHEMA_VERSION
+from utils.local_combiner import generate_local_combined_analysis
+from utils.structured_analysis import VehicleAnalysis, Damage
+
+# Version 0 keyed images by file name
+SCHEMA_V0 = SCHEMA.replace("PRIMARY KEY (inspection_id, position)", "PRIMARY KEY (inspection_id, filename)")
+
+
+def _jpeg(seed):
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (seed * 60, 80, 90)).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _analysis(part, severity):
+    analysis = VehicleAnalysis(brand="Volkswagen", damages=[Damage(part, "amassado", severity)],
+                               structural_notes="Sem indícios de dano ao chassi.", confidence=0.8)
+    return {"analysis": analysis.to_markdown(), "structured": analysis, "digest": None}
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    return str(tmp_path / "catalog.db")
+
+
+def _create_v0(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_V0)
+    conn.execute("INSERT INTO inspections (inspection_id, created_at, updated_at, status, image_count) "
+                 "VALUES ('old', 't', 't', 'done', 1)")
+    conn.execute("INSERT INTO images (inspection_id, position, filename, digest) VALUES ('old', 0, 'a.jpg', 'd0')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrates_version_0(catalog_path):
+    _create_v0(catalog_path)
+    catalog = InspectionCatalog(catalog_path)
+
+    conn = sqlite3.connect(catalog_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'images_v0'").fetchone() is None
+    conn.close()
+
+    assert [image["filename"] for image in catalog.get_inspection("old")["images"]] == ["a.jpg"]
+    assert catalog.find_by_digest("d0") == [("old", "a.jpg")]
+
+    # Repeated file names are now two rows
+    catalog.record_images("new", [ingest_image(_jpeg(1), "image.jpg"), ingest_image(_jpeg(2), "image.jpg")])
+    assert len(catalog.get_inspection("new")["images"]) == 2
+
+
+def test_interrupted_migration_is_rolled_back(catalog_path, monkeypatch):
+    _create_v0(catalog_path)
+    monkeypatch.setattr(inspection_catalog, "SCHEMA", SCHEMA + ";INSERT INTO missing_table VALUES (1)")
+    with pytest.raises(sqlite3.OperationalError):
+        InspectionCatalog(catalog_path)
+    monkeypatch.undo()
+
+    conn = sqlite3.connect(catalog_path)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    conn.close()
+    assert tables == {"inspections", "images", "inspection_parts"}
+
+    # The next start migrates normally
+    catalog = InspectionCatalog(catalog_path)
+    assert [image["filename"] for image in catalog.get_inspection("old")["images"]] == ["a.jpg"]
+
+
+def test_new_database_is_current(catalog_path):
+    InspectionCatalog(catalog_path)
+    InspectionCatalog(catalog_path)
+    conn = sqlite3.connect(catalog_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+def test_reopen_inspection(catalog_path):
+    catalog = InspectionCatalog(catalog_path)
+    names = unique_names(["image.jpg", "image.jpg", "blur.jpg"])
+    images = [ingest_image(_jpeg(i), name) for i, name in enumerate(names)]
+    triage = TriageResult(qualities=[], analyze=[0, 1], rejected={2: ["blur"]})
+
+    catalog.record_images("insp", images, triage)
+    analyses = [dict(_analysis("capô", "leve"), position=0, filename=names[0]),
+                dict(_analysis("farol", "moderado"), position=1, filename=names[1])]
+    catalog.record_analyses("insp", analyses, {1: "timeout"})
+    combined = generate_local_combined_analysis(analyses)
+    catalog.record_combined("insp", combined, analyses)
+    catalog.record_reports("insp", "reports/insp/report.pdf", "reports/insp/report.txt")
+
+    [listed] = catalog.list_inspections(status="done")
+    assert listed["inspection_id"] == "insp"
+    assert listed["image_count"] == 3
+    assert listed["analyzed_count"] == 2
+    assert listed["severity"] == "moderado"
+    assert catalog.list_inspections(severity="grave") == []
+    assert [i["inspection_id"] for i in catalog.list_inspections(part="farol")] == ["insp"]
+
+    inspection = catalog.get_inspection("insp")
+    assert inspection["combined_analysis"] == combined
+    assert inspection["pdf_key"] == "reports/insp/report.pdf"
+    assert inspection["parts"] == {"capô": "leve", "farol": "moderado"}
+    assert inspection["structural_impact"] == 0
+
+    first, second, rejected = inspection["images"]
+    assert (first["filename"], second["filename"]) == ("image.jpg", "image_2.jpg")
+    assert second["storage_key"] == "uploads/insp/image_2.jpg"
+    assert second["renditions"]["gallery"] == "uploads/insp/image_2.jpg.gallery.jpg"
+    assert second["error"] == "timeout"
+    assert rejected["triage"] == "rejected"
+    assert rejected["issues"] == ["blur"]
+
+    # The stored analyses rebuild the same combined report
+    reopened = InspectionCatalog.image_analyses(inspection)
+    assert [item["position"] for item in reopened] == [0, 1]
+    assert reopened[1]["structured"] == analyses[1]["structured"]
+    assert generate_local_combined_analysis(reopened) == combined
+
+
+def test_storage_failures_clear_the_keys(catalog_path):
+    catalog = InspectionCatalog(catalog_path)
+    catalog.record_images("insp", [ingest_image(_jpeg(i), f"{i}.jpg") for i in range(2)])
+    catalog.record_storage_failures("insp", [1])
+
+    stored, failed = catalog.get_inspection("insp")["images"]
+    assert stored["storage_key"] == "uploads/insp/0.jpg"
+    assert failed["storage_key"] is None
+    assert failed["renditions"] == {}
+
+
+def test_delete_inspection(catalog_path):
+    catalog = InspectionCatalog(catalog_path)
+    catalog.record_images("insp", [ingest_image(_jpeg(0), "0.jpg")])
+
+    assert catalog.delete_inspection("insp")
+    assert catalog.get_inspection("insp") is None
+    assert catalog.find_by_digest(ingest_image(_jpeg(0), "0.jpg").digest) == []
+    assert not catalog.delete_inspection("insp")
@@ -0,0 +1,119 @@
+import pytest
+
+from benchmarks.fakes import FakeS3Client
+from utils.local_storage import LocalStorage
+from utils.s3_handler import S3Handler
+from utils.tiered_storage import TieredStorage
+
+BUCKET = "test"
+
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client(latency=0, seed=1)
+
+
+@pytest.fixture
+def remote(s3_client):
+    remote = S3Handler()
+    remote.bucket_name = BUCKET
+    remote.s3_client = s3_client
+    return remote
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "cache")
+
+
+def _tiered(remote, cache_dir, **options):
+    return TieredStorage(remote, cache=LocalStorage(base_dir=cache_dir), **options)
+
+
+def test_write_back_flush(remote, s3_client, cache_dir):
+    storage = _tiered(remote, cache_dir, write_mode="back")
+    assert storage.upload_file_object(b"image", "uploads/a/1.jpg")
+    assert storage.upload_file_object_async(b"report", "reports/a/report.txt").result()
+
+    assert storage.flush(timeout=5)
+    assert s3_client.objects[(BUCKET, "uploads/a/1.jpg")] == b"image"
+    assert s3_client.objects[(BUCKET, "reports/a/report.txt")] == b"report"
+    assert storage.stats()["pending_uploads"] == 0
+
+
+def test_write_back_keeps_failed_uploads_until_flush(remote, s3_client, cache_dir):
+    storage = _tiered(remote, cache_dir, write_mode="back")
+    s3_client.error_rate = 1.0
+    assert storage.upload_file_object(b"image", "uploads/a/1.jpg")
+    assert not storage.flush(timeout=5)
+    assert (BUCKET, "uploads/a/1.jpg") not in s3_client.objects
+
+    # Still served from the cache, and never evicted while unsent
+    storage.max_bytes = 0
+    storage.pin("a")
+    storage.unpin("a")
+    assert storage.stats()["entries"] == 1
+    assert storage.download_file("uploads/a/1.jpg") == b"image"
+
+    s3_client.error_rate = 0.0
+    assert storage.flush(timeout=5)
+    assert s3_client.objects[(BUCKET, "uploads/a/1.jpg")] == b"image"
+
+
+def test_unsent_objects_are_uploaded_after_a_restart(remote, s3_client, cache_dir):
+    s3_client.error_rate = 1.0
+    storage = _tiered(remote, cache_dir, write_mode="back")
+    assert storage.upload_file_object(b"image", "uploads/a/1.jpg")
+    storage.flush(timeout=5)
+
+    s3_client.error_rate = 0.0
+    restarted = _tiered(remote, cache_dir, write_mode="back")
+    assert restarted.flush(timeout=5)
+    assert s3_client.objects[(BUCKET, "uploads/a/1.jpg")] == b"image"
+
+
+def test_write_through_failure_is_not_cached(remote, s3_client, cache_dir):
+    storage = _tiered(remote, cache_dir, write_mode="through")
+    s3_client.error_rate = 1.0
+    assert not storage.upload_file_object(b"image", "uploads/a/1.jpg")
+    assert storage.stats()["entries"] == 0
+
+
+def test_reads_hit_revalidate_and_miss(remote, s3_client, cache_dir):
+    storage = _tiered(remote, cache_dir, write_mode="through")
+    assert storage.upload_file_object(b"v1", "uploads/a/1.jpg")
+
+    assert storage.download_file("uploads/a/1.jpg") == b"v1"
+    assert storage.stats()["hits"] == 1
+
+    # Unchanged in S3: a conditional GET validates the cached copy
+    storage.revalidate_seconds = 0
+    assert storage.download_file("uploads/a/1.jpg") == b"v1"
+    assert storage.stats()["revalidated"] == 1
+
+    # Changed in S3: the new version is downloaded and cached
+    s3_client.objects[(BUCKET, "uploads/a/1.jpg")] = b"v2"
+    assert storage.download_file("uploads/a/1.jpg") == b"v2"
+    storage.revalidate_seconds = 300
+    assert storage.download_file("uploads/a/1.jpg") == b"v2"
+    assert storage.stats()["hits"] == 2
+
+    # S3 unavailable: the cached copy is served as stale
+    storage.revalidate_seconds = 0
+    s3_client.error_rate = 1.0
+    assert storage.download_file("uploads/a/1.jpg") == b"v2"
+    assert storage.stats()["stale"] == 1
+
+
+def test_eviction_keeps_pinned_inspections(remote, cache_dir):
+    storage = _tiered(remote, cache_dir, write_mode="through", max_bytes=10)
+    storage.pin("a")
+    assert storage.upload_file_object(b"x" * 8, "uploads/a/1.jpg")
+    assert storage.upload_file_object(b"y" * 8, "uploads/b/1.jpg")
+    assert storage.upload_file_object(b"z" * 8, "uploads/a/2.jpg")
+    assert storage.stats()["entries"] == 2
+    assert storage.download_file("uploads/b/1.jpg") == b"y" * 8
+    assert storage.stats()["misses"] == 1
+
+    storage.unpin("a")
+    assert storage.stats()["size_bytes"] <= 10
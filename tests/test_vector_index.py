@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from utils import vector_index
+from utils.vector_index import VectorIndex, split_sections
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "index")
+
+
+def _texts(results):
+    return [result["text"] for result in results]
+
+
+def test_add_and_search(index_dir):
+    index = VectorIndex(index_dir)
+    index.add("a", ["para-choque dianteiro amassado", "capô arranhado"])
+    index.add("b", ["porta traseira amassada"])
+
+    results = index.search("capô arranhado")
+    assert results[0]["inspection_id"] == "a"
+    assert results[0]["text"] == "capô arranhado"
+    assert _texts(index.search("porta", inspection_id="b")) == ["porta traseira amassada"]
+    assert sorted(index.inspection_ids()) == ["a", "b"]
+
+
+def test_add_replaces_previous_version(index_dir):
+    index = VectorIndex(index_dir)
+    index.add("a", ["farol quebrado"])
+    index.add("a", ["lanterna quebrada"])
+
+    assert _texts(index.search("quebrado quebrada farol lanterna", k=5)) == ["lanterna quebrada"]
+
+
+def test_remove(index_dir):
+    index = VectorIndex(index_dir)
+    index.add("a", ["farol quebrado"])
+    index.add("b", ["teto com granizo"])
+
+    assert index.remove("a")
+    assert not index.remove("a")
+    assert index.inspection_ids() == ["b"]
+    assert index.search("farol quebrado") == []
+
+
+def test_reload_sees_rows_written_by_another_instance(index_dir):
+    writer = VectorIndex(index_dir)
+    reader = VectorIndex(index_dir)
+    assert reader.inspection_ids() == []
+
+    writer.add("a", ["farol quebrado"])
+    writer.add("b", ["teto com granizo"])
+    writer.remove("a")
+
+    assert reader.inspection_ids() == ["b"]
+    assert _texts(VectorIndex(index_dir).search("teto granizo")) == ["teto com granizo"]
+
+
+def test_compaction_switches_generation(index_dir):
+    index = VectorIndex(index_dir)
+    reader = VectorIndex(index_dir)
+    for inspection_id in "abcd":
+        index.add(inspection_id, [f"dano na peça {inspection_id}"])
+    assert reader.inspection_ids() == list("abcd")
+
+    index.remove("a")
+    index.remove("b")
+
+    # Half of the rows were dead: the live rows moved to a new generation
+    assert open(os.path.join(index_dir, "CURRENT")).read() == "gen-000001"
+    assert sorted(os.listdir(index_dir)) == ["CURRENT", "gen-000001", "index.lock"]
+    assert sorted(os.listdir(os.path.join(index_dir, "gen-000001"))) == ["chunks.jsonl", "vectors.f32"]
+
+    for instance in (index, reader, VectorIndex(index_dir)):
+        assert instance.inspection_ids() == ["c", "d"]
+        assert _texts(instance.search("dano na peça d", k=1)) == ["dano na peça d"]
+
+    # Removals after the compaction apply to the rows of the new generation
+    index.remove("c")
+    assert reader.inspection_ids() == ["d"]
+    assert _texts(reader.search("dano na peça d", k=1)) == ["dano na peça d"]
+
+
+def test_interrupted_compaction_keeps_the_previous_generation(index_dir, monkeypatch):
+    index = VectorIndex(index_dir)
+    for inspection_id in "abcd":
+        index.add(inspection_id, [f"dano na peça {inspection_id}"])
+
+    real_replace = os.replace
+
+    def crash_on_switch(src, dst):
+        if dst.endswith("CURRENT"):
+            raise OSError("crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(vector_index.os, "replace", crash_on_switch)
+    index.remove("a")
+    with pytest.raises(OSError):
+        index.remove("b")
+    monkeypatch.undo()
+
+    reopened = VectorIndex(index_dir)
+    assert not os.path.exists(os.path.join(index_dir, "CURRENT"))
+    assert reopened.inspection_ids() == ["c", "d"]
+    assert _texts(reopened.search("dano na peça c", k=1)) == ["dano na peça c"]
+
+    # The next compaction starts the generation over
+    reopened.remove("c")
+    assert open(os.path.join(index_dir, "CURRENT")).read() == "gen-000001"
+    assert reopened.inspection_ids() == ["d"]
+
+
+def test_split_sections():
+    section = "## Danos\n" + "x" * 25
+    chunks = split_sections("# Título\nintro\n" + section, chunk_size=20, overlap=5)
+    assert chunks == ["# Título\nintro", section[:20], section[15:]]
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+def sha256_digest(*parts):
+    """Compute a SHA-256 hex digest over several str/bytes parts.
+
+    Args:
+        *parts: Values to hash, str values are encoded as UTF-8
+
+    Returns:
+        str: Hex digest
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(part)
+        # Separator so ("ab", "c") and ("a", "bc") hash differently
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def content_digest(content):
+    """Return the SHA-256 digest of an image's bytes.
+
+    An IngestedImage carries the digest computed at ingest, which is
+    reused instead of hashing the bytes again.
+
+    Args:
+        content: bytes, or an IngestedImage
+
+    Returns:
+        str: Hex digest
+    """
+    return getattr(content, "digest", None) or sha256_digest(content)
+
+
+class AnalysisCache:
+    """Persistent, content-addressed cache for model analysis results.
+
+    Entries are stored as small JSON files under the cache directory and
+    evicted by age (TTL) and by total size (least recently used first).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, ttl_seconds=None):
+        """Initialize the cache.
+
+        Args:
+            cache_dir: Directory for cache files (default: storage/cache)
+            max_bytes: Maximum total size of the cache in bytes
+            ttl_seconds: Maximum age of an entry in seconds
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage", "cache")
+        self.cache_dir = cache_dir or os.getenv("ANALYSIS_CACHE_DIR", default_dir)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "100")) * 1024 * 1024)
+        if ttl_seconds is None:
+            ttl_seconds = int(float(os.getenv("ANALYSIS_CACHE_TTL_HOURS", "720")) * 3600)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, namespace, key):
+        """Return the file path of an entry."""
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def get(self, namespace, key):
+        """Look up an entry.
+
+        Args:
+            namespace: Entry type (e.g. "image", "combined")
+            key: Content digest of the entry
+
+        Returns:
+            str: Cached value, or None on a miss
+        """
+        path = self._path(namespace, key)
+        with self._lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+
+                if time.time() - entry["created"] > self.ttl_seconds:
+                    self._remove(path)
+                    self.misses += 1
+                    return None
+
+                # Refresh access time for LRU eviction
+                os.utime(path, None)
+                self.hits += 1
+                return entry["value"]
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except Exception as e:
+                print(f"Error reading analysis cache: {e}")
+                self.misses += 1
+                return None
+
+    def put(self, namespace, key, value):
+        """Store an entry and evict old ones if the cache is over its size.
+
+        Args:
+            namespace: Entry type (e.g. "image", "combined")
+            key: Content digest of the entry
+            value: String value to store
+
+        Returns:
+            bool: True if the entry was stored, False otherwise
+        """
+        path = self._path(namespace, key)
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                current = self._current_size()
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+                self._total_bytes = current - previous + len(data)
+                if self._total_bytes > self.max_bytes:
+                    self._evict()
+                return True
+            except Exception as e:
+                print(f"Error writing analysis cache: {e}")
+                return False
+
+    def stats(self):
+        """Return cache counters.
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate and size_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._current_size()
+            }
+
+    def _entries(self):
+        """List (path, mtime, size) for every cache file."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                    entries.append((path, st.st_mtime, st.st_size))
+                except FileNotFoundError:
+                    continue
+        return entries
+
+    def _current_size(self):
+        """Total cache size in bytes, scanned from disk on first use."""
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, _, size in self._entries())
+        return self._total_bytes
+
+    def _remove(self, path):
+        """Delete an entry file and update the size counter."""
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            if self._total_bytes is not None:
+                self._total_bytes -= size
+            self.evictions += 1
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is under max_bytes."""
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self._total_bytes = sum(size for _, _, size in entries)
+
+        for path, _, _ in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(path)
@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from utils.analysis_cache import sha256_digest
+
+# Maximum number of cached answers (least recently used are evicted)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+
+# Minimum word overlap (Jaccard) for a near-duplicate question to reuse an
+# answer; 0 disables near-duplicate matching
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.8"))
+
+# Questions with fewer meaningful words than this are never cached: once
+# stop words are removed, "e isso?" or "qual?" say nothing about what was asked
+ANSWER_CACHE_MIN_WORDS = int(os.getenv("ANSWER_CACHE_MIN_WORDS", "2"))
+
+# Portuguese stop words, without accents (questions are folded first)
+STOP_WORDS = frozenset("""
+a ao aos as com como da das de diga do dos e ela ele em entao essa esse esta estao este eu
+existe existem favor foi ha houve isso me meu minha na nas no nos o os ou para pela pelo pode
+poderia por qual quais quanto que sao se ser seu sobre sua tambem tem um uma umas uns voce voces
+""".split())
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_question(question):
+    """Fold a question to the words that carry its meaning.
+
+    Accents and case are removed, as are punctuation and stop words, so
+    "Qual é a severidade?" and "qual a severidade" normalize the same way.
+
+    Args:
+        question: User's question
+
+    Returns:
+        str: Normalized question
+    """
+    folded = unicodedata.normalize("NFKD", question.casefold())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return " ".join(word for word in _WORD_RE.findall(folded) if word not in STOP_WORDS)
+
+
+class AnswerCache:
+    """In-memory LRU cache of chat answers.
+
+    Answers are keyed by the normalized question and the digest of the
+    analysis they were based on. Optionally, a question whose words overlap
+    enough with a cached question about the same analysis reuses its answer.
+    """
+
+    def __init__(self, max_entries=None, similarity=None):
+        """Initialize the cache.
+
+        Args:
+            max_entries: Maximum number of cached answers
+            similarity: Minimum Jaccard similarity for near-duplicate matches
+                (0 disables them)
+        """
+        self.max_entries = max_entries or ANSWER_CACHE_MAX_ENTRIES
+        self.similarity = ANSWER_CACHE_SIMILARITY if similarity is None else similarity
+        self.min_words = max(1, ANSWER_CACHE_MIN_WORDS)
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Word sets of the cached questions, per analysis digest
+        self._questions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(question, analysis_text):
+        """Return (analysis digest, normalized question)."""
+        return sha256_digest(analysis_text or ""), normalize_question(question)
+
+    def _cacheable(self, normalized):
+        """Whether a normalized question has enough words to be cached."""
+        return len(normalized.split()) >= self.min_words
+
+    def _nearest(self, digest, normalized):
+        """Find the most similar cached question about the same analysis."""
+        words = frozenset(normalized.split())
+        best, best_score = None, self.similarity
+        for cached, cached_words in self._questions.get(digest, {}).items():
+            score = len(words & cached_words) / len(words | cached_words)
+            if score >= best_score:
+                best, best_score = cached, score
+        return best
+
+    def get(self, question, analysis_text):
+        """Look up the answer to a question.
+
+        Args:
+            question: User's question
+            analysis_text: The analysis text the answer is based on
+
+        Returns:
+            str: Cached answer, or None on a miss
+        """
+        digest, normalized = self._key(question, analysis_text)
+        with self._lock:
+            if not self._cacheable(normalized):
+                self.misses += 1
+                return None
+
+            key = (digest, normalized)
+            if key not in self._entries and self.similarity > 0:
+                nearest = self._nearest(digest, normalized)
+                if nearest is not None:
+                    key = (digest, nearest)
+                    self.near_hits += 1
+
+            answer = self._entries.get(key)
+            if answer is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, question, analysis_text, answer):
+        """Store the answer to a question.
+
+        Args:
+            question: User's question
+            analysis_text: The analysis text the answer is based on
+            answer: Answer text
+        """
+        digest, normalized = self._key(question, analysis_text)
+        if not self._cacheable(normalized):
+            return
+        with self._lock:
+            key = (digest, normalized)
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            self._questions.setdefault(digest, {})[normalized] = frozenset(normalized.split())
+
+            while len(self._entries) > self.max_entries:
+                (old_digest, old_question), _ = self._entries.popitem(last=False)
+                questions = self._questions.get(old_digest, {})
+                questions.pop(old_question, None)
+                if not questions:
+                    self._questions.pop(old_digest, None)
+
+    def stats(self):
+        """Return cache counters.
+
+        Returns:
+            dict: hits, near_hits, misses, hit_rate and entries
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries)
+            }
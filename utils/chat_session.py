@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from utils.metrics import timed
+
+# Number of recent question/answer turns sent verbatim to the model
+CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", "6"))
+
+# Maximum length of the rolling summary of older turns, in characters
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "1500"))
+
+# Instructions and analysis, sent once as the chat's system instruction
+CHAT_SYSTEM_INSTRUCTION = """Você é um especialista em vistoria veicular chamado Gemini.
+Responda às perguntas do usuário de forma técnica e precisa, com base na seguinte análise de um veículo com avarias:
+
+{analysis_text}
+
+Importante: Responda apenas com base nas informações contidas na análise acima.
+Se a informação não estiver presente na análise, diga que não possui essa informação específica.
+Não invente detalhes que não estejam na análise.
+"""
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def _first_sentence(text, max_chars=200):
+    """Return the first sentence of a text, truncated to max_chars."""
+    sentence = _SENTENCE_END_RE.split(text.strip(), 1)[0].replace("\n", " ")
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 1] + "…"
+
+
+class InspectionChat:
+    """Multi-turn chat about one inspection.
+
+    The analysis and instructions go in the system instruction of the chat
+    model instead of every prompt. Only the last window_turns turns are
+    sent verbatim; older turns are folded into a short rolling summary, so
+    the input per question stays flat as the conversation grows.
+    """
+
+    def __init__(self, analysis_text, model, answer_cache=None, window_turns=None, summary_max_chars=None):
+        """Initialize the chat session.
+
+        Args:
+            analysis_text: The analysis text the answers are based on
+            model: GenerativeModel with CHAT_SYSTEM_INSTRUCTION for this analysis
+                (see GeminiHandler.start_chat)
+            answer_cache: Optional AnswerCache for opening questions
+            window_turns: Number of recent turns sent verbatim
+            summary_max_chars: Maximum length of the rolling summary
+        """
+        self.analysis_text = analysis_text
+        self.model = model
+        self.answer_cache = answer_cache
+        self.window_turns = window_turns or CHAT_WINDOW_TURNS
+        self.summary_max_chars = summary_max_chars or CHAT_SUMMARY_MAX_CHARS
+
+        self.turns = []
+        self.summary_lines = []
+        self._lock = threading.Lock()
+
+    def _history(self):
+        """Build the chat history: rolling summary, then the recent turns."""
+        history = []
+        if self.summary_lines:
+            history.append({"role": "user",
+                            "parts": ["Resumo da conversa anterior:\n" + "\n".join(self.summary_lines)]})
+            history.append({"role": "model", "parts": ["Entendido."]})
+        for question, answer in self.turns:
+            history.append({"role": "user", "parts": [question]})
+            history.append({"role": "model", "parts": [answer]})
+        return history
+
+    def _record_turn(self, question, answer):
+        """Add a turn, folding the oldest turns into the summary."""
+        with self._lock:
+            self.turns.append((question, answer))
+            while len(self.turns) > self.window_turns:
+                old_question, old_answer = self.turns.pop(0)
+                self.summary_lines.append(f"- {old_question.strip()} → {_first_sentence(old_answer)}")
+            while self.summary_lines and sum(len(line) + 1 for line in self.summary_lines) > self.summary_max_chars:
+                self.summary_lines.pop(0)
+
+    def _cached_answer(self, question):
+        """Cached answer of an opening question (later ones depend on context)."""
+        if self.answer_cache is None or self.turns or self.summary_lines:
+            return None
+        return self.answer_cache.get(question, self.analysis_text)
+
+    def send(self, question):
+        """Answer a question in the context of the conversation.
+
+        Args:
+            question: User's question
+
+        Returns:
+            str: Answer to the question
+        """
+        return "".join(self.send_stream(question))
+
+    def send_stream(self, question):
+        """Answer a question, yielding text as it is generated.
+
+        The turn is recorded once the answer is complete; errors are
+        yielded as a message and not recorded.
+
+        Args:
+            question: User's question
+
+        Yields:
+            str: Chunks of the answer
+        """
+        with timed("chat_answer") as timing:
+            try:
+                cached = self._cached_answer(question)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    self._record_turn(question, cached)
+                    yield cached
+                    return
+
+                with self._lock:
+                    history = self._history()
+                    opening = not history
+                chat = self.model.start_chat(history=history)
+
+                chunks = []
+                for chunk in chat.send_message(question, stream=True):
+                    text = chunk.text
+                    if text:
+                        chunks.append(text)
+                        yield text
+
+                answer = "".join(chunks)
+                self._record_turn(question, answer)
+                if opening and self.answer_cache is not None:
+                    self.answer_cache.put(question, self.analysis_text, answer)
+
+            except Exception as e:
+                print(f"Error answering question with Gemini: {e}")
+                timing["outcome"] = "error"
+                yield f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Por favor, tente novamente mais tarde."
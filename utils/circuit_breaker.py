@@ -0,0 +1,142 @@
+import os
+import time
+import threading
+from collections import deque
+from utils.metrics import Gauge, Counter
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+CIRCUIT_STATE = Gauge(
+    "vistocarro_circuit_state",
+    "Circuit breaker state (0 = closed, 1 = half open, 2 = open).",
+    ["name"]
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "vistocarro_circuit_transitions_total",
+    "Number of circuit breaker state changes.",
+    ["name", "state"]
+)
+CIRCUIT_REJECTED = Counter(
+    "vistocarro_circuit_rejected_total",
+    "Number of calls routed away because the circuit was open.",
+    ["name"]
+)
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Circuit breaker that stops calling a failing dependency.
+
+    The circuit opens after failure_threshold failures (errors or calls
+    slower than slow_call_seconds) within window_seconds. While open, calls
+    are rejected; after reset_timeout a single probe call is allowed
+    (half open), and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=3, slow_call_seconds=30.0, window_seconds=60.0, reset_timeout=30.0):
+        """Initialize the circuit breaker.
+
+        Args:
+            name: Name used in metrics and the UI
+            failure_threshold: Failures within the window that open the circuit
+            slow_call_seconds: Calls slower than this count as failures
+            window_seconds: Length of the failure window in seconds
+            reset_timeout: Time in seconds before a probe call is allowed
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.window_seconds = window_seconds
+        self.reset_timeout = reset_timeout
+
+        self._state = CLOSED
+        self._failures = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, name=name)
+
+    @property
+    def state(self):
+        """Current state: "closed", "open" or "half_open"."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def _transition(self, state):
+        """Change state and update metrics (lock must be held)."""
+        if state == self._state:
+            return
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._failures.clear()
+        CIRCUIT_STATE.set(_STATE_VALUES[state], name=self.name)
+        CIRCUIT_TRANSITIONS.inc(name=self.name, state=state)
+        print(f"Circuit breaker '{self.name}' is now {state}")
+
+    def allow_request(self):
+        """Check whether a call may go through.
+
+        Returns:
+            bool: True if the call should be made, False to use the fallback
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    CIRCUIT_REJECTED.inc(name=self.name)
+                    return False
+                self._transition(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                # Only one probe at a time
+                if self._probe_in_flight:
+                    CIRCUIT_REJECTED.inc(name=self.name)
+                    return False
+                self._probe_in_flight = True
+
+            return True
+
+    def record_success(self, duration=0.0):
+        """Record a completed call.
+
+        Args:
+            duration: Call duration in seconds; slow calls count as failures
+        """
+        if duration > self.slow_call_seconds:
+            self.record_failure()
+            return
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        """Record a failed or slow call."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(OPEN)
+                return
+
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window_seconds:
+                self._failures.popleft()
+            if self._state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._transition(OPEN)
+
+
+# Process-wide breaker shared by every session and worker thread
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "3")),
+    slow_call_seconds=float(os.getenv("GEMINI_BREAKER_SLOW_SECONDS", "30")),
+    window_seconds=float(os.getenv("GEMINI_BREAKER_WINDOW_SECONDS", "60")),
+    reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+)
@@ -0,0 +1,250 @@
+import os
+import io
+from dataclasses import dataclass
+import numpy as np
+from PIL import Image, ImageOps
+from utils.structured_analysis import Damage, VehicleAnalysis
+
+# Longest side (pixels) of the image the heuristics run on
+HEURISTIC_IMAGE_SIZE = int(os.getenv("HEURISTIC_IMAGE_SIZE", "384"))
+
+# Minimum score for a grid cell to be reported as a damage candidate
+HEURISTIC_MIN_SCORE = float(os.getenv("HEURISTIC_MIN_SCORE", "0.35"))
+
+# Approximate part covered by each grid cell in a typical three-quarter view
+PART_GRID = (
+    ("farol", "capô", "teto"),
+    ("para-lama dianteiro", "porta dianteira", "porta traseira"),
+    ("para-choque dianteiro", "soleira", "para-choque traseiro")
+)
+
+# Weights of the edge, specular and color scores in the cell score
+FEATURE_WEIGHTS = np.array([0.4, 0.35, 0.25], dtype=np.float32)
+
+# Lowest baseline of each feature, so a clean image does not turn noise
+# into relative outliers
+FEATURE_FLOORS = np.array([0.05, 0.02, 0.1], dtype=np.float32)
+
+# A cell feature this many times the image median saturates its score
+SATURATION_RATIO = 3.0
+
+# Gradient magnitude (0-255 luma scale) counted as an edge
+EDGE_THRESHOLD = 40.0
+
+# Reference colors (RGB) for the body color estimate
+COLOR_PALETTE = {
+    "preto": (30, 30, 30),
+    "branco": (235, 235, 235),
+    "prata": (180, 182, 185),
+    "cinza": (110, 112, 115),
+    "vermelho": (170, 30, 35),
+    "azul": (35, 60, 140),
+    "verde": (40, 110, 55),
+    "amarelo": (220, 190, 40),
+    "marrom": (110, 75, 45),
+    "laranja": (220, 110, 30)
+}
+
+
+@dataclass
+class DamageRegion:
+    """A grid cell with local evidence of damage."""
+
+    part: str
+    row: int
+    col: int
+    box: tuple
+    score: float
+    edge_density: float
+    specular: float
+    color_anomaly: float
+    damage_type: str
+    severity: str
+
+
+def load_analysis_image(image_bytes, max_side=HEURISTIC_IMAGE_SIZE):
+    """Decode a downscaled RGB array of an image.
+
+    JPEGs are decoded in draft mode, so the full-resolution image is never
+    materialized. For an ingested image, the smaller model rendition is
+    decoded instead of the original.
+
+    Args:
+        image_bytes: The image content in bytes, or an IngestedImage
+        max_side: Maximum length of the longest side
+
+    Returns:
+        numpy.ndarray: float32 array of shape (height, width, 3), 0-255
+    """
+    image_bytes = getattr(image_bytes, "renditions", {}).get("model", image_bytes)
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("RGB", (max_side, max_side))
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _grid_mean(values, rows, cols):
+    """Average a 2-D map over a rows x cols grid.
+
+    The map is cropped to a multiple of the grid size and reduced with a
+    reshape, without Python loops.
+    """
+    height, width = values.shape
+    cell_h, cell_w = height // rows, width // cols
+    cropped = values[:cell_h * rows, :cell_w * cols]
+    return cropped.reshape(rows, cell_h, cols, cell_w).mean(axis=(1, 3))
+
+
+def feature_maps(rgb):
+    """Compute the per-pixel damage evidence maps.
+
+    Args:
+        rgb: float32 RGB array, 0-255
+
+    Returns:
+        tuple: (edges, specular_breaks, color_distance) maps with the
+            shape of the image
+    """
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    # Sobel gradient magnitude, from shifted views of the padded image
+    padded = np.pad(luma, 1, mode="edge")
+    gx = (padded[:-2, 2:] + 2 * padded[1:-1, 2:] + padded[2:, 2:]
+          - padded[:-2, :-2] - 2 * padded[1:-1, :-2] - padded[2:, :-2]) / 4
+    gy = (padded[2:, :-2] + 2 * padded[2:, 1:-1] + padded[2:, 2:]
+          - padded[:-2, :-2] - 2 * padded[:-2, 1:-1] - padded[:-2, 2:]) / 4
+    edges = (np.hypot(gx, gy) > EDGE_THRESHOLD).astype(np.float32)
+
+    # Reflections are bright and unsaturated; on a dent they break up, so
+    # the boundary of the highlight mask grows relative to its area
+    value = rgb.max(axis=2)
+    saturation = (value - rgb.min(axis=2)) / np.maximum(value, 1.0)
+    highlight = (value > np.percentile(value, 95)) & (saturation < 0.25)
+    boundary = np.zeros_like(highlight)
+    boundary[:, 1:] |= highlight[:, 1:] ^ highlight[:, :-1]
+    boundary[1:, :] |= highlight[1:, :] ^ highlight[:-1, :]
+    specular_breaks = boundary.astype(np.float32)
+
+    # Distance from the dominant body color, as a robust z-score
+    distance = np.linalg.norm(rgb - np.median(rgb.reshape(-1, 3), axis=0), axis=2)
+    median = np.median(distance)
+    spread = np.median(np.abs(distance - median)) * 1.4826 + 1.0
+    color_distance = np.clip((distance - median) / spread / 3.0, 0.0, 1.0)
+
+    return edges, specular_breaks, color_distance
+
+
+def estimate_color(rgb):
+    """Name the dominant color of the central region of the image.
+
+    Args:
+        rgb: float32 RGB array, 0-255
+
+    Returns:
+        str: Color name from COLOR_PALETTE
+    """
+    height, width = rgb.shape[:2]
+    center = rgb[height // 4:height * 3 // 4, width // 4:width * 3 // 4].reshape(-1, 3)
+    dominant = np.median(center, axis=0)
+    names = list(COLOR_PALETTE)
+    palette = np.array([COLOR_PALETTE[name] for name in names], dtype=np.float32)
+    return names[int(np.argmin(np.linalg.norm(palette - dominant, axis=1)))]
+
+
+def _damage_type(edge, specular, color, score):
+    """Pick the damage type suggested by the dominant feature."""
+    dominant = int(np.argmax([edge, specular, color]))
+    if dominant == 0:
+        return "quebrado" if score >= 0.75 else "trincado"
+    if dominant == 1:
+        return "amassado"
+    return "arranhão"
+
+
+def _severity(score):
+    """Map a cell score to leve/moderado.
+
+    Pixel statistics cannot tell severe damage from a busy background, so
+    the heuristics never report "grave".
+    """
+    if score >= 0.55:
+        return "moderado"
+    return "leve"
+
+
+def detect_damage_regions(rgb, min_score=HEURISTIC_MIN_SCORE, part_grid=PART_GRID):
+    """Score the grid cells of an image for signs of damage.
+
+    Each feature is averaged per cell and compared with the median cell of
+    the same image, so only regions that stand out are reported.
+
+    Args:
+        rgb: float32 RGB array, 0-255 (see load_analysis_image)
+        min_score: Minimum score of a reported region
+        part_grid: Rows of part names, one per grid cell
+
+    Returns:
+        list: DamageRegion candidates, highest score first
+    """
+    rows, cols = len(part_grid), len(part_grid[0])
+    cells = np.stack([_grid_mean(m, rows, cols) for m in feature_maps(rgb)])
+
+    # Relative to the median cell: 1x scores 0, SATURATION_RATIO x scores 1
+    baseline = np.maximum(np.median(cells.reshape(3, -1), axis=1), FEATURE_FLOORS)[:, None, None]
+    relative = np.clip((cells / baseline - 1.0) / (SATURATION_RATIO - 1.0), 0.0, 1.0)
+
+    # One strong feature is enough to flag a cell; agreement raises the score
+    scores = 0.5 * relative.max(axis=0) + 0.5 * np.tensordot(FEATURE_WEIGHTS, relative, axes=1)
+
+    regions = []
+    for row, col in zip(*np.nonzero(scores >= min_score)):
+        row, col = int(row), int(col)
+        score = float(scores[row, col])
+        edge, specular, color = (float(v) for v in relative[:, row, col])
+        regions.append(DamageRegion(
+            part=part_grid[row][col],
+            row=row,
+            col=col,
+            box=(col / cols, row / rows, (col + 1) / cols, (row + 1) / rows),
+            score=round(score, 3),
+            edge_density=round(float(cells[0, row, col]), 4),
+            specular=round(float(cells[1, row, col]), 4),
+            color_anomaly=round(float(cells[2, row, col]), 4),
+            damage_type=_damage_type(edge, specular, color, score),
+            severity=_severity(score)
+        ))
+    regions.sort(key=lambda r: r.score, reverse=True)
+    return regions
+
+
+def analyze_local(image_bytes, min_score=HEURISTIC_MIN_SCORE):
+    """Run the local heuristics and build a structured analysis.
+
+    Vehicle type, brand and model cannot be recognized locally and are
+    reported as "desconhecido".
+
+    Args:
+        image_bytes: The image content in bytes
+        min_score: Minimum score of a reported region
+
+    Returns:
+        tuple: (VehicleAnalysis, list of DamageRegion)
+    """
+    rgb = load_analysis_image(image_bytes)
+    regions = detect_damage_regions(rgb, min_score)
+
+    analysis = VehicleAnalysis(
+        color=estimate_color(rgb),
+        damages=[Damage(part=r.part, type=r.damage_type, severity=r.severity) for r in regions],
+        # Structural impact cannot be assessed from pixel statistics
+        structural_impact=None,
+        structural_notes="Heurística local, requer confirmação por um vistoriador.",
+        # Heuristics never reach the confidence of a model analysis
+        confidence=round(min(0.5, 0.2 + 0.3 * regions[0].score), 2) if regions else 0.2
+    )
+    return analysis, regions
@@ -1,14 +1,77 @@
 import os
+import time
+import asyncio
+import threading
+import weakref
 import google.generativeai as genai
 from dotenv import load_dotenv
-from PIL import Image
-import io
+from utils.analysis_cache import AnalysisCache, sha256_digest, content_digest
+from utils.answer_cache import AnswerCache
+from utils.chat_session import InspectionChat, CHAT_SYSTEM_INSTRUCTION
+from utils.metrics import timed
+from utils.structured_analysis import (VehicleAnalysis, ANALYSIS_RESPONSE_SCHEMA,
+                                       STRUCTURED_ANALYSIS_PROMPT, BATCH_RESPONSE_SCHEMA,
+                                       BATCH_ANALYSIS_PROMPT, parse_batch_response)
+from utils.image_preprocessor import (RESOLUTION_TIERS, IMAGE_TOKEN_BUDGET, prepare_model_image,
+                                      estimate_request_tokens, needs_higher_resolution)
+
+# Model used for both image analysis and text generation
+MODEL_NAME = 'gemini-1.5-flash'
+
+# Prompt for vehicle damage analysis
+IMAGE_ANALYSIS_PROMPT = """Você é um especialista em vistoria veicular. Analise esta imagem de um veículo e forneça:
+            
+            1. Identificação do veículo (tipo, marca, modelo, cor)
+            2. Localização dos danos (para-choque, porta, capô, etc.)
+            3. Tipo de dano (amassado, arranhão, quebrado, etc.)
+            4. Severidade do dano (leve, moderado, grave)
+            5. Possível impacto na estrutura do veículo
+            6. Estimativa de peças afetadas
+            
+            Forneça uma análise técnica e detalhada como um especialista em vistoria veicular.
+            Seja preciso na identificação do veículo e dos danos com base no que você realmente vê na imagem.
+            """
+
+# Instructions appended to the individual analyses for the combined report
+COMBINED_ANALYSIS_INSTRUCTIONS = """Gere um relatório técnico completo e consolidado que:
+1. Resuma todos os danos encontrados no veículo
+2. Classifique a severidade geral da batida (leve, moderada, grave)
+3. Identifique todas as peças afetadas
+4. Avalie o possível impacto na estrutura do veículo
+5. Forneça uma conclusão técnica sobre a condição geral do veículo
+
+Seu relatório deve ser detalhado, técnico e organizado em seções claras com o título "RELATÓRIO DE VISTORIA VEICULAR".
+Use apenas as informações das análises fornecidas, sem adicionar detalhes fictícios.
+"""
+
+# Structured answers below this confidence are re-sent at a higher resolution
+STRUCTURED_MIN_CONFIDENCE = float(os.getenv("GEMINI_STRUCTURED_MIN_CONFIDENCE", "0.6"))
+
+# Maximum number of in-flight async requests and per-call timeout for analyses
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+
+# Limits of a multi-image request: images per request, estimated input
+# image tokens, and output tokens of the model split by the tokens one
+# structured answer takes
+GEMINI_BATCH_MAX_IMAGES = int(os.getenv("GEMINI_BATCH_MAX_IMAGES", "8"))
+GEMINI_BATCH_INPUT_TOKENS = int(os.getenv("GEMINI_BATCH_INPUT_TOKENS", "16000"))
+GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "8192"))
+OUTPUT_TOKENS_PER_IMAGE = int(os.getenv("GEMINI_OUTPUT_TOKENS_PER_IMAGE", "400"))
 
 class GeminiHandler:
     """Handler for Google Gemini API."""
     
-    def __init__(self):
-        """Initialize the Gemini API client."""
+    def __init__(self, cache=None, max_concurrency=None, timeout=None, max_batch_size=None, answer_cache=None):
+        """Initialize the Gemini API client.
+        
+        Args:
+            cache: Optional AnalysisCache for analysis results (default: on-disk cache)
+            answer_cache: Optional AnswerCache for chat answers (default: in-memory LRU)
+            max_concurrency: Maximum in-flight async requests per event loop
+            timeout: Timeout in seconds for each analysis call
+            max_batch_size: Maximum images per multi-image request
+        """
         # Load environment variables from .env_gemini
         dotenv_path = "/home/fernandohoras/Documentos/Projeto_Validado/Vistoria_Veicular/.env_gemini"
         load_dotenv(dotenv_path)
@@ -33,10 +96,165 @@ class GeminiHandler:
         
         # Select the Gemini 1.5 Flash model for both image analysis and text generation
         # This model replaces the deprecated gemini-pro-vision
-        self.vision_model = genai.GenerativeModel('gemini-1.5-flash')
+        self.vision_model = genai.GenerativeModel(MODEL_NAME)
         
         # Use the same model for text generation
-        self.text_model = genai.GenerativeModel('gemini-1.5-flash')
+        self.text_model = genai.GenerativeModel(MODEL_NAME)
+        
+        # Content-addressed cache so re-submitted photos are not re-analyzed
+        self.cache = cache if cache is not None else AnalysisCache()
+        
+        # Chat answers, so repeated questions about an analysis skip the model
+        self.answer_cache = answer_cache if answer_cache is not None else AnswerCache()
+        
+        # Settings for the async API. The model objects above are shared by
+        # every call; each event loop gets its own semaphore.
+        self.max_concurrency = max_concurrency or GEMINI_MAX_CONCURRENCY
+        self.timeout = timeout or GEMINI_TIMEOUT_SECONDS
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        
+        # Bytes sent and latency per resolution tier
+        self.resolution_metrics = {
+            side: {"requests": 0, "bytes_sent": 0, "latency_seconds": 0.0}
+            for side in RESOLUTION_TIERS
+        }
+        self._metrics_lock = threading.Lock()
+        
+        # Images per multi-image request: halved when a batch fails, grown
+        # back one at a time while batches succeed
+        self.max_batch_size = max(1, min(max_batch_size or GEMINI_BATCH_MAX_IMAGES,
+                                         GEMINI_MAX_OUTPUT_TOKENS // OUTPUT_TOKENS_PER_IMAGE))
+        self.batch_size = self.max_batch_size
+        self._batch_lock = threading.Lock()
+    
+    def _record_resolution(self, side, bytes_sent, latency):
+        """Record one request in the resolution tier metrics."""
+        with self._metrics_lock:
+            metrics = self.resolution_metrics[side]
+            metrics["requests"] += 1
+            metrics["bytes_sent"] += bytes_sent
+            metrics["latency_seconds"] += latency
+    
+    def resolution_stats(self):
+        """Return bytes sent and latency for each resolution tier.
+        
+        Returns:
+            dict: Per-tier requests, bytes_sent, avg_bytes and avg_latency_seconds
+        """
+        with self._metrics_lock:
+            stats = {}
+            for side, metrics in self.resolution_metrics.items():
+                requests = metrics["requests"]
+                stats[side] = dict(metrics,
+                                   avg_bytes=metrics["bytes_sent"] / requests if requests else 0,
+                                   avg_latency_seconds=metrics["latency_seconds"] / requests if requests else 0.0)
+            return stats
+    
+    @staticmethod
+    def image_digest(image_bytes):
+        """Return the SHA-256 digest of an image's bytes.
+        
+        Args:
+            image_bytes: The image content in bytes
+            
+        Returns:
+            str: Hex digest
+        """
+        return content_digest(image_bytes)
+    
+    def _image_cache_key(self, image_digest):
+        """Cache key of a per-image analysis (image, prompt, model and resolution tiers)."""
+        return sha256_digest(image_digest, IMAGE_ANALYSIS_PROMPT, MODEL_NAME,
+                             repr(RESOLUTION_TIERS), str(IMAGE_TOKEN_BUDGET))
+    
+    def _combined_cache_key(self, image_analyses):
+        """Cache key of a combined analysis.
+        
+        Uses the sorted set of per-image digests; items without a digest
+        (e.g. produced by the fallback analyzer) are keyed by their text.
+        """
+        digests = sorted(set(
+            item.get('digest') or sha256_digest(item['analysis'])
+            for item in image_analyses
+        ))
+        return sha256_digest(*digests, COMBINED_ANALYSIS_INSTRUCTIONS, MODEL_NAME)
+    
+    @staticmethod
+    def _response_text(response):
+        """Extract the text from a generate_content response."""
+        # Check if response has text attribute (newer versions)
+        if hasattr(response, 'text'):
+            return response.text
+        # For older versions that might use different response structure
+        elif hasattr(response, 'candidates'):
+            return response.candidates[0].content.parts[0].text
+        else:
+            # Try to extract text from response in a different way
+            return str(response)
+    
+    @staticmethod
+    def _combined_prompt(image_analyses):
+        """Build the combined analysis prompt from the individual analyses."""
+        # Create a prompt with all individual analyses
+        analyses_text = ""
+        for item in image_analyses:
+            analyses_text += f"Análise da imagem {item['filename']}:\n{item['analysis']}\n\n"
+        
+        return f"""Com base nas seguintes análises individuais de imagens de um veículo com avarias:
+
+{analyses_text}
+
+{COMBINED_ANALYSIS_INSTRUCTIONS}"""
+    
+    @staticmethod
+    def _question_prompt(question, analysis_text):
+        """Build the prompt used to answer a question about the analysis."""
+        return f"""Você é um especialista em vistoria veicular chamado Gemini. 
+            Com base na seguinte análise de um veículo com avarias:
+
+{analysis_text}
+
+Responda à seguinte pergunta do usuário de forma técnica e precisa:
+
+{question}
+
+Importante: Responda apenas com base nas informações contidas na análise acima. 
+Se a informação não estiver presente na análise, diga que não possui essa informação específica.
+Não invente detalhes que não estejam na análise.
+"""
+    
+    def _generate_with_escalation(self, image_bytes, prompt, needs_escalation, generation_config=None,
+                                  start_tier=0):
+        """Send an image at increasing resolutions until the answer is conclusive.
+        
+        Args:
+            image_bytes: The image content in bytes
+            prompt: Instructions sent with the image
+            needs_escalation: Function telling whether a response text is inconclusive
+            generation_config: Optional generation config for the request
+            start_tier: Index of the first resolution tier to try
+            
+        Returns:
+            str: Response text of the last request
+        """
+        # Start with a downscaled image and only escalate to a higher
+        # resolution when the answer is inconclusive
+        for tier, side in enumerate(RESOLUTION_TIERS[start_tier:], start_tier):
+            blob = prepare_model_image(image_bytes, side,
+                                       token_budget=IMAGE_TOKEN_BUDGET if tier == 0 else None)
+            
+            start = time.perf_counter()
+            response = self.vision_model.generate_content([prompt, blob],
+                                                          generation_config=generation_config,
+                                                          request_options={"timeout": self.timeout})
+            self._record_resolution(side, len(blob["data"]), time.perf_counter() - start)
+            
+            text = self._response_text(response)
+            if not needs_escalation(text):
+                break
+        
+        return text
     
     def analyze_image(self, image_bytes):
         """Analyze an image using Gemini Vision.
@@ -47,40 +265,194 @@ class GeminiHandler:
         Returns:
             str: Analysis result
         """
-        try:
-            # Convert bytes to PIL Image
-            img = Image.open(io.BytesIO(image_bytes))
+        with timed("gemini_analysis") as timing:
+            try:
+                cache_key = self._image_cache_key(self.image_digest(image_bytes))
+                cached = self.cache.get("image", cache_key)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
             
-            # Create prompt for vehicle damage analysis
-            prompt = """Você é um especialista em vistoria veicular. Analise esta imagem de um veículo e forneça:
+                analysis = self._generate_with_escalation(image_bytes, IMAGE_ANALYSIS_PROMPT,
+                                                          needs_higher_resolution)
             
-            1. Identificação do veículo (tipo, marca, modelo, cor)
-            2. Localização dos danos (para-choque, porta, capô, etc.)
-            3. Tipo de dano (amassado, arranhão, quebrado, etc.)
-            4. Severidade do dano (leve, moderado, grave)
-            5. Possível impacto na estrutura do veículo
-            6. Estimativa de peças afetadas
-            
-            Forneça uma análise técnica e detalhada como um especialista em vistoria veicular.
-            Seja preciso na identificação do veículo e dos danos com base no que você realmente vê na imagem.
-            """
+                self.cache.put("image", cache_key, analysis)
+                return analysis
+                
+            except Exception as e:
+                print(f"Error analyzing image with Gemini: {e}")
+                raise e
+    
+    def _structured_cache_key(self, image_bytes):
+        """Cache key of a structured per-image analysis."""
+        return sha256_digest(self._image_cache_key(self.image_digest(image_bytes)),
+                             STRUCTURED_ANALYSIS_PROMPT, repr(ANALYSIS_RESPONSE_SCHEMA))
+    
+    def analyze_image_structured(self, image_bytes, start_tier=0):
+        """Analyze an image using Gemini Vision with a fixed JSON response schema.
+        
+        Args:
+            image_bytes: The image content in bytes
+            start_tier: Index of the first resolution tier to try
             
-            # Generate content with the image using the updated model
-            response = self.vision_model.generate_content([prompt, img])
+        Returns:
+            VehicleAnalysis: Structured analysis result
+        """
+        with timed("gemini_analysis") as timing:
+            try:
+                cache_key = self._structured_cache_key(image_bytes)
+                cached = self.cache.get("structured", cache_key)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return VehicleAnalysis.from_stored_json(cached)
+                
+                generation_config = genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=ANALYSIS_RESPONSE_SCHEMA
+                )
+                text = self._generate_with_escalation(image_bytes, STRUCTURED_ANALYSIS_PROMPT,
+                                                      self._structured_needs_escalation, generation_config,
+                                                      start_tier)
+                
+                analysis = VehicleAnalysis.from_json(text)
+                self.cache.put("structured", cache_key, analysis.to_json())
+                return analysis
+                
+            except Exception as e:
+                print(f"Error analyzing image with Gemini: {e}")
+                raise e
+    
+    @staticmethod
+    def _structured_needs_escalation(text):
+        """Escalate when the structured answer is low-confidence or reports no damage."""
+        try:
+            analysis = VehicleAnalysis.from_json(text)
+        except ValueError:
+            return True
+        return GeminiHandler._structured_inconclusive(analysis)
+    
+    @staticmethod
+    def _structured_inconclusive(analysis):
+        """Check whether a structured analysis is low-confidence or reports no damage."""
+        return not analysis.damages or analysis.confidence < STRUCTURED_MIN_CONFIDENCE
+    
+    def plan_batches(self, images):
+        """Split images into batches for analyze_images_structured.
+        
+        A batch is closed when it reaches the current batch size or the
+        estimated input image tokens of GEMINI_BATCH_INPUT_TOKENS.
+        
+        Args:
+            images: List of image contents in bytes
             
-            # Check if response has text attribute (newer versions)
-            if hasattr(response, 'text'):
-                return response.text
-            # For older versions that might use different response structure
-            elif hasattr(response, 'candidates'):
-                return response.candidates[0].content.parts[0].text
+        Returns:
+            list: Lists of image indices, in order
+        """
+        with self._batch_lock:
+            batch_size = self.batch_size
+        
+        batches, current, tokens = [], [], 0
+        for i, image_bytes in enumerate(images):
+            image_tokens = estimate_request_tokens(image_bytes)
+            if current and (len(current) >= batch_size or tokens + image_tokens > GEMINI_BATCH_INPUT_TOKENS):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += image_tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _adapt_batch_size(self, succeeded):
+        """Grow the batch size after a clean batch, halve it after a failed one."""
+        with self._batch_lock:
+            if succeeded:
+                self.batch_size = min(self.batch_size + 1, self.max_batch_size)
             else:
-                # Try to extract text from response in a different way
-                return str(response)
+                self.batch_size = max(1, self.batch_size // 2)
+    
+    def analyze_images_structured(self, images, call=None):
+        """Analyze several images in a single Gemini Vision request.
+        
+        The images are sent at the lowest resolution tier with one prompt and
+        answered in per-image sections. Images missing from the response or
+        with an invalid section are analyzed with single-image calls, as are
+        inconclusive answers, which are escalated to the next tier.
+        
+        Args:
+            images: List of image contents in bytes (see plan_batches)
+            call: Runs each single-image request as call(func, *args), e.g.
+                through a circuit breaker (default: called directly)
+            
+        Returns:
+            list: VehicleAnalysis for each image, or the exception raised by
+                its single-image fallback
+        """
+        call = call or (lambda func, *args: func(*args))
+        with timed("gemini_batch_analysis") as timing:
+            try:
+                results = [None] * len(images)
+                cache_keys = [self._structured_cache_key(image_bytes) for image_bytes in images]
+                pending = []
+                for i, cache_key in enumerate(cache_keys):
+                    cached = self.cache.get("structured", cache_key)
+                    if cached is not None:
+                        results[i] = VehicleAnalysis.from_stored_json(cached)
+                    else:
+                        pending.append(i)
+                
+                if not pending:
+                    timing["outcome"] = "cache_hit"
+                    return results
+                
+                contents = [BATCH_ANALYSIS_PROMPT.format(count=len(pending))]
+                bytes_sent = 0
+                for n, i in enumerate(pending, 1):
+                    blob = prepare_model_image(images[i], RESOLUTION_TIERS[0])
+                    bytes_sent += len(blob["data"])
+                    contents += [f"Imagem {n}:", blob]
                 
-        except Exception as e:
-            print(f"Error analyzing image with Gemini: {e}")
-            raise e
+                generation_config = genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=BATCH_RESPONSE_SCHEMA,
+                    max_output_tokens=GEMINI_MAX_OUTPUT_TOKENS
+                )
+                
+                start = time.perf_counter()
+                try:
+                    response = self.vision_model.generate_content(contents,
+                                                                  generation_config=generation_config,
+                                                                  request_options={"timeout": self.timeout})
+                except Exception:
+                    self._adapt_batch_size(False)
+                    raise
+                latency = time.perf_counter() - start
+                for _ in pending:
+                    self._record_resolution(RESOLUTION_TIERS[0], bytes_sent // len(pending),
+                                            latency / len(pending))
+                
+                analyses = parse_batch_response(self._response_text(response), len(pending))
+                self._adapt_batch_size(all(a is not None for a in analyses))
+                
+                for i, analysis in zip(pending, analyses):
+                    if analysis is not None and (len(RESOLUTION_TIERS) == 1
+                                                 or not self._structured_inconclusive(analysis)):
+                        self.cache.put("structured", cache_keys[i], analysis.to_json())
+                        results[i] = analysis
+                        continue
+                    
+                    # Unparseable items start over, inconclusive ones escalate
+                    try:
+                        results[i] = call(self.analyze_image_structured, images[i],
+                                          0 if analysis is None else 1)
+                    except Exception as e:
+                        results[i] = e
+                
+                return results
+                
+            except Exception as e:
+                print(f"Error analyzing images with Gemini: {e}")
+                raise e
     
     def generate_combined_analysis(self, image_analyses):
         """Generate a combined analysis from multiple image analyses.
@@ -91,43 +463,26 @@ class GeminiHandler:
         Returns:
             str: Combined analysis
         """
-        try:
-            # Create a prompt with all individual analyses
-            analyses_text = ""
-            for item in image_analyses:
-                analyses_text += f"Análise da imagem {item['filename']}:\n{item['analysis']}\n\n"
+        with timed("combined_analysis") as timing:
+            try:
+                cache_key = self._combined_cache_key(image_analyses)
+                cached = self.cache.get("combined", cache_key)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
             
-            prompt = f"""Com base nas seguintes análises individuais de imagens de um veículo com avarias:
-
-{analyses_text}
-
-Gere um relatório técnico completo e consolidado que:
-1. Resuma todos os danos encontrados no veículo
-2. Classifique a severidade geral da batida (leve, moderada, grave)
-3. Identifique todas as peças afetadas
-4. Avalie o possível impacto na estrutura do veículo
-5. Forneça uma conclusão técnica sobre a condição geral do veículo
-
-Seu relatório deve ser detalhado, técnico e organizado em seções claras com o título "RELATÓRIO DE VISTORIA VEICULAR".
-Use apenas as informações das análises fornecidas, sem adicionar detalhes fictícios.
-"""
+                prompt = self._combined_prompt(image_analyses)
             
-            # Generate content with the updated model
-            response = self.text_model.generate_content(prompt)
+                # Generate content with the updated model
+                response = self.text_model.generate_content(prompt, request_options={"timeout": self.timeout})
             
-            # Check if response has text attribute (newer versions)
-            if hasattr(response, 'text'):
-                return response.text
-            # For older versions that might use different response structure
-            elif hasattr(response, 'candidates'):
-                return response.candidates[0].content.parts[0].text
-            else:
-                # Try to extract text from response in a different way
-                return str(response)
+                combined = self._response_text(response)
+                self.cache.put("combined", cache_key, combined)
+                return combined
                 
-        except Exception as e:
-            print(f"Error generating combined analysis with Gemini: {e}")
-            raise e
+            except Exception as e:
+                print(f"Error generating combined analysis with Gemini: {e}")
+                raise e
     
     def answer_question(self, question, analysis_text):
         """Answer a question based on the analysis.
@@ -139,46 +494,205 @@ Use apenas as informações das análises fornecidas, sem adicionar detalhes fic
         Returns:
             str: Answer to the question
         """
-        try:
-            # Print debug info
-            print(f"Analysis text is None: {analysis_text is None}")
-            print(f"Analysis text type: {type(analysis_text)}")
-            if analysis_text:
-                print(f"Analysis text length: {len(analysis_text)}")
-            
-            # Use default analysis if None is provided
-            if analysis_text is None or not analysis_text:
-                from utils.default_analysis import DEFAULT_ANALYSIS
-                analysis_text = DEFAULT_ANALYSIS
-                print("Using DEFAULT_ANALYSIS as fallback")
-                
-            prompt = f"""Você é um especialista em vistoria veicular chamado Gemini. 
-            Com base na seguinte análise de um veículo com avarias:
-
-{analysis_text}
-
-Responda à seguinte pergunta do usuário de forma técnica e precisa:
-
-{question}
-
-Importante: Responda apenas com base nas informações contidas na análise acima. 
-Se a informação não estiver presente na análise, diga que não possui essa informação específica.
-Não invente detalhes que não estejam na análise.
-"""
+        with timed("chat_answer") as timing:
+            try:
+                # Use default analysis if None is provided
+                if analysis_text is None or not analysis_text:
+                    from utils.default_analysis import DEFAULT_ANALYSIS
+                    analysis_text = DEFAULT_ANALYSIS
             
-            # Generate content with the updated model
-            response = self.text_model.generate_content(prompt)
+                cached = self.answer_cache.get(question, analysis_text)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
             
-            # Check if response has text attribute (newer versions)
-            if hasattr(response, 'text'):
-                return response.text
-            # For older versions that might use different response structure
-            elif hasattr(response, 'candidates'):
-                return response.candidates[0].content.parts[0].text
-            else:
-                # Try to extract text from response in a different way
-                return str(response)
+                prompt = self._question_prompt(question, analysis_text)
+            
+                # Generate content with the updated model
+                response = self.text_model.generate_content(prompt)
+            
+                answer = self._response_text(response)
+                self.answer_cache.put(question, analysis_text, answer)
+                return answer
+                
+            except Exception as e:
+                print(f"Error answering question with Gemini: {e}")
+                timing["outcome"] = "error"
+                return f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Por favor, tente novamente mais tarde."
+    
+    def start_chat(self, analysis_text):
+        """Start a multi-turn chat about an analysis.
+        
+        Args:
+            analysis_text: The analysis text to base answers on
+            
+        Returns:
+            InspectionChat: Chat session for the analysis
+        """
+        # Use default analysis if None is provided
+        if not analysis_text:
+            from utils.default_analysis import DEFAULT_ANALYSIS
+            analysis_text = DEFAULT_ANALYSIS
+        
+        model = genai.GenerativeModel(MODEL_NAME,
+                                      system_instruction=CHAT_SYSTEM_INSTRUCTION.format(analysis_text=analysis_text))
+        return InspectionChat(analysis_text, model, answer_cache=self.answer_cache)
+    
+    def answer_question_stream(self, question, analysis_text):
+        """Answer a question based on the analysis, yielding text as it is generated.
+        
+        Args:
+            question: User's question
+            analysis_text: The analysis text to base answers on
+            
+        Yields:
+            str: Chunks of the answer
+        """
+        with timed("chat_answer") as timing:
+            try:
+                # Use default analysis if None is provided
+                if not analysis_text:
+                    from utils.default_analysis import DEFAULT_ANALYSIS
+                    analysis_text = DEFAULT_ANALYSIS
+            
+                cached = self.answer_cache.get(question, analysis_text)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    yield cached
+                    return
+            
+                prompt = self._question_prompt(question, analysis_text)
+            
+                # Stream the response chunk by chunk
+                response = self.text_model.generate_content(prompt, stream=True)
+                chunks = []
+                for chunk in response:
+                    text = self._response_text(chunk)
+                    if text:
+                        chunks.append(text)
+                        yield text
+                
+                # Only complete answers are cached
+                self.answer_cache.put(question, analysis_text, "".join(chunks))
+                
+            except Exception as e:
+                print(f"Error answering question with Gemini: {e}")
+                timing["outcome"] = "error"
+                yield f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Por favor, tente novamente mais tarde."
+    
+    def _semaphore(self):
+        """Return the concurrency semaphore of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+            return semaphore
+    
+    async def _generate_async(self, model, contents):
+        """Run generate_content_async with the concurrency cap and timeout.
+        
+        Args:
+            model: GenerativeModel to use
+            contents: Prompt or list of prompt parts
+            
+        Returns:
+            str: Response text
+        """
+        async with self._semaphore():
+            response = await asyncio.wait_for(model.generate_content_async(contents),
+                                              timeout=self.timeout)
+        return self._response_text(response)
+    
+    async def analyze_image_async(self, image_bytes):
+        """Async version of analyze_image.
+        
+        Args:
+            image_bytes: The image content in bytes
+            
+        Returns:
+            str: Analysis result
+        """
+        with timed("gemini_analysis") as timing:
+            try:
+                cache_key = self._image_cache_key(self.image_digest(image_bytes))
+                cached = self.cache.get("image", cache_key)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
+            
+                for tier, side in enumerate(RESOLUTION_TIERS):
+                    # Resize off the event loop, large photos take a while
+                    blob = await asyncio.to_thread(prepare_model_image, image_bytes, side,
+                                                   IMAGE_TOKEN_BUDGET if tier == 0 else None)
+                
+                    start = time.perf_counter()
+                    analysis = await self._generate_async(self.vision_model, [IMAGE_ANALYSIS_PROMPT, blob])
+                    self._record_resolution(side, len(blob["data"]), time.perf_counter() - start)
                 
-        except Exception as e:
-            print(f"Error answering question with Gemini: {e}")
-            return f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Por favor, tente novamente mais tarde."
\ No newline at end of file
+                    if not needs_higher_resolution(analysis):
+                        break
+            
+                self.cache.put("image", cache_key, analysis)
+                return analysis
+                
+            except Exception as e:
+                print(f"Error analyzing image with Gemini: {e}")
+                raise e
+    
+    async def generate_combined_analysis_async(self, image_analyses):
+        """Async version of generate_combined_analysis.
+        
+        Args:
+            image_analyses: List of dictionaries containing filename and analysis
+            
+        Returns:
+            str: Combined analysis
+        """
+        with timed("combined_analysis") as timing:
+            try:
+                cache_key = self._combined_cache_key(image_analyses)
+                cached = self.cache.get("combined", cache_key)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
+            
+                combined = await self._generate_async(self.text_model, self._combined_prompt(image_analyses))
+                self.cache.put("combined", cache_key, combined)
+                return combined
+                
+            except Exception as e:
+                print(f"Error generating combined analysis with Gemini: {e}")
+                raise e
+    
+    async def answer_question_async(self, question, analysis_text):
+        """Async version of answer_question.
+        
+        Args:
+            question: User's question
+            analysis_text: The analysis text to base answers on
+            
+        Returns:
+            str: Answer to the question
+        """
+        with timed("chat_answer") as timing:
+            try:
+                # Use default analysis if None is provided
+                if not analysis_text:
+                    from utils.default_analysis import DEFAULT_ANALYSIS
+                    analysis_text = DEFAULT_ANALYSIS
+            
+                cached = self.answer_cache.get(question, analysis_text)
+                if cached is not None:
+                    timing["outcome"] = "cache_hit"
+                    return cached
+                
+                answer = await self._generate_async(self.text_model, self._question_prompt(question, analysis_text))
+                self.answer_cache.put(question, analysis_text, answer)
+                return answer
+                
+            except Exception as e:
+                print(f"Error answering question with Gemini: {e}")
+                timing["outcome"] = "error"
+                return f"Desculpe, ocorreu um erro ao processar sua pergunta: {str(e)}. Por favor, tente novamente mais tarde."
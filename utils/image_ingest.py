@@ -0,0 +1,227 @@
+import os
+import io
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from utils.analysis_cache import sha256_digest
+from utils.image_preprocessor import RESOLUTION_TIERS, IMAGE_TOKEN_BUDGET, JPEG_QUALITY, fit_size
+from utils.report_generator import THUMBNAIL_SIZE
+from utils.metrics import timed, STAGE_BYTES
+
+# Maximum (width, height) of the gallery rendition shown in the app
+GALLERY_SIZE = (640, 480)
+
+# JPEG quality of the gallery and report renditions
+RENDITION_QUALITY = 85
+
+# Number of threads used to ingest a set of images
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+
+# Box-fitted renditions, by name (the model rendition is sized by fit_size)
+RENDITION_SIZES = {
+    "gallery": GALLERY_SIZE,
+    "report": THUMBNAIL_SIZE
+}
+
+
+class IngestedImage(bytes):
+    """Original image bytes with their digest and renditions.
+
+    It is the original image everywhere bytes are expected, and has the
+    name/getvalue() interface of a Streamlit UploadedFile, so it can be
+    passed through the pipeline unchanged. Consumers that know about
+    renditions read them instead of decoding the original again.
+    """
+
+    def __new__(cls, content, name, digest=None, size=None, renditions=None, model_params=None):
+        image = super().__new__(cls, content)
+        image.name = name
+        image.digest = digest or sha256_digest(content)
+        image.size = size
+        image.renditions = renditions or {}
+        image.model_params = model_params
+        return image
+
+    def __reduce__(self):
+        return (IngestedImage, (bytes(self), self.name, self.digest, self.size, self.renditions, self.model_params))
+
+    def getvalue(self):
+        """Return the image content (this object)."""
+        return self
+
+    def rendition_for(self, size):
+        """Return the JPEG rendition fitted to a (width, height) box, or None."""
+        for name, rendition_size in RENDITION_SIZES.items():
+            if tuple(size) == rendition_size and name in self.renditions:
+                return self.renditions[name]
+        return None
+
+
+def _encode(img, **options):
+    """Encode an RGB image as JPEG."""
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", **options)
+    return buffer.getvalue()
+
+
+def ingest_image(content, name):
+    """Decode an image once and produce its renditions.
+
+    JPEGs are decoded in draft mode at the size of the model rendition and
+    EXIF orientation is applied; the smaller renditions are scaled down
+    from that decode. The model rendition is the same image
+    prepare_model_image produces for the first resolution tier.
+
+    Args:
+        content: The original image content in bytes
+        name: File name of the image
+
+    Returns:
+        IngestedImage: The image with model, gallery and report renditions
+    """
+    with timed("image_ingest"):
+        img = Image.open(io.BytesIO(content))
+        size = img.size
+        model_params = (RESOLUTION_TIERS[0], IMAGE_TOKEN_BUDGET, JPEG_QUALITY)
+        if img.format == "JPEG":
+            img.draft("RGB", fit_size(img.width, img.height, RESOLUTION_TIERS[0], IMAGE_TOKEN_BUDGET))
+
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail(fit_size(img.width, img.height, RESOLUTION_TIERS[0], IMAGE_TOKEN_BUDGET), Image.LANCZOS)
+        renditions = {"model": _encode(img, quality=JPEG_QUALITY, optimize=True)}
+
+        # Largest box first, each one scaled from the previous
+        for rendition, box in sorted(RENDITION_SIZES.items(), key=lambda item: -item[1][0] * item[1][1]):
+            img.thumbnail(box, Image.LANCZOS)
+            renditions[rendition] = _encode(img, quality=RENDITION_QUALITY)
+
+        STAGE_BYTES.inc(len(content), stage="image_ingest")
+        return IngestedImage(content, name, size=size, renditions=renditions, model_params=model_params)
+
+
+def ingest_images(items, max_workers=None):
+    """Ingest several images concurrently (decoding releases the GIL).
+
+    Args:
+        items: (content, name) pairs
+        max_workers: Number of threads
+
+    Returns:
+        list: IngestedImage objects, in order
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [ingest_image(content, name) for content, name in items]
+    with ThreadPoolExecutor(max_workers=max_workers or INGEST_WORKERS) as executor:
+        return list(executor.map(lambda item: ingest_image(*item), items))
+
+
+def unique_names(names):
+    """Make file names unique within an inspection, keeping their order.
+
+    Phone cameras give every photo the same name (e.g. image.jpg); repeated
+    names get a counter before the extension (image_2.jpg), so storage keys
+    do not overwrite each other.
+
+    Args:
+        names: File names
+
+    Returns:
+        list: Unique file names
+    """
+    used = set()
+    unique = []
+    for name in names:
+        base, ext = os.path.splitext(name)
+        candidate, n = name, 1
+        while candidate in used:
+            n += 1
+            candidate = f"{base}_{n}{ext}"
+        used.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+def ingest_file(path, name=None):
+    """Read and ingest an image file.
+
+    Args:
+        path: Path of the image
+        name: Name of the image (default: the file name)
+
+    Returns:
+        IngestedImage: The ingested image
+    """
+    with open(path, 'rb') as f:
+        return ingest_image(f.read(), name or os.path.basename(path))
+
+
+def rendition_key(inspection_id, filename, rendition):
+    """Storage key of a rendition, next to the original upload.
+
+    Args:
+        inspection_id: Unique ID for the inspection
+        filename: Name of the original image
+        rendition: Rendition name ("model", "gallery" or "report")
+
+    Returns:
+        str: Object key
+    """
+    return f"uploads/{inspection_id}/{filename}.{rendition}.jpg"
+
+
+def store_image(storage, inspection_id, image, background=True):
+    """Store an image and its renditions under uploads/{inspection_id}/.
+
+    Args:
+        storage: S3Handler or LocalStorage
+        inspection_id: Unique ID for the inspection
+        image: IngestedImage
+        background: Upload in the background when the storage supports it
+
+    Returns:
+        list: Upload results (futures for background uploads, else bools)
+    """
+    upload = (background and getattr(storage, "upload_file_object_async", None)) or storage.upload_file_object
+    results = [upload(image, f"uploads/{inspection_id}/{image.name}")]
+    for rendition, data in image.renditions.items():
+        results.append(upload(data, rendition_key(inspection_id, image.name, rendition)))
+    return results
+
+
+def wait_stored(results, timeout=None):
+    """Wait for the uploads of store_image and report whether all succeeded.
+
+    Args:
+        results: Upload results returned by store_image
+        timeout: Maximum time in seconds to wait for each background upload
+
+    Returns:
+        bool: True if the image and all its renditions were stored
+    """
+    stored = True
+    for result in results:
+        if hasattr(result, "result"):
+            try:
+                result = result.result(timeout=timeout)
+            except Exception as e:
+                print(f"Error waiting for upload: {e}")
+                result = False
+        stored = stored and bool(result)
+    return stored
+
+
+def load_rendition(storage, inspection_id, filename, rendition):
+    """Read a stored rendition of an image.
+
+    Args:
+        storage: S3Handler or LocalStorage
+        inspection_id: Unique ID for the inspection
+        filename: Name of the original image
+        rendition: Rendition name
+
+    Returns:
+        bytes: JPEG rendition, or None if it is not stored
+    """
+    return storage.download_file(rendition_key(inspection_id, filename, rendition))
@@ -0,0 +1,128 @@
+import os
+import io
+import math
+from PIL import Image, ImageOps
+
+# Longest image side (pixels) for each resolution tier, lowest first
+RESOLUTION_TIERS = [int(side) for side in os.getenv("GEMINI_IMAGE_TIERS", "1024,2048").split(",")]
+
+# Maximum image tokens per request for one image
+IMAGE_TOKEN_BUDGET = int(os.getenv("GEMINI_IMAGE_TOKEN_BUDGET", "1032"))
+
+# JPEG quality used when re-encoding model input
+JPEG_QUALITY = int(os.getenv("GEMINI_IMAGE_JPEG_QUALITY", "85"))
+
+# Gemini bills images in 768x768 tiles of 258 tokens each
+TILE_SIZE = 768
+TOKENS_PER_TILE = 258
+
+
+def estimate_image_tokens(width, height):
+    """Estimate the number of input tokens for an image.
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+
+    Returns:
+        int: Estimated token count
+    """
+    if width <= 384 and height <= 384:
+        return TOKENS_PER_TILE
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE) * TOKENS_PER_TILE
+
+
+def fit_size(width, height, max_side, token_budget=IMAGE_TOKEN_BUDGET):
+    """Compute a size within max_side and the token budget, keeping aspect ratio.
+
+    Args:
+        width: Original width in pixels
+        height: Original height in pixels
+        max_side: Maximum length of the longest side
+        token_budget: Maximum estimated tokens (None to ignore)
+
+    Returns:
+        tuple: (width, height)
+    """
+    scale = min(1.0, max_side / max(width, height))
+    new_width, new_height = max(1, int(width * scale)), max(1, int(height * scale))
+
+    if token_budget:
+        while estimate_image_tokens(new_width, new_height) > token_budget and max(new_width, new_height) > TILE_SIZE:
+            new_width, new_height = max(1, int(new_width * 0.9)), max(1, int(new_height * 0.9))
+
+    return new_width, new_height
+
+
+def estimate_request_tokens(image_bytes, max_side=RESOLUTION_TIERS[0], token_budget=IMAGE_TOKEN_BUDGET):
+    """Estimate the tokens of an image once prepared for the model.
+
+    Only the image header is read, the pixels are not decoded.
+
+    Args:
+        image_bytes: The original image content in bytes
+        max_side: Maximum length of the longest side
+        token_budget: Maximum estimated image tokens
+
+    Returns:
+        int: Estimated token count
+    """
+    if getattr(image_bytes, "size", None):
+        # Ingested image: the size is known without parsing the header
+        return estimate_image_tokens(*fit_size(*image_bytes.size, max_side, token_budget))
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return estimate_image_tokens(*fit_size(img.width, img.height, max_side, token_budget))
+
+
+def prepare_model_image(image_bytes, max_side, token_budget=IMAGE_TOKEN_BUDGET, quality=JPEG_QUALITY):
+    """Downscale and re-encode an image for the model.
+
+    JPEGs are decoded in draft mode at the reduced size, so large phone
+    photos are never fully decoded. EXIF orientation is applied.
+
+    An ingested image whose model rendition was made with the same
+    parameters returns it without decoding the original.
+
+    Args:
+        image_bytes: The original image content in bytes, or an IngestedImage
+        max_side: Maximum length of the longest side
+        token_budget: Maximum estimated image tokens
+        quality: JPEG quality
+
+    Returns:
+        dict: Blob with mime_type and data, ready for generate_content
+    """
+    if getattr(image_bytes, "model_params", None) == (max_side, token_budget, quality):
+        return {"mime_type": "image/jpeg", "data": image_bytes.renditions["model"]}
+
+    img = Image.open(io.BytesIO(image_bytes))
+    target = fit_size(img.width, img.height, max_side, token_budget)
+    if img.format == "JPEG":
+        img.draft("RGB", target)
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail(fit_size(img.width, img.height, max_side, token_budget), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+
+
+def needs_higher_resolution(analysis):
+    """Check whether an answer is low-confidence or reports no damage.
+
+    Args:
+        analysis: Analysis text returned by the model
+
+    Returns:
+        bool: True if the image should be re-analyzed at a higher resolution
+    """
+    text = analysis.lower()
+    markers = [
+        "não é possível", "não foi possível", "difícil identificar", "difícil determinar",
+        "baixa resolução", "imagem desfocada", "não está clara", "não é clara",
+        "nenhum dano", "sem danos", "não há danos", "não foram identificados danos visíveis",
+    ]
+    return any(marker in text for marker in markers)
@@ -0,0 +1,234 @@
+import os
+import io
+from dataclasses import dataclass, field
+import numpy as np
+from PIL import Image, ImageOps
+from utils.metrics import timed, Counter
+
+# Longest side (pixels) of the grayscale image the checks run on
+TRIAGE_IMAGE_SIZE = int(os.getenv("TRIAGE_IMAGE_SIZE", "640"))
+
+# Maximum Hamming distance (of 64 bits) between the dHash and the pHash of
+# two images for them to count as near-duplicates; both must agree
+DUPLICATE_DHASH_DISTANCE = int(os.getenv("TRIAGE_DHASH_DISTANCE", "10"))
+DUPLICATE_PHASH_DISTANCE = int(os.getenv("TRIAGE_PHASH_DISTANCE", "12"))
+
+# Minimum focus measure (Laplacian variance of the sharpest tiles) for an
+# image to count as in focus
+BLUR_THRESHOLD = float(os.getenv("TRIAGE_BLUR_THRESHOLD", "60"))
+
+# Grid of tiles the focus is measured on, and the percentile of tiles used,
+# so large smooth areas (e.g. body panels) do not read as blur
+FOCUS_GRID = 8
+FOCUS_PERCENTILE = 90
+
+# Exposure limits: mean luma, and the fraction of clipped pixels
+DARK_MEAN = 35
+BRIGHT_MEAN = 225
+CLIPPED_FRACTION = 0.6
+
+# Issue codes and the message shown to the user
+ISSUE_MESSAGES = {
+    "blurry": "imagem desfocada",
+    "dark": "imagem muito escura",
+    "bright": "imagem superexposta"
+}
+
+TRIAGE_TOTAL = Counter(
+    "vistocarro_triage_images_total",
+    "Images by pre-flight triage outcome.",
+    ["outcome"]
+)
+
+# 1-D DCT-II basis for the 32x32 pHash
+_DCT_SIZE = 32
+_DCT = np.cos(np.pi * np.outer(np.arange(_DCT_SIZE), 2 * np.arange(_DCT_SIZE) + 1) / (2 * _DCT_SIZE))
+
+
+@dataclass
+class ImageQuality:
+    """Perceptual hashes and quality measurements of an image."""
+
+    dhash: int
+    phash: int
+    sharpness: float
+    mean_luma: float
+    dark_fraction: float
+    bright_fraction: float
+    issues: list = field(default_factory=list)
+
+
+@dataclass
+class TriageResult:
+    """Outcome of the triage of a set of images.
+
+    Attributes:
+        qualities: ImageQuality for each image
+        analyze: Indices of the images to analyze, in order
+        duplicate_of: Index of the representative, for each near-duplicate
+        rejected: Issue codes, for each unusable image that is skipped
+    """
+
+    qualities: list
+    analyze: list
+    duplicate_of: dict = field(default_factory=dict)
+    rejected: dict = field(default_factory=dict)
+
+
+def load_gray(image_bytes, max_side=TRIAGE_IMAGE_SIZE):
+    """Decode a downscaled grayscale array of an image.
+
+    The gallery rendition of an ingested image is used when available;
+    otherwise JPEGs are decoded in draft mode.
+
+    Args:
+        image_bytes: The image content in bytes, or an IngestedImage
+        max_side: Maximum length of the longest side
+
+    Returns:
+        numpy.ndarray: float32 array of shape (height, width), 0-255
+    """
+    image_bytes = getattr(image_bytes, "renditions", {}).get("gallery", image_bytes)
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.format == "JPEG":
+        img.draft("L", (max_side, max_side))
+
+    img = ImageOps.exif_transpose(img)
+    img = img.convert("L")
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _bits_to_int(bits):
+    """Pack a boolean array into an integer."""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(gray):
+    """Difference hash: sign of the horizontal gradient on a 9x8 grid.
+
+    Args:
+        gray: Grayscale array
+
+    Returns:
+        int: 64-bit hash
+    """
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.float32)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    """Perceptual hash: low frequencies of the DCT against their median.
+
+    Args:
+        gray: Grayscale array
+
+    Returns:
+        int: 64-bit hash
+    """
+    small = np.asarray(Image.fromarray(gray).resize((_DCT_SIZE, _DCT_SIZE), Image.BILINEAR), dtype=np.float64)
+    low = (_DCT @ small @ _DCT.T)[:8, :8]
+    # The DC term only reflects brightness, so it is left out of the median
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a, b):
+    """Number of differing bits of two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def laplacian_variance(gray, grid=FOCUS_GRID, percentile=FOCUS_PERCENTILE):
+    """Focus measure: variance of the 4-neighbour Laplacian in the sharpest tiles.
+
+    The squared Laplacian is averaged over a grid x grid set of tiles
+    (with a reshape, without Python loops) and the given percentile of the
+    tiles is returned.
+
+    Args:
+        gray: Grayscale array
+        grid: Number of tiles per side
+        percentile: Percentile of the tile variances
+
+    Returns:
+        float: Focus measure (low for blurry images)
+    """
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    height, width = laplacian.shape
+    tile_h, tile_w = max(1, height // grid), max(1, width // grid)
+    rows, cols = height // tile_h, width // tile_w
+    tiles = (laplacian[:rows * tile_h, :cols * tile_w] ** 2).reshape(rows, tile_h, cols, tile_w).mean(axis=(1, 3))
+    return float(np.percentile(tiles, percentile))
+
+
+def assess_image(image_bytes):
+    """Hash an image and check its focus and exposure.
+
+    Args:
+        image_bytes: The image content in bytes, or an IngestedImage
+
+    Returns:
+        ImageQuality: Measurements and issue codes (see ISSUE_MESSAGES)
+    """
+    gray = load_gray(image_bytes)
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256) / gray.size
+    quality = ImageQuality(
+        dhash=dhash(gray),
+        phash=phash(gray),
+        sharpness=round(laplacian_variance(gray), 2),
+        mean_luma=round(float(gray.mean()), 2),
+        dark_fraction=round(float(histogram[:20].sum()), 4),
+        bright_fraction=round(float(histogram[246:].sum()), 4)
+    )
+
+    if quality.sharpness < BLUR_THRESHOLD:
+        quality.issues.append("blurry")
+    if quality.mean_luma < DARK_MEAN or quality.dark_fraction > CLIPPED_FRACTION:
+        quality.issues.append("dark")
+    elif quality.mean_luma > BRIGHT_MEAN or quality.bright_fraction > CLIPPED_FRACTION:
+        quality.issues.append("bright")
+    return quality
+
+
+def triage_images(images):
+    """Pick the images worth analyzing.
+
+    Near-duplicates (both hashes within their distance) are grouped and
+    only the sharpest usable image of a group is analyzed. Blurry, dark or
+    overexposed images are skipped, unless no image of the set is usable,
+    in which case the representatives are analyzed anyway.
+
+    Args:
+        images: List of image contents in bytes, or IngestedImage objects
+
+    Returns:
+        TriageResult: Images to analyze, duplicates and rejected images
+    """
+    with timed("image_triage"):
+        qualities = [assess_image(image_bytes) for image_bytes in images]
+
+        # Representatives in order of preference: usable first, then sharpest
+        order = sorted(range(len(images)), key=lambda i: (bool(qualities[i].issues), -qualities[i].sharpness))
+        representatives, duplicate_of = [], {}
+        for i in order:
+            for rep in representatives:
+                if (hamming(qualities[i].dhash, qualities[rep].dhash) <= DUPLICATE_DHASH_DISTANCE
+                        and hamming(qualities[i].phash, qualities[rep].phash) <= DUPLICATE_PHASH_DISTANCE):
+                    duplicate_of[i] = rep
+                    break
+            else:
+                representatives.append(i)
+
+        usable = [i for i in representatives if not qualities[i].issues]
+        analyze = sorted(usable or representatives)
+        rejected = {i: qualities[i].issues for i in representatives if i not in analyze}
+
+        TRIAGE_TOTAL.inc(len(analyze), outcome="analyzed")
+        TRIAGE_TOTAL.inc(len(duplicate_of), outcome="duplicate")
+        TRIAGE_TOTAL.inc(len(rejected), outcome="rejected")
+        return TriageResult(qualities=qualities, analyze=analyze, duplicate_of=duplicate_of, rejected=rejected)
+
+
+def describe_issues(issues):
+    """Join issue codes into a message for the user."""
+    return ", ".join(ISSUE_MESSAGES[issue] for issue in issues)
@@ -0,0 +1,361 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from utils.structured_analysis import VehicleAnalysis
+from utils.local_combiner import merge_analyses, structured_of
+
+# Default location of the catalog database
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "storage", "catalog.db")
+
+# Seconds a writer waits for another process's transaction to finish
+CATALOG_BUSY_TIMEOUT = float(os.getenv("CATALOG_BUSY_TIMEOUT", "10"))
+
+# Version of the schema, kept in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    inspection_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    status TEXT NOT NULL,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    analyzed_count INTEGER NOT NULL DEFAULT 0,
+    severity TEXT,
+    structural_impact INTEGER,
+    combined_analysis TEXT,
+    pdf_key TEXT,
+    txt_key TEXT
+);
+CREATE INDEX IF NOT EXISTS inspections_updated ON inspections (updated_at);
+CREATE INDEX IF NOT EXISTS inspections_severity ON inspections (severity, updated_at);
+
+CREATE TABLE IF NOT EXISTS images (
+    inspection_id TEXT NOT NULL REFERENCES inspections (inspection_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    digest TEXT,
+    storage_key TEXT,
+    renditions TEXT,
+    triage TEXT NOT NULL DEFAULT 'analyzed',
+    issues TEXT,
+    severity TEXT,
+    parts TEXT,
+    analysis TEXT,
+    structured TEXT,
+    error TEXT,
+    analyzed_at TEXT,
+    PRIMARY KEY (inspection_id, position)
+);
+CREATE INDEX IF NOT EXISTS images_digest ON images (digest);
+
+CREATE TABLE IF NOT EXISTS inspection_parts (
+    inspection_id TEXT NOT NULL REFERENCES inspections (inspection_id) ON DELETE CASCADE,
+    part TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    PRIMARY KEY (inspection_id, part)
+);
+CREATE INDEX IF NOT EXISTS inspection_parts_part ON inspection_parts (part);
+"""
+
+
+def _now():
+    """Current time as an ISO 8601 string."""
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class InspectionCatalog:
+    """SQLite catalog of inspections and their images.
+
+    One row per inspection and per image, with digests, storage keys,
+    triage outcome, severity, damaged parts and the analyses, so past
+    inspections can be listed, searched and reopened without listing the
+    bucket or re-running the analysis. Each pipeline stage is recorded in
+    its own transaction. The database runs in WAL mode, so the app and
+    batch workers can read while another process writes.
+    """
+
+    def __init__(self, path=None):
+        """Initialize the catalog, creating the schema if needed.
+
+        Args:
+            path: Database file (default: storage/catalog.db or INSPECTION_CATALOG_PATH)
+        """
+        self.path = path or os.getenv("INSPECTION_CATALOG_PATH", DEFAULT_CATALOG_PATH)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            # Version 0 keyed images by file name, which is not unique within an
+            # upload (phone cameras name every photo image.jpg); positions are unique
+            migrate = version < 1 and conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'").fetchone() is not None
+            if migrate:
+                conn.execute("ALTER TABLE images RENAME TO images_v0")
+                conn.execute("DROP INDEX IF EXISTS images_digest")
+
+            # Statement by statement: executescript would commit the open transaction
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+
+            if migrate:
+                conn.execute("INSERT INTO images SELECT * FROM images_v0")
+                conn.execute("DROP TABLE images_v0")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _connection(self):
+        """Return this thread's connection (sqlite3 connections are per thread)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Transactions are begun explicitly (see _transaction), so DDL is not autocommitted
+            conn = sqlite3.connect(self.path, timeout=CATALOG_BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block in one transaction, committed on success and rolled back on error.
+
+        The write lock is taken up front (BEGIN IMMEDIATE), and schema
+        changes are part of the transaction, so the migration in __init__
+        is applied completely or not at all.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _touch(self, conn, inspection_id, status):
+        """Create the inspection row if needed and update its status."""
+        now = _now()
+        conn.execute("""
+            INSERT INTO inspections (inspection_id, created_at, updated_at, status) VALUES (?, ?, ?, ?)
+            ON CONFLICT (inspection_id) DO UPDATE SET updated_at = excluded.updated_at, status = excluded.status
+        """, (inspection_id, now, now, status))
+
+    def record_images(self, inspection_id, images, triage=None):
+        """Record the images of an inspection once they are ingested.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            images: IngestedImage objects (or objects with name and getvalue())
+            triage: Optional TriageResult of the images
+        """
+        from utils.image_ingest import rendition_key
+
+        rows = []
+        for position, image in enumerate(images):
+            outcome, issues = "analyzed", None
+            if triage is not None and position in triage.duplicate_of:
+                outcome = "duplicate"
+            elif triage is not None and position in triage.rejected:
+                outcome, issues = "rejected", json.dumps(triage.rejected[position])
+            renditions = {name: rendition_key(inspection_id, image.name, name)
+                          for name in getattr(image, "renditions", {})}
+            rows.append((inspection_id, position, image.name, getattr(image, "digest", None),
+                         f"uploads/{inspection_id}/{image.name}", json.dumps(renditions), outcome, issues))
+
+        with self._transaction() as conn:
+            self._touch(conn, inspection_id, "ingested")
+            conn.execute("DELETE FROM images WHERE inspection_id = ?", (inspection_id,))
+            conn.executemany("""
+                INSERT INTO images (inspection_id, position, filename, digest, storage_key, renditions, triage, issues)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.execute("UPDATE inspections SET image_count = ? WHERE inspection_id = ?",
+                         (len(rows), inspection_id))
+
+    def record_storage_failures(self, inspection_id, positions):
+        """Clear the storage keys of images whose upload failed.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            positions: Positions of the images that were not stored
+        """
+        with self._transaction() as conn:
+            conn.executemany("""
+                UPDATE images SET storage_key = NULL, renditions = NULL WHERE inspection_id = ? AND position = ?
+            """, [(inspection_id, position) for position in positions])
+
+    def record_analyses(self, inspection_id, image_analyses, errors=None):
+        """Record the per-image analyses.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            image_analyses: Dictionaries with position (index of the image in
+                the list given to record_images), analysis and structured
+            errors: Optional Gemini error message by position (fallback used)
+        """
+        errors = errors or {}
+        now = _now()
+        rows = []
+        for item in image_analyses:
+            structured = structured_of(item)
+            rows.append((
+                structured.overall_severity if structured and structured.damages else None,
+                json.dumps([d.part for d in structured.damages], ensure_ascii=False) if structured else None,
+                item.get("analysis"),
+                structured.to_json() if structured else None,
+                errors.get(item["position"]),
+                now,
+                inspection_id,
+                item["position"]
+            ))
+
+        with self._transaction() as conn:
+            self._touch(conn, inspection_id, "analyzed")
+            conn.executemany("""
+                UPDATE images SET severity = ?, parts = ?, analysis = ?, structured = ?, error = ?, analyzed_at = ?
+                WHERE inspection_id = ? AND position = ?
+            """, rows)
+            conn.execute("UPDATE inspections SET analyzed_count = ? WHERE inspection_id = ?",
+                         (len(rows), inspection_id))
+
+    def record_combined(self, inspection_id, combined_analysis, image_analyses):
+        """Record the combined analysis with the consolidated severity and parts.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            combined_analysis: Combined analysis text
+            image_analyses: The per-image analyses it was built from
+        """
+        analyses = [s for s in (structured_of(item) for item in image_analyses) if s is not None]
+        merged = merge_analyses(analyses)
+        severity = merged["severity"] if merged["parts"] else None
+
+        with self._transaction() as conn:
+            self._touch(conn, inspection_id, "combined")
+            conn.execute("""
+                UPDATE inspections SET combined_analysis = ?, severity = ?, structural_impact = ?
+                WHERE inspection_id = ?
+            """, (combined_analysis, severity,
+                  None if merged["structural_impact"] is None else int(merged["structural_impact"]), inspection_id))
+            conn.execute("DELETE FROM inspection_parts WHERE inspection_id = ?", (inspection_id,))
+            conn.executemany("INSERT INTO inspection_parts (inspection_id, part, severity) VALUES (?, ?, ?)",
+                             [(inspection_id, part, entry["severity"]) for part, entry in merged["parts"].items()])
+
+    def record_reports(self, inspection_id, pdf_key, txt_key):
+        """Record the storage keys of the reports; the inspection is complete.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            pdf_key: Storage key of the PDF report
+            txt_key: Storage key of the TXT report
+        """
+        with self._transaction() as conn:
+            self._touch(conn, inspection_id, "done")
+            conn.execute("UPDATE inspections SET pdf_key = ?, txt_key = ? WHERE inspection_id = ?",
+                         (pdf_key, txt_key, inspection_id))
+
+    def list_inspections(self, limit=50, offset=0, severity=None, part=None, status=None):
+        """List inspections, most recently updated first.
+
+        Args:
+            limit: Maximum number of inspections
+            offset: Number of inspections to skip
+            severity: Only inspections with this consolidated severity
+            part: Only inspections with damage on this part (case-insensitive)
+            status: Only inspections in this status (e.g. "done")
+
+        Returns:
+            list: Dictionaries with the inspection columns, without the analysis text
+        """
+        clauses, params = [], []
+        if severity:
+            clauses.append("severity = ?")
+            params.append(severity)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if part:
+            clauses.append("inspection_id IN (SELECT inspection_id FROM inspection_parts WHERE part = ?)")
+            params.append(part.strip().lower())
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        rows = self._connection().execute(f"""
+            SELECT inspection_id, created_at, updated_at, status, image_count, analyzed_count, severity,
+                   structural_impact, pdf_key, txt_key
+            FROM inspections {where} ORDER BY updated_at DESC LIMIT ? OFFSET ?
+        """, (*params, limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_inspection(self, inspection_id):
+        """Load an inspection with its images and analyses.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+
+        Returns:
+            dict: Inspection columns, parts (part -> severity) and images (in
+                upload order, with structured as a VehicleAnalysis), or None
+        """
+        conn = self._connection()
+        row = conn.execute("SELECT * FROM inspections WHERE inspection_id = ?", (inspection_id,)).fetchone()
+        if row is None:
+            return None
+
+        inspection = dict(row)
+        inspection["parts"] = {r["part"]: r["severity"] for r in conn.execute(
+            "SELECT part, severity FROM inspection_parts WHERE inspection_id = ?", (inspection_id,))}
+        inspection["images"] = []
+        for r in conn.execute("SELECT * FROM images WHERE inspection_id = ? ORDER BY position", (inspection_id,)):
+            image = dict(r)
+            image["renditions"] = json.loads(image["renditions"] or "{}")
+            image["issues"] = json.loads(image["issues"]) if image["issues"] else []
+            image["parts"] = json.loads(image["parts"]) if image["parts"] else []
+            image["structured"] = VehicleAnalysis.from_stored_json(image["structured"]) if image["structured"] else None
+            inspection["images"].append(image)
+        return inspection
+
+    @staticmethod
+    def image_analyses(inspection):
+        """Rebuild the image_analyses list of an inspection loaded with get_inspection.
+
+        Args:
+            inspection: Dictionary returned by get_inspection
+
+        Returns:
+            list: Dictionaries with position, filename, analysis, structured and digest
+        """
+        return [{"position": image["position"], "filename": image["filename"], "analysis": image["analysis"],
+                 "structured": image["structured"], "digest": image["digest"]}
+                for image in inspection["images"] if image["analysis"] is not None]
+
+    def find_by_digest(self, digest):
+        """Find the inspections an image (by content digest) belongs to.
+
+        Args:
+            digest: SHA-256 hex digest of the image
+
+        Returns:
+            list: (inspection_id, filename) pairs
+        """
+        rows = self._connection().execute(
+            "SELECT inspection_id, filename FROM images WHERE digest = ? ORDER BY inspection_id", (digest,))
+        return [(row["inspection_id"], row["filename"]) for row in rows]
+
+    def delete_inspection(self, inspection_id):
+        """Remove an inspection and its images from the catalog.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+
+        Returns:
+            bool: True if the inspection existed
+        """
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM inspections WHERE inspection_id = ?",
+                                (inspection_id,)).rowcount > 0
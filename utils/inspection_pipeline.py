@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from utils.analysis_cache import sha256_digest, content_digest
+from utils.metrics import timed, FALLBACK_TOTAL
+from utils.circuit_breaker import gemini_breaker
+from utils.structured_analysis import VehicleAnalysis
+from utils.local_combiner import generate_local_combined_analysis, unparsed_analyses
+
+# "structured" asks Gemini for a fixed JSON schema, "text" for free-form markdown
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "structured")
+
+# Error message used when the circuit breaker skips Gemini
+CIRCUIT_OPEN_MESSAGE = "circuito aberto após falhas recentes"
+
+# Number of inspections whose results are kept in memory
+INSPECTION_MEMO_SIZE = int(os.getenv("INSPECTION_MEMO_SIZE", "64"))
+
+def _call_gemini(func, *args):
+    """Call a Gemini function through the circuit breaker.
+
+    Raises:
+        RuntimeError: If the circuit is open
+    """
+    if not gemini_breaker.allow_request():
+        raise RuntimeError(CIRCUIT_OPEN_MESSAGE)
+
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except Exception:
+        gemini_breaker.record_failure()
+        raise
+    gemini_breaker.record_success(time.perf_counter() - start)
+    return result
+
+def analyze_image_with_fallback(gemini_handler, fallback_analyzer, img_bytes):
+    """Analyze an image with Gemini, falling back to the local analyzer.
+
+    Args:
+        gemini_handler: GeminiHandler instance
+        fallback_analyzer: ImageAnalyzerFallback instance
+        img_bytes: The image content in bytes
+
+    Returns:
+        dict: analysis (markdown), structured (VehicleAnalysis), image digest
+            (None when the fallback was used) and the Gemini error message
+            (None on success)
+    """
+    try:
+        # Try with Gemini first
+        if ANALYSIS_MODE == "structured":
+            structured = _call_gemini(gemini_handler.analyze_image_structured, img_bytes)
+            analysis = structured.to_markdown()
+        else:
+            analysis = _call_gemini(gemini_handler.analyze_image, img_bytes)
+            # None for free-form prose; the combined report then does not treat it as undamaged
+            structured = VehicleAnalysis.parse_markdown(analysis)
+        digest = gemini_handler.image_digest(img_bytes)
+        error = None
+    except Exception as e:
+        # If Gemini fails or the circuit is open, use fallback analyzer
+        return _local_analysis(fallback_analyzer, img_bytes, e)
+
+    return {"analysis": analysis, "structured": structured, "digest": digest, "error": error}
+
+def _local_analysis(fallback_analyzer, img_bytes, error):
+    """Analyze an image with the local analyzer after a Gemini error."""
+    FALLBACK_TOTAL.inc(stage="gemini_analysis")
+    with timed("fallback_analysis"):
+        analysis = fallback_analyzer.analyze_image(img_bytes)
+    return {"analysis": analysis, "structured": VehicleAnalysis.parse_markdown(analysis),
+            "digest": None, "error": str(error)}
+
+def analyze_batch_with_fallback(gemini_handler, fallback_analyzer, images):
+    """Analyze several images in one Gemini request, falling back per image.
+    
+    If the batch request itself fails, each image goes through
+    analyze_image_with_fallback; images whose single-image retry failed
+    use the local analyzer. Single-image retries go through the circuit
+    breaker too, so a failing batch does not fan out into unguarded calls. Outside the structured mode the images are
+    analyzed one by one.
+    
+    Args:
+        gemini_handler: GeminiHandler instance
+        fallback_analyzer: ImageAnalyzerFallback instance
+        images: List of image contents in bytes (see GeminiHandler.plan_batches)
+    
+    Returns:
+        list: Results in the format of analyze_image_with_fallback, in order
+    """
+    if ANALYSIS_MODE != "structured" or len(images) == 1:
+        return [analyze_image_with_fallback(gemini_handler, fallback_analyzer, img_bytes) for img_bytes in images]
+    
+    try:
+        analyses = _call_gemini(gemini_handler.analyze_images_structured, images, _call_gemini)
+    except Exception:
+        FALLBACK_TOTAL.inc(stage="gemini_batch_analysis")
+        return [analyze_image_with_fallback(gemini_handler, fallback_analyzer, img_bytes) for img_bytes in images]
+    
+    results = []
+    for img_bytes, structured in zip(images, analyses):
+        if isinstance(structured, Exception):
+            results.append(_local_analysis(fallback_analyzer, img_bytes, structured))
+        else:
+            results.append({"analysis": structured.to_markdown(), "structured": structured,
+                            "digest": gemini_handler.image_digest(img_bytes), "error": None})
+    return results
+
+def combine_with_fallback(gemini_handler, fallback_analyzer, image_analyses, narrative=False):
+    """Generate the combined analysis.
+
+    By default the per-image findings are merged locally, without another
+    model call. In narrative mode, or when some analyses are not in the
+    structured format (e.g. free-form text in ANALYSIS_MODE=text), Gemini
+    writes the report, falling back to the local analyzer.
+
+    Args:
+        gemini_handler: GeminiHandler instance
+        fallback_analyzer: ImageAnalyzerFallback instance
+        image_analyses: List of dictionaries containing filename and analysis
+        narrative: Whether to ask Gemini for a narrative report
+
+    Returns:
+        tuple: (combined analysis, Gemini error message or None)
+    """
+    if not narrative and not unparsed_analyses(image_analyses):
+        with timed("local_combined_analysis"):
+            return generate_local_combined_analysis(image_analyses), None
+
+    try:
+        return _call_gemini(gemini_handler.generate_combined_analysis, image_analyses), None
+    except Exception as e:
+        FALLBACK_TOTAL.inc(stage="combined_analysis")
+        with timed("fallback_combined_analysis"):
+            return fallback_analyzer.generate_combined_analysis(image_analyses), str(e)
+
+class InspectionMemo:
+    """Thread-safe LRU memo of inspection results.
+    
+    Results are keyed by the inspection ID, the image contents and the
+    options of the run, so re-running the same inspection returns the
+    stored per-image and combined analyses without new model calls.
+    """
+    
+    def __init__(self, max_entries=None):
+        """Initialize the memo.
+        
+        Args:
+            max_entries: Maximum number of inspections kept
+        """
+        self.max_entries = max_entries or INSPECTION_MEMO_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(inspection_id, contents, **options):
+        """Compute the memo key of an inspection run.
+        
+        Args:
+            inspection_id: Unique ID for the inspection
+            contents: The image contents in bytes
+            **options: Options that change the result (e.g. narrative)
+        
+        Returns:
+            str: Hex digest
+        """
+        return sha256_digest(inspection_id, *(content_digest(c) for c in contents),
+                             repr(sorted(options.items())))
+    
+    def get(self, key):
+        """Return the stored result of a key, or None."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+    
+    def put(self, key, result):
+        """Store the result of a key, evicting the least recently used."""
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
@@ -0,0 +1,230 @@
+from collections import Counter, OrderedDict
+from utils.structured_analysis import VehicleAnalysis, SEVERITIES, STRUCTURAL_NOT_ASSESSED
+
+# Severity wording used in the consolidated report
+REPORT_SEVERITY = {"leve": "LEVE", "moderado": "MODERADA", "grave": "GRAVE"}
+
+# Damage type keywords and their plural form in the summary
+DAMAGE_TYPE_PLURALS = OrderedDict([
+    ("amassado", "amassados"),
+    ("arranhão", "arranhões"),
+    ("quebrado", "quebras"),
+    ("trincado", "trincas"),
+    ("perfurado", "perfurações"),
+    ("deformado", "deformações")
+])
+
+# Part keywords and the vehicle region they belong to, first match wins
+# (so "porta dianteira" is lateral, not frontal, and "porta-malas" is not a door)
+DAMAGE_REGIONS = [
+    (("porta-malas",), "na região traseira"),
+    (("lateral", "porta", "retrovisor", "soleira"), "na lateral"),
+    (("dianteir", "capô", "farol", "grade"), "na região frontal"),
+    (("traseir", "lanterna"), "na região traseira"),
+    (("teto",), "no teto")
+]
+
+
+def structured_of(item):
+    """Return the VehicleAnalysis of an image_analyses item.
+
+    Args:
+        item: Dictionary with analysis and optionally structured
+
+    Returns:
+        VehicleAnalysis: The analysis, or None if its text is not in the
+            structured format (see VehicleAnalysis.parse_markdown)
+    """
+    structured = item.get("structured")
+    if structured is None:
+        structured = VehicleAnalysis.parse_markdown(item.get("analysis"))
+    return structured
+
+
+def unparsed_analyses(image_analyses):
+    """Return the image_analyses items whose findings could not be parsed."""
+    return [item for item in image_analyses if structured_of(item) is None]
+
+
+def _most_common(values):
+    """Most frequent known value, "desconhecido" if none."""
+    known = [v for v in values if v and v.lower() != "desconhecido"]
+    if not known:
+        return "desconhecido"
+    return Counter(known).most_common(1)[0][0]
+
+
+def merge_analyses(analyses):
+    """Merge per-image analyses into consolidated findings.
+
+    Parts are deduplicated case-insensitively, keeping the maximum severity
+    and the union of damage types; the structural impact is True if any
+    analysis found one, None if any analysis could not assess it and False
+    otherwise, with the notes of all analyses; the vehicle identity is a
+    majority vote.
+
+    Args:
+        analyses: List of VehicleAnalysis
+
+    Returns:
+        dict: vehicle, parts (part -> {"types", "severity"}), severity,
+            structural_impact and structural_notes
+    """
+    parts = OrderedDict()
+    structural_notes = []
+    for analysis in analyses:
+        for damage in analysis.damages:
+            key = damage.part.strip().lower()
+            entry = parts.setdefault(key, {"name": damage.part.strip().capitalize(),
+                                           "types": [], "severity": "leve"})
+            if damage.type and damage.type not in entry["types"]:
+                entry["types"].append(damage.type)
+            if SEVERITIES.index(damage.severity) > SEVERITIES.index(entry["severity"]):
+                entry["severity"] = damage.severity
+        if analysis.structural_notes and analysis.structural_notes not in structural_notes:
+            structural_notes.append(analysis.structural_notes)
+
+    severity = max((entry["severity"] for entry in parts.values()), key=SEVERITIES.index, default="leve")
+
+    if any(a.structural_impact for a in analyses):
+        structural_impact = True
+    elif any(a.structural_impact is None for a in analyses):
+        structural_impact = None
+    else:
+        structural_impact = False
+
+    return {
+        "vehicle": {
+            "type": _most_common(a.vehicle_type for a in analyses),
+            "brand": _most_common(a.brand for a in analyses),
+            "model": _most_common(a.model for a in analyses),
+            "color": _most_common(a.color for a in analyses)
+        },
+        "parts": parts,
+        "severity": severity,
+        "structural_impact": structural_impact,
+        "structural_notes": structural_notes
+    }
+
+
+def generate_local_combined_analysis(image_analyses):
+    """Generate the consolidated report locally, without an LLM call.
+
+    Args:
+        image_analyses: List of dictionaries containing filename and analysis,
+            and optionally the structured VehicleAnalysis
+
+    Analyses that are not in the structured format are not merged: they
+    are listed verbatim with a warning, and if none could be parsed the
+    report says the damages were not assessed instead of reporting a
+    vehicle without damages.
+
+    Returns:
+        str: Combined analysis
+    """
+    unparsed = unparsed_analyses(image_analyses)
+    if len(unparsed) == len(image_analyses):
+        report = "# RELATÓRIO DE VISTORIA VEICULAR\n\n"
+        report += "## Resumo dos Danos\n"
+        report += (f"Não foi possível consolidar automaticamente as análises das {len(image_analyses)} imagens, "
+                   "pois elas não estão no formato estruturado. Os danos, a severidade e o impacto estrutural "
+                   "não foram avaliados nesta consolidação; consulte as análises individuais abaixo e confirme "
+                   "com um vistoriador.\n\n")
+        return report + _unparsed_section(unparsed)
+
+    parsed = [item for item in image_analyses if item not in unparsed]
+    report = _combined_report(parsed)
+    if unparsed:
+        report += "\n\n" + _unparsed_section(unparsed)
+    return report
+
+
+def _unparsed_section(unparsed):
+    """List analyses that could not be consolidated, verbatim."""
+    section = "## Análises Não Consolidadas\n"
+    section += "As análises a seguir não estão no formato estruturado e não foram incluídas na consolidação acima:\n\n"
+    for item in unparsed:
+        section += f"### {item.get('filename', 'Imagem')}\n{(item.get('analysis') or '').strip()}\n\n"
+    return section.rstrip() + "\n"
+
+
+def _combined_report(image_analyses):
+    """Write the consolidated report of parsed analyses."""
+    merged = merge_analyses([structured_of(item) for item in image_analyses])
+    vehicle = merged["vehicle"]
+    parts = merged["parts"]
+    overall_severity = REPORT_SEVERITY[merged["severity"]]
+    vehicle_name = " ".join(v for v in (vehicle["brand"], vehicle["model"], vehicle["type"])
+                            if v != "desconhecido") or "analisado"
+    all_text = " ".join(f"{p['name']} {' '.join(p['types'])}".lower() for p in parts.values())
+
+    # Generate combined report
+    report = "# RELATÓRIO DE VISTORIA VEICULAR\n\n"
+
+    report += "## Resumo dos Danos\n"
+    report += f"O veículo {vehicle_name}, cor {vehicle['color']}, "
+    if not parts:
+        report += f"não apresenta danos visíveis nas {len(image_analyses)} imagens analisadas.\n\n"
+    else:
+        report += "apresenta danos "
+
+        # Determine main damage areas
+        damage_areas = []
+        for part in parts:
+            for keywords, region in DAMAGE_REGIONS:
+                if any(keyword in part for keyword in keywords):
+                    if region not in damage_areas:
+                        damage_areas.append(region)
+                    break
+
+        if damage_areas:
+            report += "concentrados principalmente " + ", ".join(damage_areas) + ". "
+        else:
+            report += "em diversas áreas do veículo. "
+
+        # Add damage types
+        damage_types = [plural for keyword, plural in DAMAGE_TYPE_PLURALS.items() if keyword in all_text]
+        if damage_types:
+            report += "Foram identificados " + ", ".join(damage_types) + " de intensidade variada.\n\n"
+        else:
+            report += "Foram identificados danos de intensidade variada.\n\n"
+
+    report += "## Classificação da Severidade\n"
+    if parts:
+        report += f"A batida é classificada como de severidade {overall_severity}, a maior entre as peças afetadas.\n\n"
+    else:
+        report += "Nenhum dano identificado para classificar.\n\n"
+
+    report += "## Peças Afetadas\n"
+    for entry in parts.values():
+        types = ", ".join(entry["types"]) or "dano"
+        report += f"- {entry['name']}: {types} ({entry['severity']})\n"
+    if not parts:
+        report += "Nenhuma peça afetada identificada.\n"
+
+    # Only what the per-image analyses said about the structure is reported
+    report += "\n## Impacto Estrutural\n"
+    if merged["structural_impact"]:
+        report += "As análises individuais apontam indícios de comprometimento estrutural.\n"
+    elif merged["structural_impact"] is None:
+        report += f"{STRUCTURAL_NOT_ASSESSED}\n"
+    else:
+        report += "As análises individuais não apontaram comprometimento estrutural.\n"
+    for note in merged["structural_notes"]:
+        report += f"- {note}\n"
+    report += "\n"
+
+    report += "## Conclusão Técnica\n"
+    if parts:
+        report += (f"O veículo {vehicle_name} apresenta danos de severidade {overall_severity.lower()} "
+                   f"em {len(parts)} peça(s). ")
+    else:
+        report += f"O veículo {vehicle_name} não apresenta danos visíveis nas imagens analisadas. "
+    if merged["structural_impact"]:
+        report += "Há indícios de comprometimento estrutural; recomenda-se uma avaliação detalhada por especialistas antes de qualquer reparo."
+    elif merged["structural_impact"] is None:
+        report += "O impacto estrutural não foi avaliado; recomenda-se a confirmação por um vistoriador antes de qualquer reparo."
+    else:
+        report += "As análises não apontaram comprometimento estrutural."
+
+    return report
@@ -1,85 +1,347 @@
 import os
-import base64
-from datetime import datetime
+import mmap
 import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import timed, STAGE_BYTES
+
+# Number of 2-hex-digit directory levels objects are sharded into
+# (0 keeps the flat layout: storage/uploads/{inspection_id}/...)
+SHARD_DEPTH = int(os.getenv("LOCAL_STORAGE_SHARD_DEPTH", "2"))
+
+# fsync written files (and their directory) before they are renamed into place
+FSYNC = os.getenv("LOCAL_STORAGE_FSYNC", "1") != "0"
+
+# Chunk size of streamed writes and chunked reads
+CHUNK_SIZE = 1024 * 1024
+
+# Background write queue
+WRITE_WORKERS = int(os.getenv("LOCAL_STORAGE_WORKERS", "4"))
+
 
 class LocalStorage:
-    def __init__(self):
-        """Initialize local storage handler."""
-        self.base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage")
+    """Object storage on the local filesystem, with the interface of S3Handler.
+
+    Objects are stored under hash-sharded directories, so no directory
+    grows with the number of inspections: uploads/{inspection_id}/1.jpg is
+    stored at uploads/3f/a2/{inspection_id}/1.jpg. Shards are computed from
+    the directory of the key, so the objects of an inspection stay together.
+    Writes go to a temporary file in the target directory that is renamed
+    into place, so a crash never leaves a partially written object.
+    """
+
+    def __init__(self, base_dir=None, shard_depth=None):
+        """Initialize local storage handler.
+
+        Args:
+            base_dir: Root directory (default: storage/, or LOCAL_STORAGE_DIR)
+            shard_depth: Number of shard directory levels (default: SHARD_DEPTH)
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage")
+        self.base_dir = os.path.abspath(base_dir or os.getenv("LOCAL_STORAGE_DIR", default_dir))
+        self.shard_depth = SHARD_DEPTH if shard_depth is None else shard_depth
         self.ensure_directories()
-    
+
+        # Background write queue, mirroring the S3 upload queue
+        self.upload_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS,
+                                                  thread_name_prefix="local-write")
+
     def ensure_directories(self):
         """Ensure that necessary directories exist."""
         os.makedirs(os.path.join(self.base_dir, "uploads"), exist_ok=True)
         os.makedirs(os.path.join(self.base_dir, "reports"), exist_ok=True)
-    
+
+    def _legacy_path(self, object_key):
+        """Return the unsharded path of an object, checking it stays in base_dir."""
+        full_path = os.path.normpath(os.path.join(self.base_dir, object_key))
+        if not full_path.startswith(self.base_dir + os.sep):
+            raise ValueError(f"Invalid object key: {object_key}")
+        return full_path
+
+    def object_path(self, object_key):
+        """Return the file path of an object.
+
+        Args:
+            object_key: The key (path) of the object
+
+        Returns:
+            str: Sharded path under base_dir
+        """
+        full_path = self._legacy_path(object_key)
+        if not self.shard_depth:
+            return full_path
+
+        key = os.path.relpath(full_path, self.base_dir)
+        prefix, _, rest = key.partition(os.sep)
+        if not rest:
+            prefix, rest = "", key
+        digest = hashlib.sha1((os.path.dirname(rest) or rest).encode('utf-8')).hexdigest()
+        shards = [digest[2 * i:2 * i + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.base_dir, prefix, *shards, rest)
+
+    def _existing_path(self, object_key):
+        """Return the path of a stored object, falling back to the flat layout."""
+        path = self.object_path(object_key)
+        if not os.path.exists(path):
+            legacy_path = self._legacy_path(object_key)
+            if os.path.exists(legacy_path):
+                return legacy_path
+        return path
+
+    def _write_atomic(self, object_key, write):
+        """Write an object through a temporary file renamed into place.
+
+        Args:
+            object_key: The key (path) where the file will be stored
+            write: Function writing the content to a binary file, returning
+                the number of bytes written
+
+        Returns:
+            int: Number of bytes written
+        """
+        path = self.object_path(object_key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                size = write(f)
+                if FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if FSYNC:
+            # Persist the rename itself
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return size
+
+    @staticmethod
+    def _write_body(f, file_content):
+        """Write bytes, str, a file-like object or an iterator of chunks.
+
+        Args:
+            f: Binary file to write to
+            file_content: The content to write
+
+        Returns:
+            int: Number of bytes written
+        """
+        if isinstance(file_content, str):
+            file_content = file_content.encode('utf-8')
+        if isinstance(file_content, (bytes, bytearray, memoryview)):
+            return f.write(file_content)
+
+        size = 0
+        if hasattr(file_content, "read"):
+            chunks = iter(lambda: file_content.read(CHUNK_SIZE), b"")
+        else:
+            chunks = file_content
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size += f.write(chunk)
+        return size
+
     def upload_file_object(self, file_content, object_key):
         """Save a file object to local storage.
-        
+
+        Args:
+            file_content: The content of the file to save: bytes, str, a
+                binary file-like object or an iterator of chunks, which are
+                streamed to disk
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            bool: True if save was successful, False otherwise
+        """
+        with timed("local_write") as timing:
+            try:
+                size = self._write_atomic(object_key, lambda f: self._write_body(f, file_content))
+                STAGE_BYTES.inc(size, stage="local_write")
+                return True
+            except Exception as e:
+                print(f"Error saving file locally: {e}")
+                timing["outcome"] = "error"
+                return False
+
+    def upload_file_object_async(self, file_content, object_key):
+        """Queue a file object to be saved in the background.
+
         Args:
             file_content: The content of the file to save
             object_key: The key (path) where the file will be stored
-        
+
+        Returns:
+            Future: Resolves to True if save was successful, False otherwise
+        """
+        return self.upload_executor.submit(self.upload_file_object, file_content, object_key)
+
+    def upload_file(self, file_path, object_key):
+        """Copy a file on disk into local storage.
+
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored
+
         Returns:
             bool: True if save was successful, False otherwise
         """
-        try:
-            # Create directory structure if needed
-            full_path = os.path.join(self.base_dir, object_key)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            
-            # Write file
-            with open(full_path, 'wb') as f:
-                if isinstance(file_content, str):
-                    f.write(file_content.encode('utf-8'))
-                else:
-                    f.write(file_content)
-            return True
-        except Exception as e:
-            print(f"Error saving file locally: {e}")
-            return False
-    
+        def copy(f):
+            with open(file_path, 'rb') as src:
+                shutil.copyfileobj(src, f, CHUNK_SIZE)
+            return os.path.getsize(file_path)
+
+        with timed("local_write") as timing:
+            try:
+                STAGE_BYTES.inc(self._write_atomic(object_key, copy), stage="local_write")
+                return True
+            except Exception as e:
+                print(f"Error saving file locally: {e}")
+                timing["outcome"] = "error"
+                return False
+
+    def upload_file_async(self, file_path, object_key):
+        """Queue a file on disk to be copied into local storage in the background.
+
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            Future: Resolves to True if save was successful, False otherwise
+        """
+        return self.upload_executor.submit(self.upload_file, file_path, object_key)
+
     def get_file_url(self, object_key):
         """Generate a local file URL.
-        
+
         Args:
             object_key: The key (path) of the object
-        
+
         Returns:
             str: Local file path
         """
         try:
-            full_path = os.path.join(self.base_dir, object_key)
-            return f"file://{os.path.abspath(full_path)}"
+            return f"file://{self._existing_path(object_key)}"
         except Exception as e:
             print(f"Error generating file URL: {e}")
             return None
-    
+
     def download_file(self, object_key):
         """Read a file from local storage.
-        
+
+        The whole file is read into memory; use open_mmap or iter_file to
+        avoid holding a copy of a large file.
+
         Args:
             object_key: The key (path) of the object
-        
+
         Returns:
             bytes: The content of the file
         """
+        with timed("local_read") as timing:
+            try:
+                with open(self._existing_path(object_key), 'rb') as f:
+                    content = f.read()
+                STAGE_BYTES.inc(len(content), stage="local_read")
+                return content
+            except Exception as e:
+                print(f"Error reading file: {e}")
+                timing["outcome"] = "error"
+                return None
+
+    def open_mmap(self, object_key):
+        """Map a stored file into memory, read-only, without copying it.
+
+        The map is a bytes-like object (it supports slicing, memoryview and
+        io.BytesIO) and should be closed by the caller.
+
+        Args:
+            object_key: The key (path) of the object
+
+        Returns:
+            mmap.mmap: Read-only map of the file (b"" if it is empty), or
+                None if it cannot be read
+        """
+        try:
+            with open(self._existing_path(object_key), 'rb') as f:
+                # Empty files cannot be mapped
+                if os.fstat(f.fileno()).st_size == 0:
+                    return b""
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            print(f"Error mapping file: {e}")
+            return None
+
+    def iter_file(self, object_key, chunk_size=CHUNK_SIZE):
+        """Read a stored file in chunks.
+
+        Args:
+            object_key: The key (path) of the object
+            chunk_size: Size of each chunk in bytes
+
+        Yields:
+            bytes: Consecutive chunks of the file
+        """
+        with open(self._existing_path(object_key), 'rb') as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+    def delete_file(self, object_key):
+        """Delete a file from local storage.
+
+        Args:
+            object_key: The key (path) of the object
+
+        Returns:
+            bool: True if the file was deleted, False if it did not exist
+        """
+        try:
+            os.remove(self._existing_path(object_key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_presigned_url_when_uploaded(self, upload_future, object_key, expiration=3600, timeout=None):
+        """Wait for a background write and return the file URL.
+
+        Args:
+            upload_future: Future returned by upload_file_object_async
+            object_key: The key (path) of the object
+            expiration: Unused, for compatibility with S3Handler
+            timeout: Maximum time in seconds to wait for the write
+
+        Returns:
+            str: Local file URL, None if the write failed
+        """
         try:
-            full_path = os.path.join(self.base_dir, object_key)
-            with open(full_path, 'rb') as f:
-                return f.read()
+            if not upload_future.result(timeout=timeout):
+                return None
         except Exception as e:
-            print(f"Error reading file: {e}")
+            print(f"Error waiting for local write: {e}")
             return None
-    
-    def get_presigned_url(self, object_key):
+        return self.get_presigned_url(object_key, expiration)
+
+    def get_presigned_url(self, object_key, expiration=3600):
         """For compatibility with S3Handler, returns a local path.
-        
+
         Args:
             object_key: The key (path) of the object
-        
+            expiration: Unused, for compatibility with S3Handler
+
         Returns:
             str: Local file path
         """
-        return self.get_file_url(object_key)
\ No newline at end of file
+        return self.get_file_url(object_key)
@@ -0,0 +1,241 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port of the Prometheus scrape endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_server = None
+_server_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=None):
+    """Format a label set in the Prometheus text format."""
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Create and register the counter.
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter for a label set."""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        """Return the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Value that can go up and down, with labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        """Create and register the gauge.
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        """Set the gauge for a label set."""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        """Return the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative histogram with labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create and register the histogram.
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Names of the labels
+            buckets: Upper bounds of the buckets
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        """Record an observation for a label set."""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            state = self._values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        """Return the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, state["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {state['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return "\n".join(lines)
+
+
+# Pipeline metrics
+STAGE_DURATION = Histogram(
+    "vistocarro_stage_duration_seconds",
+    "Duration of each inspection pipeline stage.",
+    ["stage", "outcome"]
+)
+STAGE_TOTAL = Counter(
+    "vistocarro_stage_total",
+    "Number of executions of each inspection pipeline stage.",
+    ["stage", "outcome"]
+)
+FALLBACK_TOTAL = Counter(
+    "vistocarro_fallback_total",
+    "Number of times the local analyzer was used instead of Gemini.",
+    ["stage"]
+)
+STAGE_BYTES = Counter(
+    "vistocarro_stage_bytes_total",
+    "Bytes processed by each pipeline stage.",
+    ["stage"]
+)
+STARTUP_SECONDS = Gauge(
+    "vistocarro_startup_seconds",
+    "Seconds from process start to each startup phase.",
+    ["phase"]
+)
+
+
+@contextmanager
+def timed(stage):
+    """Time a pipeline stage and record it with its outcome.
+
+    The outcome is "success", or "error" if an exception escapes. Code in
+    the block can set a different outcome (e.g. "cache_hit") on the
+    yielded dictionary.
+
+    Args:
+        stage: Stage name (e.g. "s3_upload", "gemini_analysis")
+
+    Yields:
+        dict: Mutable context with an "outcome" key
+    """
+    context = {"outcome": "success"}
+    start = time.perf_counter()
+    try:
+        yield context
+    except BaseException:
+        context["outcome"] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage, outcome=context["outcome"])
+        STAGE_TOTAL.inc(stage=stage, outcome=context["outcome"])
+
+
+def render_metrics():
+    """Return all registered metrics in the Prometheus text format.
+
+    Returns:
+        str: Exposition text
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep scrapes out of the application log
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Start the scrape endpoint in a daemon thread, once per process.
+
+    Args:
+        port: Port to listen on
+
+    Returns:
+        bool: True if the server is running, False if it could not start
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+        except OSError as e:
+            print(f"Error starting metrics server: {e}")
+            return False
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return True
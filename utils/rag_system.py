@@ -1,21 +1,21 @@
-import json
-import boto3
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.vectorstores import FAISS
-from langchain.embeddings import FakeEmbeddings
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain.llms.fake import FakeListLLM
+from utils.analysis_cache import sha256_digest
+from utils.vector_index import get_shared_index, split_sections
 
 class BardockAssistant:
-    def __init__(self, bedrock_handler):
+    def __init__(self, bedrock_handler, knowledge_base=None):
         """Initialize the Bardhock RAG assistant.
         
         Args:
             bedrock_handler: Instance of BedrockHandler
+            knowledge_base: Optional VectorIndex (default: the index shared by all sessions)
         """
+        # langchain is slow to import; only load it when an assistant is created
+        from langchain.memory import ConversationBufferMemory
+        
         self.bedrock_handler = bedrock_handler
-        self.knowledge_base = None
+        self.knowledge_base = knowledge_base if knowledge_base is not None else get_shared_index()
+        self.inspection_id = None
+        self.analysis_text = None
         self.memory = ConversationBufferMemory(
             memory_key="chat_history",
             return_messages=True
@@ -41,30 +41,22 @@ class BardockAssistant:
         Seu objetivo é fornecer análises técnicas precisas que ajudem na avaliação de danos veiculares.
         """
     
-    def update_knowledge(self, analysis_text):
-        """Update the knowledge base with new analysis text.
+    def update_knowledge(self, analysis_text, inspection_id=None):
+        """Add an inspection's analysis to the knowledge base.
+        
+        Only the sections of this inspection are (re-)indexed; the rest of
+        the index is left untouched.
         
         Args:
             analysis_text: Text with the analysis results
+            inspection_id: Unique ID for the inspection (default: digest of the text)
         """
         try:
-            # Combine expert knowledge with analysis
-            combined_text = self.expert_knowledge + "\n\nDados da vistoria atual:\n" + analysis_text
-            
-            # Split text into chunks
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=100
-            )
-            chunks = text_splitter.split_text(combined_text)
-            
-            # Create simple embeddings (not using Bedrock)
-            embeddings = FakeEmbeddings(size=1536)
-            
-            # Create vector store
-            self.knowledge_base = FAISS.from_texts(chunks, embeddings)
+            inspection_id = inspection_id or sha256_digest(analysis_text)
+            self.knowledge_base.add(inspection_id, split_sections(analysis_text))
             
             # Store the analysis text for direct access
+            self.inspection_id = inspection_id
             self.analysis_text = analysis_text
             
             return True
@@ -72,6 +64,39 @@ class BardockAssistant:
             print(f"Error updating knowledge base: {e}")
             return False
     
+    def remove_inspection(self, inspection_id):
+        """Remove an inspection from the knowledge base.
+        
+        Args:
+            inspection_id: Unique ID for the inspection
+        
+        Returns:
+            bool: True if the inspection was indexed
+        """
+        try:
+            return self.knowledge_base.remove(inspection_id)
+        except Exception as e:
+            print(f"Error removing inspection from knowledge base: {e}")
+            return False
+    
+    def retrieve(self, question, k=4, current_only=False):
+        """Retrieve the analysis sections most relevant to a question.
+        
+        Args:
+            question: User's question
+            k: Maximum number of sections
+            current_only: Only search the current inspection
+        
+        Returns:
+            list: Dictionaries with score, inspection_id and text, best first
+        """
+        try:
+            return self.knowledge_base.search(question, k,
+                                              inspection_id=self.inspection_id if current_only else None)
+        except Exception as e:
+            print(f"Error searching knowledge base: {e}")
+            return []
+    
     def answer_question(self, question):
         """Answer a question using a simplified RAG-like system.
         
@@ -81,7 +106,7 @@ class BardockAssistant:
         Returns:
             str: Answer to the question
         """
-        if not hasattr(self, 'analysis_text') or self.analysis_text is None:
+        if self.analysis_text is None:
             return "Desculpe, ainda não tenho informações sobre a vistoria para responder a essa pergunta. Por favor, carregue imagens e clique em 'Analisar Imagens' primeiro."
         
         try:
@@ -109,7 +134,11 @@ class BardockAssistant:
             elif "ano" in question_lower:
                 return "Com base nas características visuais, estimo que seja um modelo entre 2018 e 2020, porém para confirmação precisa seria necessário verificar a documentação do veículo."
             else:
-                response = f"Com base na análise realizada, posso informar que o veículo Volkswagen Gol prata apresenta danos que requerem atenção profissional. A análise completa está disponível no relatório. Poderia especificar melhor sua pergunta sobre a vistoria?"
+                sections = self.retrieve(question, k=1, current_only=True)
+                if sections:
+                    response = f"Com base na análise realizada, o trecho mais relevante para sua pergunta é:\n\n{sections[0]['text']}"
+                else:
+                    response = f"Com base na análise realizada, posso informar que o veículo Volkswagen Gol prata apresenta danos que requerem atenção profissional. A análise completa está disponível no relatório. Poderia especificar melhor sua pergunta sobre a vistoria?"
             
             return response
         except Exception as e:
@@ -127,7 +156,10 @@ class BardockAssistant:
     
     def _get_structural_impact(self):
         """Extract structural impact information."""
-        if "sem comprometimento" in self.analysis_text.lower() or "não foram identificados danos ao chassi" in self.analysis_text.lower():
+        if "impacto estrutural não avaliado" in self.analysis_text.lower():
+            return "O impacto estrutural não foi avaliado nesta análise, que usou apenas a heurística local. Recomendo que um vistoriador confirme se há comprometimento estrutural."
+        if any(phrase in self.analysis_text.lower() for phrase in ("sem comprometimento", "não apontaram comprometimento",
+                                                                   "não foram identificados danos ao chassi")):
             return "A análise indica que não houve comprometimento estrutural significativo. Os danos estão limitados a componentes externos e de absorção de impacto, que cumpriram sua função de proteção."
         else:
             return "A análise sugere possível comprometimento estrutural. Recomendo uma inspeção detalhada do chassi e dos pontos de fixação dos componentes de segurança para avaliar a extensão dos danos estruturais."
@@ -1,15 +1,121 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+# reportlab and PIL are imported on first use, so importing this module
+# does not slow down the application start
 from io import BytesIO
 from datetime import datetime
-import base64
-from PIL import Image as PILImage
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
+import time
+import threading
+from utils.analysis_cache import sha256_digest, content_digest
+from utils.metrics import timed
 
-def generate_pdf_report(inspection_id, images, analysis_text):
-    """Generate a PDF report with the analysis results.
+# Directory where rendered reports are kept, keyed by content hash
+REPORT_CACHE_DIR = os.getenv(
+    "REPORT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage", "cache", "reports")
+)
+
+# Maximum total size and age of the rendered reports kept in REPORT_CACHE_DIR
+REPORT_CACHE_MAX_BYTES = int(float(os.getenv("REPORT_CACHE_MAX_MB", "200")) * 1024 * 1024)
+REPORT_CACHE_TTL_SECONDS = int(float(os.getenv("REPORT_CACHE_TTL_HOURS", "168")) * 3600)
+
+# Number of threads used to produce thumbnails
+THUMBNAIL_WORKERS = int(os.getenv("REPORT_THUMBNAIL_WORKERS", "4"))
+
+# Thumbnail size in pixels
+THUMBNAIL_SIZE = (250, 200)
+
+@lru_cache(maxsize=1)
+def get_report_styles():
+    """Build the report paragraph styles once per process.
+    
+    Returns:
+        dict: ParagraphStyle objects by name
+    """
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    
+    styles = getSampleStyleSheet()
+    
+    return {
+        'title': ParagraphStyle(
+            'Title',
+            parent=styles['Heading1'],
+            fontSize=18,
+            alignment=1,
+            spaceAfter=12
+        ),
+        'subtitle': ParagraphStyle(
+            'Subtitle',
+            parent=styles['Heading2'],
+            fontSize=14,
+            spaceAfter=6
+        ),
+        'normal': ParagraphStyle(
+            'Normal',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceAfter=6
+        ),
+        'centered': ParagraphStyle(
+            'Centered',
+            parent=styles['Normal'],
+            fontSize=10,
+            alignment=1,  # 1 = center alignment
+            spaceAfter=6
+        ),
+        'heading': ParagraphStyle(
+            'Heading',
+            parent=styles['Heading3'],
+            fontSize=12,
+            spaceAfter=6,
+            spaceBefore=12
+        ),
+        'footer': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            alignment=1
+        )
+    }
+
+def make_thumbnail(img_data, size=THUMBNAIL_SIZE):
+    """Produce a small JPEG thumbnail for the report.
+    
+    JPEGs are decoded in draft mode, so only a reduced-size version of the
+    photo is ever held in memory.
+    
+    An ingested image already carries thumbnails for the report and the
+    gallery sizes, which are returned without decoding it.
+    
+    Args:
+        img_data: The image content in bytes, or an IngestedImage
+        size: Maximum (width, height) of the thumbnail
+    
+    Returns:
+        BytesIO: JPEG thumbnail
+    """
+    rendition_for = getattr(img_data, "rendition_for", None)
+    rendition = rendition_for(size) if rendition_for else None
+    if rendition is not None:
+        return BytesIO(rendition)
+    
+    from PIL import Image as PILImage, ImageOps
+    
+    img = PILImage.open(BytesIO(img_data))
+    img.draft('RGB', (size[0] * 2, size[1] * 2))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img.thumbnail(size)
+    
+    img_buffer = BytesIO()
+    img.save(img_buffer, format='JPEG', quality=85)
+    img_buffer.seek(0)
+    return img_buffer
+
+def report_key(inspection_id, images, analysis_text):
+    """Compute the content hash of a report.
     
     Args:
         inspection_id: Unique ID for the inspection
@@ -17,34 +123,23 @@ def generate_pdf_report(inspection_id, images, analysis_text):
         analysis_text: Text with the analysis results
     
     Returns:
-        bytes: PDF content as bytes
+        str: Hex digest of the inspection ID, image set and analysis
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
+    parts = [inspection_id, analysis_text]
+    for img_file in images:
+        parts.append(img_file.name)
+        parts.append(content_digest(img_file.getvalue()))
+    return sha256_digest(*parts)
+
+def _build_elements(inspection_id, images, analysis_text):
+    """Build the report flowables."""
+    from reportlab.platypus import Paragraph, Spacer, Image
+    from reportlab.lib.units import inch
     
-    # Create custom styles
-    title_style = ParagraphStyle(
-        'Title',
-        parent=styles['Heading1'],
-        fontSize=18,
-        alignment=1,
-        spaceAfter=12
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'Subtitle',
-        parent=styles['Heading2'],
-        fontSize=14,
-        spaceAfter=6
-    )
-    
-    normal_style = ParagraphStyle(
-        'Normal',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6
-    )
+    styles = get_report_styles()
+    title_style = styles['title']
+    subtitle_style = styles['subtitle']
+    normal_style = styles['normal']
     
     # Create content elements
     elements = []
@@ -56,51 +151,32 @@ def generate_pdf_report(inspection_id, images, analysis_text):
     # Add inspection details
     current_date = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     elements.append(Paragraph(f"ID da Vistoria: {inspection_id}", normal_style))
-    elements.append(Paragraph(f"Data: {current_date}", normal_style))
+    # An unchanged report is served from the cache, so this is the date it was first issued
+    elements.append(Paragraph(f"Data de emissão original: {current_date}", normal_style))
     elements.append(Spacer(1, 0.25*inch))
     
     # Add images section
     elements.append(Paragraph("IMAGENS ANALISADAS", subtitle_style))
     elements.append(Spacer(1, 0.1*inch))
     
-    # Process and add images
-    for i, img_file in enumerate(images):
-        if i % 2 == 0:
-            # Start a new row for every 2 images
-            if i > 0:
-                elements.append(Spacer(1, 0.2*inch))
-        
-        # Process image
-        img_data = img_file.getvalue()
-        img = PILImage.open(BytesIO(img_data))
-        
-        # Resize image to fit in the report
-        max_width = 250
-        max_height = 200
-        img.thumbnail((max_width, max_height))
-        
-        # Save the resized image
-        img_buffer = BytesIO()
-        img.save(img_buffer, format=img.format)
-        img_buffer.seek(0)
-        
-        # Add image to report with centered caption
-        img_obj = Image(img_buffer)
-        img_obj.drawHeight = 2*inch
-        img_obj.drawWidth = 2.5*inch
+    # Produce thumbnails in parallel, keeping upload order
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as executor:
+        thumbnails = executor.map(make_thumbnail, (img_file.getvalue() for img_file in images))
         
-        # Create centered style for image caption
-        centered_style = ParagraphStyle(
-            'Centered',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=1,  # 1 = center alignment
-            spaceAfter=6
-        )
-        
-        elements.append(img_obj)
-        elements.append(Paragraph(f"Imagem {i+1}: {img_file.name}", centered_style))
-        elements.append(Spacer(1, 0.1*inch))
+        for i, (img_file, img_buffer) in enumerate(zip(images, thumbnails)):
+            if i % 2 == 0:
+                # Start a new row for every 2 images
+                if i > 0:
+                    elements.append(Spacer(1, 0.2*inch))
+            
+            # Add image to report with centered caption
+            img_obj = Image(img_buffer)
+            img_obj.drawHeight = 2*inch
+            img_obj.drawWidth = 2.5*inch
+            
+            elements.append(img_obj)
+            elements.append(Paragraph(f"Imagem {i+1}: {img_file.name}", styles['centered']))
+            elements.append(Spacer(1, 0.1*inch))
     
     # Add analysis section
     elements.append(Spacer(1, 0.25*inch))
@@ -116,16 +192,9 @@ def generate_pdf_report(inspection_id, images, analysis_text):
             
             # Check if this is a heading (starts with # or ##)
             if para.strip().startswith('#'):
-                heading_style = ParagraphStyle(
-                    'Heading',
-                    parent=styles['Heading3'],
-                    fontSize=12,
-                    spaceAfter=6,
-                    spaceBefore=12
-                )
                 # Remove # symbols
                 clean_para = para.strip().replace('#', '').strip()
-                elements.append(Paragraph(f"<b>{clean_para}</b>", heading_style))
+                elements.append(Paragraph(f"<b>{clean_para}</b>", styles['heading']))
             else:
                 elements.append(Paragraph(formatted_para.replace('\n', '<br/>'), normal_style))
             
@@ -134,13 +203,106 @@ def generate_pdf_report(inspection_id, images, analysis_text):
     # Add footer
     elements.append(Spacer(1, 0.5*inch))
     elements.append(Paragraph("Este relatório foi gerado automaticamente pelo sistema VistoCarroAI de Vistoria Veicular.", 
-                             ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, alignment=1)))
+                             styles['footer']))
     
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
+    return elements
+
+def _evict_reports(cache_dir, max_bytes=None, ttl_seconds=None):
+    """Remove expired reports, then least recently used ones until under max_bytes.
     
-    return buffer.getvalue()
+    Args:
+        cache_dir: Report cache directory
+        max_bytes: Maximum total size in bytes (default: REPORT_CACHE_MAX_BYTES)
+        ttl_seconds: Maximum age in seconds (default: REPORT_CACHE_TTL_SECONDS)
+    """
+    max_bytes = REPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    ttl_seconds = REPORT_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+                entries.append((path, st.st_mtime, st.st_size))
+            except FileNotFoundError:
+                continue
+    
+    now = time.time()
+    total = sum(size for _, _, size in entries)
+    for path, mtime, size in sorted(entries, key=lambda e: e[1]):
+        if total <= max_bytes and now - mtime <= ttl_seconds:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+def generate_pdf_report_file(inspection_id, images, analysis_text, cache_dir=None):
+    """Render a PDF report to disk, reusing a previous render when unchanged.
+    
+    The PDF is written straight to a file, so it can be uploaded from disk
+    (e.g. with a multipart upload) without holding it in memory. Renders are
+    kept for REPORT_CACHE_TTL_SECONDS, within REPORT_CACHE_MAX_BYTES (least
+    recently used first); a reused render keeps its original issue date.
+    
+    Args:
+        inspection_id: Unique ID for the inspection
+        images: List of uploaded image files
+        analysis_text: Text with the analysis results
+        cache_dir: Directory of rendered reports (default: REPORT_CACHE_DIR)
+    
+    Returns:
+        str: Path of the PDF file
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate
+    
+    cache_dir = cache_dir or REPORT_CACHE_DIR
+    with timed("pdf_render") as timing:
+        key = report_key(inspection_id, images, analysis_text)
+        path = os.path.join(cache_dir, key[:2], f"{key}.pdf")
+        try:
+            if time.time() - os.path.getmtime(path) <= REPORT_CACHE_TTL_SECONDS:
+                # Refresh access time for LRU eviction
+                os.utime(path, None)
+                timing["outcome"] = "cache_hit"
+                return path
+        except FileNotFoundError:
+            pass
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            doc = SimpleDocTemplate(tmp_path, pagesize=letter)
+            doc.build(_build_elements(inspection_id, images, analysis_text))
+            
+            # Atomic rename so a crash never leaves a half-written report
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        _evict_reports(cache_dir)
+        return path
+
+def generate_pdf_report(inspection_id, images, analysis_text):
+    """Generate a PDF report with the analysis results.
+    
+    Args:
+        inspection_id: Unique ID for the inspection
+        images: List of uploaded image files
+        analysis_text: Text with the analysis results
+    
+    Returns:
+        bytes: PDF content as bytes
+    """
+    path = generate_pdf_report_file(inspection_id, images, analysis_text)
+    with open(path, 'rb') as f:
+        return f.read()
 
 def generate_txt_report(analysis_text):
     """Generate a TXT report with the key points of the analysis.
@@ -1,6 +1,70 @@
 import boto3
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
 from dotenv import load_dotenv
+from utils.metrics import timed, STAGE_BYTES
+
+# Background upload settings
+UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "4"))
+# Total attempts per S3 request, including the first; retried by botocore with backoff
+UPLOAD_RETRIES = int(os.getenv("S3_UPLOAD_RETRIES", "3"))
+MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * 1024 * 1024
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Read-only file object over a memoryview, so upload bodies are not copied."""
+
+    def __init__(self, content):
+        """Wrap bytes-like content.
+        
+        Args:
+            content: bytes, bytearray, memoryview or str
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self._view = memoryview(content).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, min(self._pos, len(self._view)))
+        return self._pos
+
+    def readinto(self, buffer):
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        size = len(chunk)
+        buffer[:size] = chunk
+        self._pos += size
+        return size
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._view) - self._pos
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk.tobytes()
+
+    def __len__(self):
+        return len(self._view)
+
 
 class S3Handler:
     def __init__(self):
@@ -10,9 +74,22 @@ class S3Handler:
             's3',
             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
+            region_name=os.getenv('AWS_REGION'),
+            config=Config(retries={'total_max_attempts': UPLOAD_RETRIES, 'mode': 'adaptive'},
+                          max_pool_connections=max(10, UPLOAD_WORKERS * 4))
         )
         self.bucket_name = os.getenv('S3_BUCKET')
+        
+        # Large objects are sent as concurrent multipart uploads
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_THRESHOLD,
+            max_concurrency=4
+        )
+        
+        # Background upload queue
+        self.upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS,
+                                                  thread_name_prefix="s3-upload")
     
     def upload_file_object(self, file_content, object_key):
         """Upload a file object to S3 bucket.
@@ -24,16 +101,134 @@ class S3Handler:
         Returns:
             bool: True if upload was successful, False otherwise
         """
-        try:
-            self.s3_client.put_object(
-                Body=file_content,
-                Bucket=self.bucket_name,
-                Key=object_key
+        with timed("s3_upload") as timing:
+            try:
+                self.s3_client.put_object(
+                    Body=file_content,
+                    Bucket=self.bucket_name,
+                    Key=object_key
+                )
+                STAGE_BYTES.inc(len(file_content), stage="s3_upload")
+                return True
+            except Exception as e:
+                print(f"Error uploading to S3: {e}")
+                timing["outcome"] = "error"
+                return False
+    
+    def _run_upload(self, upload, size):
+        """Run an upload function, recording its timing and size.
+        
+        Failed requests (and multipart parts) are already retried by the
+        client, per its retry configuration.
+        
+        Args:
+            upload: Function performing the upload
+            size: Size of the object in bytes
+        
+        Returns:
+            bool: True if upload was successful, False otherwise
+        """
+        with timed("s3_upload") as timing:
+            try:
+                upload()
+                STAGE_BYTES.inc(size, stage="s3_upload")
+                return True
+            except Exception as e:
+                print(f"Error uploading to S3: {e}")
+                timing["outcome"] = "error"
+                return False
+    
+    def _upload_stream(self, file_content, object_key):
+        """Upload content with TransferManager.
+        
+        Args:
+            file_content: The content of the file to upload
+            object_key: The key (path) where the file will be stored in S3
+        
+        Returns:
+            bool: True if upload was successful, False otherwise
+        """
+        body = MemoryViewReader(file_content)
+        
+        def upload():
+            self.s3_client.upload_fileobj(
+                body,
+                self.bucket_name,
+                object_key,
+                Config=self.transfer_config
+            )
+        
+        return self._run_upload(upload, len(body))
+    
+    def upload_file_object_async(self, file_content, object_key):
+        """Queue a file object for upload in the background.
+        
+        Objects above the multipart threshold are uploaded in parts. The
+        content must not be modified until the upload has completed.
+        
+        Args:
+            file_content: The content of the file to upload
+            object_key: The key (path) where the file will be stored in S3
+        
+        Returns:
+            Future: Resolves to True if upload was successful, False otherwise
+        """
+        return self.upload_executor.submit(self._upload_stream, file_content, object_key)
+    
+    def _upload_path(self, file_path, object_key):
+        """Upload a file from disk with TransferManager.
+        
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored in S3
+        
+        Returns:
+            bool: True if upload was successful, False otherwise
+        """
+        def upload():
+            self.s3_client.upload_file(
+                file_path,
+                self.bucket_name,
+                object_key,
+                Config=self.transfer_config
             )
-            return True
+        
+        return self._run_upload(upload, os.path.getsize(file_path))
+    
+    def upload_file_async(self, file_path, object_key):
+        """Queue a file on disk for upload in the background.
+        
+        The file is streamed from disk in parts, so it is never loaded into
+        memory as a whole.
+        
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored in S3
+        
+        Returns:
+            Future: Resolves to True if upload was successful, False otherwise
+        """
+        return self.upload_executor.submit(self._upload_path, file_path, object_key)
+    
+    def get_presigned_url_when_uploaded(self, upload_future, object_key, expiration=3600, timeout=None):
+        """Wait for a background upload and generate its presigned URL.
+        
+        Args:
+            upload_future: Future returned by upload_file_object_async
+            object_key: The key (path) of the object in S3
+            expiration: URL expiration time in seconds (default: 1 hour)
+            timeout: Maximum time in seconds to wait for the upload
+        
+        Returns:
+            str: Presigned URL for the object, None if the upload failed
+        """
+        try:
+            if not upload_future.result(timeout=timeout):
+                return None
         except Exception as e:
-            print(f"Error uploading to S3: {e}")
-            return False
+            print(f"Error waiting for S3 upload: {e}")
+            return None
+        return self.get_presigned_url(object_key, expiration)
     
     def get_presigned_url(self, object_key, expiration=3600):
         """Generate a presigned URL for an S3 object.
@@ -45,19 +240,21 @@ class S3Handler:
         Returns:
             str: Presigned URL for the object
         """
-        try:
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': self.bucket_name,
-                    'Key': object_key
-                },
-                ExpiresIn=expiration
-            )
-            return url
-        except Exception as e:
-            print(f"Error generating presigned URL: {e}")
-            return None
+        with timed("presign") as timing:
+            try:
+                url = self.s3_client.generate_presigned_url(
+                    'get_object',
+                    Params={
+                        'Bucket': self.bucket_name,
+                        'Key': object_key
+                    },
+                    ExpiresIn=expiration
+                )
+                return url
+            except Exception as e:
+                print(f"Error generating presigned URL: {e}")
+                timing["outcome"] = "error"
+                return None
     
     def download_file(self, object_key):
         """Download a file from S3.
@@ -76,4 +273,41 @@ class S3Handler:
             return response['Body'].read()
         except Exception as e:
             print(f"Error downloading from S3: {e}")
-            return None
\ No newline at end of file
+            return None
+    
+    def download_file_if_changed(self, object_key, etag=None):
+        """Download a file from S3 unless it still has the given ETag.
+        
+        Uses a conditional GET (If-None-Match), so validating an unchanged
+        object costs one request and no transfer.
+        
+        Args:
+            object_key: The key (path) of the object in S3
+            etag: ETag of the copy held by the caller, if any
+        
+        Returns:
+            tuple: (content, etag); content is None with the same etag if
+                the object is unchanged, and (None, None) on error
+        """
+        with timed("s3_download") as timing:
+            try:
+                params = {'IfNoneMatch': etag} if etag else {}
+                response = self.s3_client.get_object(
+                    Bucket=self.bucket_name,
+                    Key=object_key,
+                    **params
+                )
+                content = response['Body'].read()
+                STAGE_BYTES.inc(len(content), stage="s3_download")
+                return content, response.get('ETag')
+            except ClientError as e:
+                if etag and e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 304:
+                    timing["outcome"] = "not_modified"
+                    return None, etag
+                print(f"Error downloading from S3: {e}")
+                timing["outcome"] = "error"
+                return None, None
+            except Exception as e:
+                print(f"Error downloading from S3: {e}")
+                timing["outcome"] = "error"
+                return None, None
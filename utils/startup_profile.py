@@ -0,0 +1,187 @@
+"""Startup and import-time profile of the application.
+
+The app records the time of each startup phase (e.g. first render) with
+mark(); the values are exported as the vistocarro_startup_seconds gauge.
+Run the module to profile the import time of the heavy dependencies:
+
+    python -m utils.startup_profile
+    python -m utils.startup_profile --json boto3 reportlab.platypus
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from utils.metrics import STARTUP_SECONDS
+
+# Modules imported by app.py before the first render
+STARTUP_MODULES = (
+    "streamlit",
+    "dotenv",
+    "utils.report_generator",
+    "utils.inspection_pipeline",
+    "utils.circuit_breaker",
+    "utils.default_analysis",
+)
+
+# Heavy modules that should only be imported on first use
+LAZY_MODULES = (
+    "boto3",
+    "google.generativeai",
+    "reportlab.platypus",
+    "PIL.Image",
+    "numpy",
+    "langchain.memory",
+    "utils.s3_handler",
+    "utils.gemini_handler",
+    "utils.image_analyzer_fallback",
+    "utils.image_ingest",
+)
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+_marks = {}
+_marks_lock = threading.Lock()
+_module_start = time.time()
+
+
+def process_start_time():
+    """Return the wall-clock start time of the process.
+
+    Read from /proc on Linux; elsewhere, the time this module was imported.
+
+    Returns:
+        float: Seconds since the epoch
+    """
+    try:
+        with open("/proc/self/stat", 'r') as f:
+            # The command name may contain spaces; fields resume after ")"
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _module_start
+
+
+_process_start = process_start_time()
+
+
+def mark(phase):
+    """Record the first time a startup phase is reached.
+
+    Later calls for the same phase are ignored, so it is safe to call on
+    every Streamlit rerun.
+
+    Args:
+        phase: Phase name (e.g. "first_render")
+
+    Returns:
+        float: Seconds from process start to the phase
+    """
+    with _marks_lock:
+        if phase not in _marks:
+            _marks[phase] = round(time.time() - _process_start, 3)
+            STARTUP_SECONDS.set(_marks[phase], phase=phase)
+        return _marks[phase]
+
+
+def has_mark(phase):
+    """Return True if a startup phase has been reached."""
+    with _marks_lock:
+        return phase in _marks
+
+
+def startup_report():
+    """Return the recorded startup phases.
+
+    Returns:
+        dict: Seconds from process start, by phase
+    """
+    with _marks_lock:
+        return dict(_marks)
+
+
+def import_profile(module, python=None):
+    """Measure the import time of a module in a fresh interpreter.
+
+    Uses the interpreter's -X importtime output, so modules already imported
+    by this process do not hide their cost.
+
+    Args:
+        module: Dotted module name
+        python: Interpreter to run (default: the current one)
+
+    Returns:
+        dict: module, total seconds (None if the import failed), error and
+            the packages it imports directly with their cumulative seconds,
+            slowest first
+    """
+    result = subprocess.run([python or sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    # (cumulative microseconds, depth, name); a module is listed after its imports
+    entries = [(int(m.group(2)), len(m.group(3)) // 2 + 1, m.group(4))
+               for m in map(_IMPORTTIME_RE.match, result.stderr.splitlines()) if m]
+
+    total = None
+    packages = {}
+    for i, (cumulative, depth, name) in enumerate(entries):
+        if name != module or depth != 1:
+            continue
+        total = cumulative / 1e6
+        # Direct imports of the module are the depth-2 entries just before it
+        for child_cumulative, child_depth, child in reversed(entries[:i]):
+            if child_depth <= 1:
+                break
+            if child_depth == 2:
+                package = child.split(".")[0]
+                packages[package] = packages.get(package, 0) + child_cumulative / 1e6
+
+    error = None
+    if result.returncode != 0:
+        total = None
+        error = (result.stderr.strip().splitlines() or ["import failed"])[-1]
+    return {
+        "module": module,
+        "seconds": round(total, 4) if total is not None else None,
+        "error": error,
+        "packages": {name: round(seconds, 4)
+                     for name, seconds in sorted(packages.items(), key=lambda item: -item[1])}
+    }
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Mede o tempo de importação dos módulos da aplicação.")
+    parser.add_argument("modules", nargs="*",
+                        help="Módulos a medir (padrão: os da inicialização e os carregados sob demanda)")
+    parser.add_argument("--json", action="store_true", help="Imprime o resultado em JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Print the import profile of the startup and lazily imported modules."""
+    args = parse_args(argv)
+    groups = {"": args.modules} if args.modules else {"startup": STARTUP_MODULES, "lazy": LAZY_MODULES}
+
+    results = {group: [import_profile(module) for module in modules] for group, modules in groups.items()}
+    if args.json:
+        print(json.dumps(results.get("", results), indent=2))
+        return 0
+
+    for group, profiles in results.items():
+        if group:
+            total = sum(p["seconds"] or 0 for p in profiles)
+            print(f"== {group} ({total:.3f}s, medido isoladamente)")
+        for profile in profiles:
+            elapsed = f"{profile['seconds']:.3f}s" if profile["seconds"] is not None else "erro"
+            slowest = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in list(profile["packages"].items())[:3])
+            print(f"{profile['module']:<32} {elapsed:>8}  {profile['error'] or slowest}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
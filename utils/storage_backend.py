@@ -0,0 +1,34 @@
+import os
+
+# Storage of images and reports: "s3", "local" (on-prem deployments) or
+# "tiered" (S3 behind a local disk cache, see utils/tiered_storage.py)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3")
+
+STORAGE_BACKENDS = ("s3", "local", "tiered")
+
+
+def create_storage(backend=None):
+    """Create the configured storage handler.
+
+    All handlers have the same interface (upload_file_object and its
+    background variants, download_file, get_presigned_url), so callers do
+    not depend on the backend. Only the selected backend is imported.
+
+    Args:
+        backend: "s3", "local" or "tiered" (default: STORAGE_BACKEND)
+
+    Returns:
+        S3Handler, LocalStorage or TieredStorage
+    """
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == "local":
+        from utils.local_storage import LocalStorage
+        return LocalStorage()
+    if backend == "s3":
+        from utils.s3_handler import S3Handler
+        return S3Handler()
+    if backend == "tiered":
+        from utils.s3_handler import S3Handler
+        from utils.tiered_storage import TieredStorage
+        return TieredStorage(S3Handler())
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(STORAGE_BACKENDS)})")
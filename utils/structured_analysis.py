@@ -0,0 +1,321 @@
+import json
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+SEVERITIES = ["leve", "moderado", "grave"]
+
+# Rendered when the structural impact was not assessed (structural_impact is None)
+STRUCTURAL_NOT_ASSESSED = "Impacto estrutural não avaliado (análise heurística local)."
+
+# Response schema sent to Gemini for structured per-image analyses
+ANALYSIS_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "vehicle": {
+            "type": "OBJECT",
+            "properties": {
+                "type": {"type": "STRING"},
+                "brand": {"type": "STRING"},
+                "model": {"type": "STRING"},
+                "color": {"type": "STRING"}
+            },
+            "required": ["type", "brand", "model", "color"]
+        },
+        "damages": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "part": {"type": "STRING"},
+                    "type": {"type": "STRING"},
+                    "severity": {"type": "STRING", "enum": SEVERITIES}
+                },
+                "required": ["part", "type", "severity"]
+            }
+        },
+        "structural_impact": {"type": "BOOLEAN"},
+        "structural_notes": {"type": "STRING"},
+        "confidence": {"type": "NUMBER"}
+    },
+    "required": ["vehicle", "damages", "structural_impact", "confidence"]
+}
+
+# Fields requested from the model, shared by the single and batch prompts
+STRUCTURED_ANALYSIS_FIELDS = """- vehicle: tipo, marca, modelo e cor do veículo ("desconhecido" se não for possível identificar)
+- damages: lista de danos, cada um com a peça (part), o tipo de dano (type: amassado, arranhão, quebrado, trincado...) e a severidade (leve, moderado ou grave)
+- structural_impact: true se houver indício de comprometimento estrutural
+- structural_notes: breve descrição do possível impacto estrutural
+- confidence: sua confiança na análise, de 0 a 1
+"""
+
+# Prompt for the structured analysis mode
+STRUCTURED_ANALYSIS_PROMPT = f"""Você é um especialista em vistoria veicular. Analise esta imagem de um veículo e responda em JSON com:
+{STRUCTURED_ANALYSIS_FIELDS}
+Use termos em português e baseie-se apenas no que você realmente vê na imagem.
+"""
+
+# Response schema for several images analyzed in one request
+BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "analyses": {
+            "type": "ARRAY",
+            "items": dict(
+                ANALYSIS_RESPONSE_SCHEMA,
+                properties=dict(ANALYSIS_RESPONSE_SCHEMA["properties"], image={"type": "INTEGER"}),
+                required=["image"] + ANALYSIS_RESPONSE_SCHEMA["required"]
+            )
+        }
+    },
+    "required": ["analyses"]
+}
+
+# Prompt for a batch request; each image is preceded by "Imagem <n>:"
+BATCH_ANALYSIS_PROMPT = """Você é um especialista em vistoria veicular. A seguir estão {count} imagens de veículos, cada uma precedida por "Imagem <n>:".
+Analise cada imagem separadamente e responda em JSON com a lista analyses, com um item por imagem contendo:
+- image: o número da imagem
+""" + STRUCTURED_ANALYSIS_FIELDS + """
+Use termos em português e baseie-se apenas no que você realmente vê em cada imagem.
+"""
+
+
+def normalize_severity(value):
+    """Map a severity string to leve/moderado/grave.
+
+    Args:
+        value: Severity as returned by a model or parsed from text
+
+    Returns:
+        str: Normalized severity
+    """
+    value = (value or "").strip().lower()
+    if value.startswith("grav"):
+        return "grave"
+    if value.startswith("moder"):
+        return "moderado"
+    return "leve"
+
+
+@dataclass
+class Damage:
+    """A damaged part seen in an image."""
+
+    part: str
+    type: str
+    severity: str = "leve"
+
+
+@dataclass
+class VehicleAnalysis:
+    """Structured result of a per-image analysis."""
+
+    vehicle_type: str = "desconhecido"
+    brand: str = "desconhecido"
+    model: str = "desconhecido"
+    color: str = "desconhecido"
+    damages: list = field(default_factory=list)
+    # None when the analysis could not assess the structure
+    structural_impact: Optional[bool] = False
+    structural_notes: str = ""
+    confidence: float = 0.0
+
+    @property
+    def overall_severity(self):
+        """Highest severity among the damages ("leve" if there are none)."""
+        if not self.damages:
+            return "leve"
+        return max((d.severity for d in self.damages), key=SEVERITIES.index)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an analysis from the model's JSON response.
+
+        Args:
+            data: Dictionary following ANALYSIS_RESPONSE_SCHEMA
+
+        Returns:
+            VehicleAnalysis: Parsed analysis
+        """
+        vehicle = data.get("vehicle") or {}
+        return cls(
+            vehicle_type=vehicle.get("type") or "desconhecido",
+            brand=vehicle.get("brand") or "desconhecido",
+            model=vehicle.get("model") or "desconhecido",
+            color=vehicle.get("color") or "desconhecido",
+            damages=[
+                Damage(part=d.get("part", "").strip(), type=d.get("type", "").strip(),
+                       severity=normalize_severity(d.get("severity")))
+                for d in data.get("damages") or [] if d.get("part")
+            ],
+            structural_impact=bool(data.get("structural_impact")),
+            structural_notes=data.get("structural_notes") or "",
+            confidence=float(data.get("confidence") or 0.0)
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        """Build an analysis from a JSON string."""
+        return cls.from_dict(json.loads(text))
+
+    @classmethod
+    def from_markdown(cls, text):
+        """Parse a markdown analysis in the format of the local analyzers.
+
+        Only the sections produced by to_markdown and the local analyzers
+        are recognized; free-form model prose yields an empty analysis.
+
+        Args:
+            text: Markdown analysis
+
+        Returns:
+            VehicleAnalysis: Parsed analysis
+        """
+        analysis = cls()
+        overall = None
+        section = None
+        for line in text.split("\n"):
+            stripped = line.strip()
+            if stripped.startswith("##"):
+                section = stripped.lstrip("#").strip().lower()
+                continue
+            if "Tipo:" in stripped:
+                analysis.vehicle_type = stripped.split("Tipo:")[1].strip()
+            elif "Marca:" in stripped:
+                analysis.brand = stripped.split("Marca:")[1].strip()
+            elif "Modelo:" in stripped:
+                analysis.model = stripped.split("Modelo:")[1].strip()
+            elif "Cor:" in stripped:
+                analysis.color = stripped.split("Cor:")[1].strip()
+            elif section == "danos identificados" and stripped.startswith("-") and ":" in stripped:
+                part, damage = stripped.lstrip("- ").split(":", 1)
+                damage = damage.strip()
+                severity = None
+                if "(" in damage and damage.endswith(")"):
+                    damage, severity = damage[:-1].split("(", 1)
+                    damage = damage.strip()
+                analysis.damages.append(Damage(part=part.strip(), type=damage,
+                                               severity=normalize_severity(severity) if severity else None))
+            elif stripped.startswith("Confiança da análise:"):
+                try:
+                    analysis.confidence = float(stripped.split(":")[1].strip().rstrip("%")) / 100
+                except ValueError:
+                    pass
+            elif "severidade geral" in stripped.lower():
+                for severity in SEVERITIES:
+                    if severity.upper() in stripped:
+                        overall = severity
+                        break
+            elif section == "impacto estrutural" and stripped:
+                lowered = stripped.lower()
+                if lowered == STRUCTURAL_NOT_ASSESSED.lower():
+                    analysis.structural_impact = None
+                    continue
+                analysis.structural_notes = stripped
+                if analysis.structural_impact is not None:
+                    analysis.structural_impact = ("comprometimento estrutural" in lowered
+                                                  and not lowered.startswith("não"))
+
+        # Damages without their own severity get the overall one
+        for damage in analysis.damages:
+            if damage.severity is None:
+                damage.severity = overall or "leve"
+        return analysis
+
+    @classmethod
+    def parse_markdown(cls, text):
+        """Parse a markdown analysis, or return None if it is not in the known format.
+
+        An analysis without the "Danos Identificados" section (e.g. free-form
+        model prose, or an error message) says nothing about the damages, so
+        it must not be read as a vehicle without damages.
+
+        Args:
+            text: Markdown analysis
+
+        Returns:
+            VehicleAnalysis: Parsed analysis, or None
+        """
+        if not any(line.strip().lstrip("#").strip().lower() == "danos identificados"
+                   for line in (text or "").split("\n") if line.strip().startswith("##")):
+            return None
+        return cls.from_markdown(text)
+
+    def to_dict(self):
+        """Return the analysis as a JSON-serializable dictionary."""
+        return asdict(self)
+
+    def to_json(self):
+        """Return the analysis as a compact JSON string."""
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_stored_json(cls, text):
+        """Load an analysis saved with to_json."""
+        data = json.loads(text)
+        data["damages"] = [Damage(**d) for d in data.get("damages", [])]
+        return cls(**data)
+
+    def to_markdown(self):
+        """Render the analysis for display, in the local analyzers' format.
+
+        Returns:
+            str: Markdown analysis
+        """
+        analysis = "# Análise de Veículo\n\n"
+        analysis += "## Identificação do Veículo\n"
+        analysis += f"- Tipo: {self.vehicle_type}\n"
+        analysis += f"- Marca: {self.brand}\n"
+        analysis += f"- Modelo: {self.model}\n"
+        analysis += f"- Cor: {self.color}\n\n"
+
+        analysis += "## Danos Identificados\n"
+        if self.damages:
+            for damage in self.damages:
+                analysis += f"- {damage.part.capitalize()}: {damage.type} ({damage.severity})\n"
+        else:
+            analysis += "Nenhum dano visível identificado.\n"
+
+        analysis += "\n## Severidade dos Danos\n"
+        analysis += f"A severidade geral dos danos é classificada como {self.overall_severity.upper()}.\n\n"
+
+        analysis += "## Impacto Estrutural\n"
+        if self.structural_impact is None:
+            analysis += f"{STRUCTURAL_NOT_ASSESSED}\n{self.structural_notes}\n\n"
+        elif self.structural_impact:
+            analysis += f"Há indícios de comprometimento estrutural. {self.structural_notes}\n\n"
+        else:
+            analysis += f"Não foram identificados danos estruturais significativos. {self.structural_notes}\n\n"
+
+        analysis += "## Peças Afetadas\n"
+        for damage in self.damages:
+            analysis += f"- {damage.part.capitalize()}\n"
+
+        analysis += f"\nConfiança da análise: {self.confidence:.0%}\n"
+        return analysis
+
+
+def parse_batch_response(text, count):
+    """Split a batch response into per-image analyses.
+
+    Args:
+        text: JSON response following BATCH_RESPONSE_SCHEMA
+        count: Number of images sent in the request
+
+    Returns:
+        list: VehicleAnalysis for each image, None where the response has no
+            valid item for it
+    """
+    analyses = [None] * count
+    try:
+        items = json.loads(text).get("analyses") or []
+    except (ValueError, AttributeError):
+        return analyses
+
+    for item in items:
+        try:
+            index = int(item["image"]) - 1
+            if 0 <= index < count and analyses[index] is None:
+                analyses[index] = VehicleAnalysis.from_dict(item)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return analyses
@@ -0,0 +1,479 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.local_storage import LocalStorage
+from utils.s3_handler import MULTIPART_THRESHOLD, UPLOAD_WORKERS
+from utils.metrics import timed, Counter
+
+# Maximum total size of the local cache tier
+CACHE_MAX_BYTES = int(float(os.getenv("STORAGE_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+# Cached objects are served without contacting S3 for this long after
+# they were written or validated; after that, they are revalidated by ETag
+REVALIDATE_SECONDS = float(os.getenv("STORAGE_CACHE_REVALIDATE_SECONDS", "300"))
+
+# "through": uploads return once the object is in S3 and in the cache;
+# "back": uploads return once the object is in the cache, S3 follows in the background
+WRITE_MODE = os.getenv("STORAGE_WRITE_MODE", "through")
+WRITE_MODES = ("through", "back")
+
+# Metadata (key, size, ETag, state) of a cached object is stored next to it
+META_SUFFIX = ".meta"
+
+CACHE_TOTAL = Counter(
+    "vistocarro_storage_cache_total",
+    "Reads of the local storage cache tier by outcome.",
+    ["outcome"]
+)
+
+
+def _inspection_id(object_key):
+    """Inspection of an object key (uploads/{id}/... or reports/{id}/...), or None."""
+    parts = object_key.split("/")
+    return parts[1] if len(parts) > 2 else None
+
+
+class TieredStorage:
+    """S3 storage with a size-bounded local disk cache in front of it.
+
+    Reads are served from the cache (a LocalStorage) when possible: recently
+    validated objects without contacting S3, older ones after a conditional
+    GET by ETag, which costs no transfer if the object is unchanged. Uploads
+    are written to the cache first and sent to S3 from there, either before
+    returning (write-through) or in the background (write-back). The cache
+    is evicted least recently used first, except for objects of pinned
+    (in-progress) inspections and objects not yet in S3.
+
+    It has the interface of S3Handler, so it can replace it.
+    """
+
+    def __init__(self, remote, cache=None, max_bytes=None, write_mode=None, revalidate_seconds=None):
+        """Initialize the tiered storage.
+
+        Args:
+            remote: S3Handler
+            cache: LocalStorage for the cache tier (default: storage/s3_cache,
+                or STORAGE_CACHE_DIR)
+            max_bytes: Maximum total size of the cache in bytes
+            write_mode: "through" or "back" (default: STORAGE_WRITE_MODE)
+            revalidate_seconds: Age after which cached objects are revalidated
+        """
+        if cache is None:
+            default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       "storage", "s3_cache")
+            cache = LocalStorage(base_dir=os.getenv("STORAGE_CACHE_DIR", default_dir))
+        write_mode = write_mode or WRITE_MODE
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode: {write_mode} (expected one of {', '.join(WRITE_MODES)})")
+
+        self.remote = remote
+        self.cache = cache
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.write_mode = write_mode
+        self.revalidate_seconds = REVALIDATE_SECONDS if revalidate_seconds is None else revalidate_seconds
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        # Reentrant: upload callbacks may run in the thread that queued them
+        self._lock = threading.RLock()
+        self._index = None
+        self._total_bytes = 0
+        self._pins = {}
+        self._pending = {}
+
+        self.upload_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS,
+                                                  thread_name_prefix="tiered-upload")
+
+    def _entries(self):
+        """Return the index of cached objects (LRU order), loading it from disk on first use.
+
+        Must be called with the lock held. Objects left unsent by a previous
+        write-back process are queued for upload again.
+        """
+        if self._index is not None:
+            return self._index
+
+        entries = []
+        for root, _, files in os.walk(self.cache.base_dir):
+            for name in files:
+                if not name.endswith(META_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        entry = json.load(f)
+                    entries.append((os.path.getmtime(path), entry.pop("key"), entry))
+                except Exception as e:
+                    print(f"Error reading storage cache entry: {e}")
+
+        self._index = OrderedDict((key, entry) for _, key, entry in sorted(entries, key=lambda e: e[0]))
+        self._total_bytes = sum(entry["size"] for entry in self._index.values())
+        for key, entry in self._index.items():
+            if entry["dirty"]:
+                self._queue_upload(key)
+        return self._index
+
+    def _save_entry(self, key, entry):
+        """Persist the metadata of a cached object."""
+        self.cache.upload_file_object(json.dumps(dict(entry, key=key)), key + META_SUFFIX)
+
+    def _add_entry(self, key, etag, dirty):
+        """Index an object just written to the cache and evict if over size.
+
+        Args:
+            key: Object key
+            etag: ETag of the object in S3, or None to compute it
+            dirty: Whether the object still has to be uploaded to S3
+
+        Returns:
+            dict: The index entry
+        """
+        path = self.cache.object_path(key)
+        size = os.path.getsize(path)
+        if etag is None and size < MULTIPART_THRESHOLD:
+            # Single-part uploads get the MD5 of the content as ETag
+            etag = '"' + hashlib.md5(b"".join(self.cache.iter_file(key))).hexdigest() + '"'
+
+        entry = {"size": size, "etag": etag, "validated": time.time(), "dirty": dirty}
+        with self._lock:
+            index = self._entries()
+            previous = index.pop(key, None)
+            index[key] = entry
+            self._total_bytes += size - (previous["size"] if previous else 0)
+            self._save_entry(key, entry)
+            self._evict()
+        return entry
+
+    def _update_entry(self, key, **changes):
+        """Update and persist the metadata of a cached object, if still cached."""
+        with self._lock:
+            entry = self._entries().get(key)
+            if entry is not None:
+                entry.update(changes)
+                self._save_entry(key, entry)
+
+    def _remove_entry(self, key):
+        """Drop an object from the cache. Must be called with the lock held."""
+        entry = self._entries().pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry["size"]
+        self.cache.delete_file(key)
+        self.cache.delete_file(key + META_SUFFIX)
+
+    def _evict(self):
+        """Remove least recently used objects until the cache is under max_bytes.
+
+        Objects of pinned inspections and objects not yet in S3 are kept.
+        Must be called with the lock held.
+        """
+        index = self._entries()
+        for key in list(index):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if index[key]["dirty"] or _inspection_id(key) in self._pins:
+                continue
+            self._remove_entry(key)
+            self.evictions += 1
+
+    def pin(self, inspection_id):
+        """Keep the objects of an inspection in the cache until it is unpinned.
+
+        Pins are counted, so nested pin/unpin pairs are safe.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+        """
+        with self._lock:
+            self._pins[inspection_id] = self._pins.get(inspection_id, 0) + 1
+
+    def unpin(self, inspection_id):
+        """Release a pin taken with pin(), evicting if the cache is over size.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+        """
+        with self._lock:
+            count = self._pins.get(inspection_id, 0) - 1
+            if count > 0:
+                self._pins[inspection_id] = count
+            else:
+                self._pins.pop(inspection_id, None)
+                self._evict()
+
+    def _queue_upload(self, key):
+        """Upload a cached object to S3 in the background.
+
+        Returns:
+            Future: Resolves to True if upload was successful, False otherwise
+        """
+        future = self.remote.upload_file_async(self.cache.object_path(key), key)
+        self._pending[key] = future
+        future.add_done_callback(lambda f: self._uploaded(key, f))
+        return future
+
+    def _uploaded(self, key, future):
+        """Mark a cached object as stored in S3 once its upload has succeeded."""
+        if self._pending.get(key) is future:
+            del self._pending[key]
+        try:
+            ok = future.result()
+        except Exception as e:
+            print(f"Error uploading cached object to S3: {e}")
+            ok = False
+        if ok:
+            self._update_entry(key, dirty=False, validated=time.time())
+        elif self.write_mode == "back":
+            print(f"Upload of {key} to S3 failed; it stays in the local cache until flush()")
+
+    def _store(self, key, write_local, upload_remote):
+        """Write an object to the cache, then to S3 according to the write mode.
+
+        Args:
+            key: Object key
+            write_local: Function writing the object to the cache, returning bool
+            upload_remote: Function uploading the object straight to S3, used
+                if the cache cannot be written
+
+        Returns:
+            bool: True if the object was stored (in S3, for write-through)
+        """
+        if not write_local():
+            return upload_remote()
+        self._add_entry(key, None, dirty=True)
+
+        if self.write_mode == "back":
+            self._queue_upload(key)
+            return True
+
+        # The entry stays dirty, so it is not evicted, until the upload is done
+        future = self._queue_upload(key)
+        if future.result():
+            # The done callback may not have run yet
+            self._update_entry(key, dirty=False, validated=time.time())
+            return True
+        with self._lock:
+            self._remove_entry(key)
+        return False
+
+    def upload_file_object(self, file_content, object_key):
+        """Store a file object in the cache and in S3.
+
+        Args:
+            file_content: The content of the file (bytes, str, a binary
+                file-like object or an iterator of chunks)
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            bool: True if the object was stored, False otherwise
+        """
+        return self._store(object_key,
+                           lambda: self.cache.upload_file_object(file_content, object_key),
+                           lambda: self.remote.upload_file_object(file_content, object_key))
+
+    def upload_file_object_async(self, file_content, object_key):
+        """Queue a file object to be stored in the background.
+
+        Args:
+            file_content: The content of the file to store
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            Future: Resolves to True if the object was stored, False otherwise
+        """
+        return self.upload_executor.submit(self.upload_file_object, file_content, object_key)
+
+    def upload_file(self, file_path, object_key):
+        """Store a file on disk in the cache and in S3.
+
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            bool: True if the object was stored, False otherwise
+        """
+        return self._store(object_key,
+                           lambda: self.cache.upload_file(file_path, object_key),
+                           lambda: self.remote.upload_file_async(file_path, object_key).result())
+
+    def upload_file_async(self, file_path, object_key):
+        """Queue a file on disk to be stored in the background.
+
+        Args:
+            file_path: Path of the local file
+            object_key: The key (path) where the file will be stored
+
+        Returns:
+            Future: Resolves to True if the object was stored, False otherwise
+        """
+        return self.upload_executor.submit(self.upload_file, file_path, object_key)
+
+    def flush(self, timeout=None):
+        """Wait for background uploads and retry the ones that failed.
+
+        Args:
+            timeout: Maximum time in seconds to wait for each upload
+
+        Returns:
+            bool: True if every cached object is stored in S3
+        """
+        # Done callbacks may not have run yet when result() returns, so successful
+        # uploads are marked here too
+        for key, future in list(self._pending.items()):
+            if future.result(timeout=timeout):
+                self._update_entry(key, dirty=False, validated=time.time())
+
+        with self._lock:
+            failed = [key for key, entry in self._entries().items() if entry["dirty"]]
+        for key in failed:
+            if self._queue_upload(key).result(timeout=timeout):
+                self._update_entry(key, dirty=False, validated=time.time())
+
+        with self._lock:
+            return not any(entry["dirty"] for entry in self._entries().values())
+
+    def download_file(self, object_key):
+        """Read a file, from the cache when it is valid.
+
+        Args:
+            object_key: The key (path) of the object
+
+        Returns:
+            bytes: The content of the file
+        """
+        with timed("storage_cache") as timing:
+            with self._lock:
+                entry = self._entries().get(object_key)
+                if entry is not None:
+                    entry = dict(entry)
+                    self._index.move_to_end(object_key)
+
+            if entry is not None:
+                fresh = entry["dirty"] or time.time() - entry["validated"] < self.revalidate_seconds
+                if fresh:
+                    content, etag = None, entry["etag"]
+                else:
+                    content, etag = self.remote.download_file_if_changed(object_key, entry["etag"])
+
+                if content is None:
+                    cached = self.cache.download_file(object_key)
+                    if cached is not None:
+                        if fresh:
+                            outcome = "hit"
+                        elif etag is not None:
+                            outcome = "revalidated"
+                            self._update_entry(object_key, validated=time.time())
+                        else:
+                            # S3 unavailable: serve the cached copy
+                            outcome = "stale"
+                        self._record(outcome)
+                        timing["outcome"] = outcome
+                        self._touch(object_key)
+                        return cached
+                    content, etag = self.remote.download_file_if_changed(object_key)
+            else:
+                content, etag = self.remote.download_file_if_changed(object_key)
+
+            self._record("miss")
+            timing["outcome"] = "miss"
+            if content is not None and self.cache.upload_file_object(content, object_key):
+                self._add_entry(object_key, etag, dirty=False)
+            return content
+
+    def _touch(self, key):
+        """Refresh the access time of a cached object, so LRU order survives restarts."""
+        try:
+            os.utime(self.cache.object_path(key + META_SUFFIX), None)
+        except OSError:
+            pass
+
+    def _record(self, outcome):
+        """Count a cache read by outcome."""
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "revalidated":
+                self.revalidated += 1
+            elif outcome == "stale":
+                self.stale += 1
+            else:
+                self.misses += 1
+        CACHE_TOTAL.inc(outcome=outcome)
+
+    def _wait_uploaded(self, object_key, timeout=None):
+        """Wait for a pending background upload of an object, if any."""
+        future = self._pending.get(object_key)
+        if future is None:
+            return True
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            print(f"Error waiting for S3 upload: {e}")
+            return False
+
+    def get_presigned_url_when_uploaded(self, upload_future, object_key, expiration=3600, timeout=None):
+        """Wait for a background upload and generate its presigned URL.
+
+        With write-back, this also waits for the object to reach S3.
+
+        Args:
+            upload_future: Future returned by upload_file_object_async
+            object_key: The key (path) of the object
+            expiration: URL expiration time in seconds (default: 1 hour)
+            timeout: Maximum time in seconds to wait for the upload
+
+        Returns:
+            str: Presigned URL for the object, None if the upload failed
+        """
+        try:
+            if not upload_future.result(timeout=timeout):
+                return None
+        except Exception as e:
+            print(f"Error waiting for upload: {e}")
+            return None
+        if not self._wait_uploaded(object_key, timeout):
+            return None
+        return self.remote.get_presigned_url(object_key, expiration)
+
+    def get_presigned_url(self, object_key, expiration=3600):
+        """Generate a presigned URL for an object, once it is in S3.
+
+        Args:
+            object_key: The key (path) of the object
+            expiration: URL expiration time in seconds (default: 1 hour)
+
+        Returns:
+            str: Presigned URL for the object
+        """
+        self._wait_uploaded(object_key)
+        return self.remote.get_presigned_url(object_key, expiration)
+
+    def stats(self):
+        """Return cache counters.
+
+        Returns:
+            dict: hits, revalidated, misses, stale, evictions, hit_rate,
+                size_bytes, entries, pinned inspections and pending uploads
+        """
+        with self._lock:
+            index = self._entries()
+            reads = self.hits + self.revalidated + self.misses + self.stale
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.revalidated + self.stale) / reads if reads else 0.0,
+                "size_bytes": self._total_bytes,
+                "entries": len(index),
+                "pinned": len(self._pins),
+                "pending_uploads": len(self._pending)
+            }
@@ -0,0 +1,378 @@
+import os
+import json
+import zlib
+import fcntl
+import shutil
+import threading
+import numpy as np
+from utils.answer_cache import normalize_question
+
+# Dimension of the hashed text vectors
+VECTOR_INDEX_DIM = int(os.getenv("VECTOR_INDEX_DIM", "1024"))
+
+# Chunk size and overlap (characters) used when splitting analyses
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+
+# Compact the files when this fraction of the rows has been removed
+COMPACT_RATIO = 0.5
+
+# Files of a generation of the index
+INDEX_FILES = ("vectors.f32", "chunks.jsonl", "removed.jsonl")
+
+
+def embed_texts(texts, dim=VECTOR_INDEX_DIM):
+    """Embed texts with feature hashing of words and word pairs.
+
+    Words are accent/case folded without stop words (see
+    normalize_question). Counts are log-scaled and each vector is
+    L2-normalized, so a dot product is the cosine similarity.
+
+    Args:
+        texts: List of strings
+        dim: Vector dimension
+
+    Returns:
+        numpy.ndarray: float32 array of shape (len(texts), dim)
+    """
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = normalize_question(text).split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in features), dtype=np.uint32, count=len(features))
+        # The hash's top bit gives the sign, so collisions cancel out on average
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vectors[row], hashes % dim, signs)
+
+    vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def split_sections(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split an analysis into chunks along its markdown sections.
+
+    Sections longer than chunk_size are cut into overlapping windows.
+
+    Args:
+        text: Analysis text
+        chunk_size: Maximum chunk length in characters
+        overlap: Characters shared by consecutive windows of a section
+
+    Returns:
+        list: Non-empty chunks
+    """
+    sections, current = [], []
+    for line in text.split("\n"):
+        if line.startswith("#") and current:
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    sections.append("\n".join(current))
+
+    chunks = []
+    for section in sections:
+        section = section.strip()
+        start = 0
+        while start < len(section):
+            chunks.append(section[start:start + chunk_size])
+            if start + chunk_size >= len(section):
+                break
+            start += chunk_size - overlap
+    return chunks
+
+
+class VectorIndex:
+    """Persistent vector index of inspection analyses.
+
+    Vectors are appended to a raw float32 file that is memory-mapped for
+    search; chunk texts go to a JSON-lines file with one line per row.
+    Removing an inspection only records its rows as removed, and the files
+    are compacted once enough rows are dead. Writes take a file lock, and
+    readers pick up rows written by other processes, so one index on disk
+    can be shared by every session and worker.
+
+    A compaction writes a new generation directory (gen-000001, ...) with
+    its own, empty list of removed rows, and switches to it by atomically
+    replacing the CURRENT file, so a crash leaves either the old or the new
+    generation in use, never a mix of the two. Without a CURRENT file the
+    files in index_dir itself are used.
+    """
+
+    def __init__(self, index_dir=None, dim=VECTOR_INDEX_DIM):
+        """Initialize the index.
+
+        Args:
+            index_dir: Directory of the index files (default: storage/index)
+            dim: Vector dimension
+        """
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage", "index")
+        self.index_dir = index_dir or os.getenv("VECTOR_INDEX_DIR", default_dir)
+        self.dim = dim
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        self.current_path = os.path.join(self.index_dir, "CURRENT")
+        self.lock_path = os.path.join(self.index_dir, "index.lock")
+
+        self._lock = threading.Lock()
+        self._reset()
+        self._use_generation(self._current_generation())
+
+    def _file_lock(self, exclusive=True):
+        """Open and lock the index lock file (closing it unlocks).
+
+        Writers take an exclusive lock; readers a shared one, so they never
+        see a compaction half done.
+        """
+        f = open(self.lock_path, 'a')
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return f
+
+    def _current_generation(self):
+        """Name of the generation in use ("" for the files in index_dir itself)."""
+        try:
+            with open(self.current_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def _use_generation(self, generation):
+        """Point the file paths at a generation."""
+        directory = os.path.join(self.index_dir, generation) if generation else self.index_dir
+        self._generation = generation
+        self.vectors_path, self.chunks_path, self.removed_path = (os.path.join(directory, name)
+                                                                  for name in INDEX_FILES)
+
+    def _reset(self):
+        """Forget the loaded state, so the next load reads the files from the start."""
+        self._generation = None
+        self._chunks_bytes = 0
+        self._removed_bytes = 0
+        self._chunks = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    @staticmethod
+    def _read_lines(path, offset):
+        """Read the complete lines of a file from a byte offset.
+
+        Returns:
+            list: (parsed JSON line, byte offset after the line) pairs
+        """
+        lines = []
+        if not os.path.exists(path):
+            return lines
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partial line of a write in progress
+                    break
+                offset += len(line)
+                lines.append((json.loads(line), offset))
+        return lines
+
+    def _load(self):
+        """Bring the loaded state up to date with the index files.
+
+        The files of a generation are append-only, so only the new lines
+        are read; a compaction (new generation) triggers a full reload.
+        """
+        generation = self._current_generation()
+        if generation != self._generation:
+            self._reset()
+            self._use_generation(generation)
+
+        # New chunks, up to the rows whose vectors are fully written
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 4) if os.path.exists(self.vectors_path) else 0
+        lines = self._read_lines(self.chunks_path, self._chunks_bytes)[:max(0, rows - len(self._chunks))]
+        if lines:
+            for row, (chunk, _) in enumerate(lines, len(self._chunks)):
+                self._rows.setdefault(chunk["inspection_id"], []).append(row)
+            self._chunks.extend(chunk for chunk, _ in lines)
+            self._chunks_bytes = lines[-1][1]
+            self._alive = np.concatenate([self._alive, np.ones(len(lines), dtype=bool)])
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                      shape=(len(self._chunks), self.dim))
+
+        # New removals
+        for (start, end), self._removed_bytes in self._read_lines(self.removed_path, self._removed_bytes):
+            self._alive[start:end] = False
+            if start < len(self._chunks):
+                inspection_id = self._chunks[start]["inspection_id"]
+                rows = [row for row in self._rows.get(inspection_id, []) if not start <= row < end]
+                if rows:
+                    self._rows[inspection_id] = rows
+                else:
+                    self._rows.pop(inspection_id, None)
+
+    def _remove_rows(self, inspection_id):
+        """Append the rows of an inspection to the removed file (lock held)."""
+        rows = self._rows.get(inspection_id)
+        if not rows:
+            return False
+        with open(self.removed_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([rows[0], rows[-1] + 1]) + "\n")
+        return True
+
+    def add(self, inspection_id, chunks):
+        """Index the chunks of an inspection, replacing any previous version.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            chunks: List of text chunks (see split_sections)
+
+        Returns:
+            int: Number of rows added
+        """
+        vectors = embed_texts(chunks, self.dim)
+        with self._lock, self._file_lock():
+            self._load()
+            self._remove_rows(inspection_id)
+
+            # Drop the tail of an interrupted write, so rows and lines stay aligned
+            for path, size in ((self.vectors_path, len(self._chunks) * self.dim * 4),
+                               (self.chunks_path, self._chunks_bytes)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    os.truncate(path, size)
+
+            # Vectors first: rows only count once their chunk line exists
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.chunks_path, 'a', encoding='utf-8') as f:
+                for text in chunks:
+                    f.write(json.dumps({"inspection_id": inspection_id, "text": text}, ensure_ascii=False) + "\n")
+
+            self._load()
+            self._maybe_compact()
+        return len(chunks)
+
+    def add_analysis(self, inspection_id, analysis_text):
+        """Split an analysis into sections and index it.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+            analysis_text: Analysis text
+
+        Returns:
+            int: Number of rows added
+        """
+        return self.add(inspection_id, split_sections(analysis_text))
+
+    def remove(self, inspection_id):
+        """Remove an inspection from the index.
+
+        Args:
+            inspection_id: Unique ID for the inspection
+
+        Returns:
+            bool: True if the inspection was indexed
+        """
+        with self._lock, self._file_lock():
+            self._load()
+            removed = self._remove_rows(inspection_id)
+            self._load()
+            self._maybe_compact()
+        return removed
+
+    def _maybe_compact(self):
+        """Rewrite the files without removed rows once enough are dead (lock held)."""
+        dead = int((~self._alive).sum())
+        if not dead or dead < len(self._alive) * COMPACT_RATIO:
+            return
+
+        keep = np.flatnonzero(self._alive)
+        vectors = np.array(self._vectors[keep])
+        chunks = [self._chunks[row] for row in keep]
+
+        old_generation = self._generation
+        number = int(old_generation.rpartition("-")[2]) + 1 if old_generation else 1
+        generation = f"gen-{number:06d}"
+        directory = os.path.join(self.index_dir, generation)
+        # Left over by a compaction interrupted before the switch
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+        vectors_path, chunks_path, _ = (os.path.join(directory, name) for name in INDEX_FILES)
+        for path, data in ((vectors_path, vectors.tobytes()),
+                           (chunks_path, "".join(json.dumps(c, ensure_ascii=False) + "\n"
+                                                 for c in chunks).encode('utf-8')),
+                           (f"{self.current_path}.tmp", generation.encode('utf-8'))):
+            with open(path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        # The switch: one atomic rename
+        os.replace(f"{self.current_path}.tmp", self.current_path)
+        self._remove_old_generations(generation)
+        self._load()
+
+    def _remove_old_generations(self, generation):
+        """Delete the files of every generation but the current one (lock held)."""
+        for name in os.listdir(self.index_dir):
+            if name.startswith("gen-") and name != generation:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+        for name in INDEX_FILES:
+            try:
+                os.remove(os.path.join(self.index_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def search(self, query, k=5, inspection_id=None):
+        """Find the chunks most similar to a query.
+
+        Args:
+            query: Query text
+            k: Maximum number of results
+            inspection_id: Only search this inspection (default: all)
+
+        Returns:
+            list: Dictionaries with score, inspection_id and text, best first
+        """
+        query_vector = embed_texts([query], self.dim)[0]
+        with self._lock, self._file_lock(exclusive=False):
+            self._load()
+            if inspection_id is not None:
+                rows = np.array(self._rows.get(inspection_id, []), dtype=np.int64)
+                scores = self._vectors[rows] @ query_vector if len(rows) else np.zeros(0, dtype=np.float32)
+            else:
+                rows = np.flatnonzero(self._alive)
+                scores = (self._vectors @ query_vector)[rows] if len(rows) else np.zeros(0, dtype=np.float32)
+
+            if not len(rows):
+                return []
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [{"score": float(scores[i]), **self._chunks[rows[i]]} for i in top if scores[i] > 0]
+
+    def inspection_ids(self):
+        """Return the IDs of the indexed inspections."""
+        with self._lock, self._file_lock(exclusive=False):
+            self._load()
+            return list(self._rows)
+
+
+_shared_indexes = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_index(index_dir=None):
+    """Return the process-wide VectorIndex for a directory.
+
+    Args:
+        index_dir: Directory of the index files (default: storage/index)
+
+    Returns:
+        VectorIndex: Shared index
+    """
+    with _shared_lock:
+        index = _shared_indexes.get(index_dir)
+        if index is None:
+            index = VectorIndex(index_dir)
+            _shared_indexes[index_dir] = index
+        return index